@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+SunoLegal Backend Benchmarks
+
+Usage:
+    python benchmark.py event-loop [--duration 10] [--pdf-concurrency 16]
+    python benchmark.py render [--iterations 50]
+    python benchmark.py pdf [--baseline benchmarks/pdf_baseline.json] [--save-baseline]
+    python benchmark.py chat [--duration 30] [--concurrency 50] [--repeat-ratio 0.2]
+
+event-loop: measures /api/health latency (p50/p95/p99) while idle and while
+the server is under heavy PDF generation load. With rendering off the event
+loop, p99 under load should stay close to the idle baseline.
+
+render: in-process per-document render cost for every template, with Latin
+text and with each Indic script (fonts from fetch_fonts.py or PDF_FONT_DIR).
+No server needed.
+
+pdf: regression suite. Renders every template with small, typical and
+pathological inputs (e.g. 500 affidavit statements), in-process and through
+the render pool, recording throughput, p50/p99 latency and peak memory.
+Each case gets an untimed warm-up render; p50 is the median over every
+timed render of every round and throughput the median over rounds.
+Exits non-zero when p50, pooled throughput or peak memory regress beyond
+--tolerance against the stored baseline (timings rescaled by a calibration
+loop, so a baseline from a faster or slower machine stays usable).
+
+chat: load test of /api/chat/nyayai/stream. Start the server with
+LLM_BACKEND=mock (see LLM_MOCK_* for latency, token rate and error
+injection) to run it offline without spending tokens. Reports time to first
+token, full-response latency, throughput and fallback/error counts.
+--repeat-ratio sends that share of requests as one common question, which
+exercises the FAQ cache and single-flight.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+
+import httpx
+
+BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:8001').rstrip('/')
+PDF_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'pdf_baseline.json')
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def print_latency(label, values):
+    print(f"  {label:<34} n={len(values):<6} "
+          f"p50={percentile(values, 0.50):7.2f}ms  "
+          f"p95={percentile(values, 0.95):7.2f}ms  "
+          f"p99={percentile(values, 0.99):7.2f}ms")
+
+
+# ============= EVENT LOOP LATENCY UNDER PDF LOAD =============
+
+async def probe_health(client, stop_at, interval, latencies):
+    """Hit the health endpoint until stop_at, recording latency in ms"""
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        response = await client.get('/api/health')
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def generate_pdfs(client, stop_at, counters):
+    """Generate documents back-to-back until stop_at"""
+    while time.perf_counter() < stop_at:
+        # Fresh mock user per request so the per-user rate limit doesn't apply
+        headers = {'Authorization': f'Bearer mock_bench_{uuid.uuid4().hex[:12]}'}
+        response = await client.post('/api/documents/generate', headers=headers, json={
+            'document_type': 'consumer_complaint',
+            'data': {'complainant_name': 'Benchmark User', 'facts': ['Fact'] * 40},
+        })
+        if response.status_code == 200:
+            counters['ok'] += 1
+        else:
+            counters['failed'] += 1
+
+
+async def run_event_loop_benchmark(args):
+    timeout = httpx.Timeout(60.0)
+    limits = httpx.Limits(max_connections=args.pdf_concurrency + 4)
+    async with httpx.AsyncClient(base_url=BACKEND_URL, timeout=timeout, limits=limits) as client:
+        print(f"Benchmarking {BACKEND_URL} ({args.duration}s per phase)")
+
+        idle = []
+        await probe_health(client, time.perf_counter() + args.duration, args.interval, idle)
+
+        loaded = []
+        counters = {'ok': 0, 'failed': 0}
+        stop_at = time.perf_counter() + args.duration
+        await asyncio.gather(
+            probe_health(client, stop_at, args.interval, loaded),
+            *[generate_pdfs(client, stop_at, counters) for _ in range(args.pdf_concurrency)],
+        )
+
+    print("\n/api/health latency")
+    print_latency("idle", idle)
+    print_latency(f"{args.pdf_concurrency} PDF writers", loaded)
+    print(f"\nPDFs generated: {counters['ok']} ok, {counters['failed']} failed "
+          f"({counters['ok'] / args.duration:.1f}/s)")
+
+    ratio = percentile(loaded, 0.99) / percentile(idle, 0.99)
+    print(f"p99 under load / idle p99: {ratio:.2f}x")
+    if args.max_p99_ratio and ratio > args.max_p99_ratio:
+        print(f"FAIL: p99 ratio above {args.max_p99_ratio}x")
+        return 1
+    return 0
+
+
+# ============= CHAT LOAD TEST =============
+
+async def chat_user(client, stop_at, args, results):
+    """Send streaming chat messages back-to-back until stop_at"""
+    while time.perf_counter() < stop_at:
+        # Fresh mock user per request so the per-user rate limit doesn't apply
+        headers = {'Authorization': f'Bearer mock_bench_{uuid.uuid4().hex[:12]}'}
+        if random.random() < args.repeat_ratio:
+            question = "How do I file an RTI application?"
+        else:
+            question = f"Question {uuid.uuid4().hex[:8]}: my landlord is keeping my deposit, what can I do?"
+
+        started = time.perf_counter()
+        first_token = None
+        status = 'ok'
+        try:
+            async with client.stream('POST', '/api/chat/nyayai/stream', headers=headers,
+                                     json={'message': question}) as response:
+                if response.status_code != 200:
+                    status = f'http_{response.status_code}'
+                    await response.aread()
+                else:
+                    event = None
+                    async for line in response.aiter_lines():
+                        if line.startswith('event: '):
+                            event = line[len('event: '):]
+                        elif line.startswith('data: ') and event == 'token' and first_token is None:
+                            first_token = time.perf_counter()
+                        elif line.startswith('data: ') and event == 'done' and 'error' in json.loads(line[6:]):
+                            status = 'fallback'
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+
+        results['status'][status] = results['status'].get(status, 0) + 1
+        if status == 'ok':
+            results['ttft'].append((first_token - started) * 1000)
+            results['total'].append((time.perf_counter() - started) * 1000)
+
+
+async def run_chat_benchmark(args):
+    timeout = httpx.Timeout(120.0)
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    results = {'ttft': [], 'total': [], 'status': {}}
+    async with httpx.AsyncClient(base_url=BACKEND_URL, timeout=timeout, limits=limits) as client:
+        health = (await client.get('/api/health')).json()
+        print(f"Benchmarking {BACKEND_URL} chat ({args.concurrency} concurrent users, {args.duration}s, "
+              f"llm={health.get('features', {}).get('llm')})")
+        stop_at = time.perf_counter() + args.duration
+        await asyncio.gather(*[chat_user(client, stop_at, args, results) for _ in range(args.concurrency)])
+
+    print("\n/api/chat/nyayai/stream")
+    print_latency("time to first token", results['ttft'])
+    print_latency("full response", results['total'])
+    print(f"\nResponses: {results['status']} ({len(results['total']) / args.duration:.1f} ok/s)")
+    return 0
+
+
+# ============= IN-PROCESS RENDER COST =============
+
+# script -> (name, address, sentence) used to fill every template
+SAMPLE_TEXT = {
+    'latin': ('Ramesh Kumar', '12, MG Road, Bengaluru',
+              'The product stopped working within a week of purchase.'),
+    'devanagari': ('रमेश कुमार', '१२, एमजी रोड, बेंगलुरु',
+                   'खरीद के एक सप्ताह के भीतर उत्पाद ने काम करना बंद कर दिया।'),
+    'kannada': ('ರಮೇಶ್ ಕುಮಾರ್', '೧೨, ಎಂಜಿ ರಸ್ತೆ, ಬೆಂಗಳೂರು',
+                'ಖರೀದಿಸಿದ ಒಂದು ವಾರದಲ್ಲಿ ಉತ್ಪನ್ನ ಕೆಲಸ ನಿಲ್ಲಿಸಿತು.'),
+}
+
+
+def sample_document(doc_type, script):
+    """Realistic user fields for a template, written in the given script"""
+    name, address, sentence = SAMPLE_TEXT[script]
+    return {
+        'rent_agreement': {
+            'landlord_name': name, 'landlord_address': address, 'tenant_name': name,
+            'tenant_address': address, 'property_address': address, 'city': address,
+            'monthly_rent': '15000', 'utilities_arrangement': sentence,
+        },
+        'legal_notice': {
+            'sender_name': name, 'sender_address': address, 'recipient_name': name,
+            'recipient_address': address, 'subject': sentence, 'facts': ' '.join([sentence] * 8),
+            'grievance': sentence, 'demand': sentence,
+        },
+        'affidavit': {
+            'deponent_name': name, 'deponent_address': address, 'statements': [sentence] * 6,
+        },
+        'consumer_complaint': {
+            'complainant_name': name, 'complainant_address': address, 'opposite_party_name': name,
+            'opposite_party_address': address, 'facts': [sentence] * 8, 'reliefs': [sentence] * 3,
+        },
+    }[doc_type]
+
+
+def run_render_benchmark(args):
+    import server  # Registers fonts and compiles templates, as a render worker does
+
+    scripts = ['latin'] + sorted(server.SCRIPT_FONTS)  # The import fails if any font is missing
+
+    print(f"\nPer-document render cost ({args.iterations} iterations, after 1 warm-up)")
+    for doc_type in sorted(server.DOCUMENT_TEMPLATES):
+        for script in scripts:
+            data = sample_document(doc_type, script)
+            server.render_document_pdf(doc_type, data)
+            timings = []
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                pdf_bytes = server.render_document_pdf(doc_type, data)
+                timings.append((time.perf_counter() - started) * 1000)
+            print_latency(f"{doc_type}/{script} {len(pdf_bytes) // 1024}KB", timings)
+    return 0
+
+
+# ============= PDF REGRESSION SUITE =============
+
+def pathological_document(doc_type):
+    """Inputs at the edge of what users send: hundreds of items, very long fields"""
+    name, address, sentence = SAMPLE_TEXT['latin']
+    return {
+        'rent_agreement': dict(sample_document('rent_agreement', 'latin'),
+                               utilities_arrangement=' '.join([sentence] * 400),
+                               property_address=' '.join([address] * 40)),
+        'legal_notice': dict(sample_document('legal_notice', 'latin'), facts=' '.join([sentence] * 1500)),
+        'affidavit': dict(sample_document('affidavit', 'latin'),
+                          statements=[f"{sentence} ({i})" for i in range(500)]),
+        'consumer_complaint': dict(sample_document('consumer_complaint', 'latin'),
+                                   facts=[f"{sentence} ({i})" for i in range(300)],
+                                   reliefs=[sentence] * 50, documents=[address] * 50),
+    }[doc_type]
+
+
+PDF_CASES = {
+    'small': lambda doc_type: {},
+    'typical': lambda doc_type: sample_document(doc_type, 'latin'),
+    'pathological': pathological_document,
+}
+
+
+def summarize(rounds, peak_kb):
+    """Medians over several (latencies, elapsed) rounds; unlike a best-of, one noisy round can't move them"""
+    latencies = [latency for round_latencies, _ in rounds for latency in round_latencies]
+    return {
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'throughput': round(statistics.median(len(r) / elapsed for r, elapsed in rounds), 2),  # documents per second
+        'peak_kb': peak_kb,
+    }
+
+
+def case_iterations(args, case):
+    return max(3, args.iterations // 10) if case == 'pathological' else args.iterations
+
+
+def traced_render_kb(doc_type, data):
+    """Python heap high-water mark of one render, in KB; also runs inside pool workers"""
+    import server
+
+    tracemalloc.start()
+    try:
+        server.render_document_pdf(doc_type, data)
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_single(server, args):
+    """In-process renders; peak memory is the Python heap high-water mark of one render"""
+    results = {}
+    for doc_type in sorted(server.DOCUMENT_TEMPLATES):
+        for case, make in PDF_CASES.items():
+            data = make(doc_type)
+            server.render_document_pdf(doc_type, data)  # Untimed warm-up
+            peak_kb = traced_render_kb(doc_type, data)
+
+            rounds = []
+            for _ in range(args.rounds):
+                latencies = []
+                gc.collect()
+                gc.disable()
+                started = time.perf_counter()
+                for _ in range(case_iterations(args, case)):
+                    t0 = time.perf_counter()
+                    server.render_document_pdf(doc_type, data)
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                rounds.append((latencies, time.perf_counter() - started))
+                gc.enable()
+            results[f"single/{doc_type}/{case}"] = summarize(rounds, peak_kb)
+    return results
+
+
+async def worker_peak_kb(pool, doc_type, data):
+    """
+    Heap high-water mark of one render of this case inside a worker.
+    Worker RSS (VmHWM) can't be used: it only ever grows over the process
+    lifetime, so every case would report the largest one before it.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool._executor, traced_render_kb, doc_type, data)
+
+
+async def bench_pooled(server, args):
+    """Renders through PdfRenderPool with 2x workers in flight; peak memory is measured per case in a worker"""
+    results = {}
+    pool = server.PdfRenderPool(workers=args.workers, max_pending=args.workers * 4)
+    pool.start()
+    try:
+        for doc_type in sorted(server.DOCUMENT_TEMPLATES):
+            for case, make in PDF_CASES.items():
+                data = make(doc_type)
+                # Untimed warm-up: one render per worker
+                await asyncio.gather(*[pool.render(doc_type, data) for _ in range(args.workers)])
+
+                count = case_iterations(args, case) * args.workers
+                semaphore = asyncio.Semaphore(args.workers * 2)
+                rounds = []
+                for _ in range(args.rounds):
+                    latencies = []
+
+                    async def timed_render():
+                        async with semaphore:
+                            t0 = time.perf_counter()
+                            await pool.render(doc_type, data)
+                            latencies.append((time.perf_counter() - t0) * 1000)
+
+                    started = time.perf_counter()
+                    await asyncio.gather(*[timed_render() for _ in range(count)])
+                    rounds.append((latencies, time.perf_counter() - started))
+                peak_kb = await worker_peak_kb(pool, doc_type, data)
+                results[f"pooled/{doc_type}/{case}"] = summarize(rounds, peak_kb)
+    finally:
+        pool.shutdown()
+    return results
+
+
+def calibrate():
+    """Time of a fixed pure-Python workload; lets a baseline from another machine be rescaled"""
+    timings = []
+    for _ in range(5):
+        t0 = time.perf_counter()
+        sum(i * i for i in range(200000))
+        timings.append((time.perf_counter() - t0) * 1000)
+    return round(min(timings), 3)
+
+
+def compare_to_baseline(results, baseline, tolerance, speed=1.0):
+    """Return the regressions against the baseline, rescaled by relative machine speed"""
+    regressions = []
+    scale = {'p50_ms': speed, 'throughput': 1 / speed, 'peak_kb': 1.0}
+    # metric -> True when higher is worse
+    checks = {'p50_ms': True, 'throughput': False, 'peak_kb': True}
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        for metric, higher_is_worse in checks.items():
+            if metric == 'throughput' and key.startswith('single/'):
+                continue  # 1/mean of the same renders as p50; the mean is too noise-prone to gate on
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            before = round(before * scale[metric], 3)
+            change = (after - before) / before
+            if (change > tolerance) if higher_is_worse else (change < -tolerance):
+                regressions.append(f"{key} {metric}: {before} -> {after} ({change:+.0%})")
+    return regressions
+
+
+def run_pdf_benchmark(args):
+    import server
+
+    calibration = calibrate()
+    results = {}
+    if 'single' in args.modes:
+        results.update(bench_single(server, args))
+    if 'pooled' in args.modes:
+        results.update(asyncio.run(bench_pooled(server, args)))
+    calibration = min(calibration, calibrate())
+
+    print(f"\n{'case':<42} {'p50':>9} {'p99':>9} {'docs/s':>8} {'peak':>9}")
+    for key, r in results.items():
+        peak = f"{r['peak_kb']}KB" if r['peak_kb'] is not None else 'n/a'
+        print(f"{key:<42} {r['p50_ms']:>7.2f}ms {r['p99_ms']:>7.2f}ms {r['throughput']:>8.1f} {peak:>9}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'machine': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpus': os.cpu_count(),
+                    'workers': args.workers,
+                    'iterations': args.iterations,
+                    'rounds': args.rounds,
+                    'calibration_ms': calibration,
+                },
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    speed = calibration / baseline['machine']['calibration_ms']
+    print(f"\nMachine speed vs baseline: {1 / speed:.2f}x")
+    regressions = compare_to_baseline(results, baseline['results'], args.tolerance, speed)
+    if regressions:
+        print(f"\nFAIL: {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nOK: no regressions beyond {args.tolerance:.0%} (baseline from {baseline['machine']['platform']})")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SunoLegal backend benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    event_loop = subparsers.add_parser('event-loop', help="health latency under PDF load")
+    event_loop.add_argument('--duration', type=float, default=10.0, help="seconds per phase")
+    event_loop.add_argument('--interval', type=float, default=0.05, help="seconds between health probes")
+    event_loop.add_argument('--pdf-concurrency', type=int, default=16, help="concurrent PDF generators")
+    event_loop.add_argument('--max-p99-ratio', type=float, default=None,
+                            help="exit non-zero if loaded p99 exceeds idle p99 by this factor")
+
+    render = subparsers.add_parser('render', help="in-process render cost per template and script")
+    render.add_argument('--iterations', type=int, default=50, help="renders per template and script")
+
+    pdf = subparsers.add_parser('pdf', help="PDF regression suite against a stored baseline")
+    pdf.add_argument('--iterations', type=int, default=30, help="renders per case (pathological: a tenth)")
+    pdf.add_argument('--rounds', type=int, default=5, help="repeat each case; medians are taken over all rounds")
+    pdf.add_argument('--workers', type=int, default=2, help="render pool size for pooled mode")
+    pdf.add_argument('--modes', default='single,pooled', help="comma-separated: single, pooled")
+    pdf.add_argument('--baseline', default=PDF_BASELINE, help="baseline JSON path")
+    pdf.add_argument('--save-baseline', action='store_true', help="record this run as the new baseline")
+    pdf.add_argument('--tolerance', type=float, default=0.25,
+                     help="allowed relative regression in p50, pooled throughput and peak memory")
+
+    chat = subparsers.add_parser('chat', help="streaming chat load test (server with LLM_BACKEND=mock)")
+    chat.add_argument('--duration', type=float, default=30.0, help="seconds of load")
+    chat.add_argument('--concurrency', type=int, default=50, help="concurrent chat users")
+    chat.add_argument('--repeat-ratio', type=float, default=0.0,
+                      help="share of requests asking one common question")
+
+    args = parser.parse_args()
+    if args.command == 'event-loop':
+        return asyncio.run(run_event_loop_benchmark(args))
+    if args.command == 'render':
+        return run_render_benchmark(args)
+    if args.command == 'chat':
+        return asyncio.run(run_chat_benchmark(args))
+    if args.command == 'pdf':
+        args.modes = args.modes.split(',')
+        return run_pdf_benchmark(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+SunoLegal PDF Font Setup
+
+Usage:
+    python fetch_fonts.py [--font-dir fonts] [--force]
+
+Downloads the Noto Sans TTFs (SIL Open Font License 1.1) that PDF
+rendering needs for Indic user fields, with each family's OFL.txt, into
+PDF_FONT_DIR (default: backend/fonts). The server refuses to start until
+every family in SCRIPT_FONTS is present. Run once per deployment or bake
+the directory into the image.
+"""
+import argparse
+import os
+import sys
+import urllib.request
+
+NOTO_BASE = "https://notofonts.github.io"
+NOTO_LICENSE_BASE = "https://raw.githubusercontent.com/notofonts"
+
+# Noto family -> notofonts project; keep in sync with SCRIPT_FONTS in server.py
+FONT_FAMILIES = {
+    "NotoSansDevanagari": "devanagari",
+    "NotoSansKannada": "kannada",
+}
+FONT_STYLES = ("Regular", "Bold")
+TTF_MAGIC = (b"\x00\x01\x00\x00", b"true")
+
+
+def download(url, path):
+    """Fetch url to path via a temporary file, so a failed download leaves nothing behind"""
+    partial = f"{path}.part"
+    with urllib.request.urlopen(url, timeout=60) as response, open(partial, 'wb') as f:
+        f.write(response.read())
+    os.replace(partial, path)
+
+
+def fetch_family(family, project, font_dir, force):
+    for style in FONT_STYLES:
+        name = f"{family}-{style}.ttf"
+        path = os.path.join(font_dir, name)
+        if os.path.exists(path) and not force:
+            print(f"  {name}: present")
+            continue
+        download(f"{NOTO_BASE}/{project}/fonts/{family}/hinted/ttf/{name}", path)
+        with open(path, 'rb') as f:
+            if f.read(4) not in TTF_MAGIC:
+                os.remove(path)
+                raise RuntimeError(f"{name} is not a TrueType font")
+        print(f"  {name}: {os.path.getsize(path) // 1024}KB")
+
+    license_path = os.path.join(font_dir, f"{family}-OFL.txt")
+    if force or not os.path.exists(license_path):
+        download(f"{NOTO_LICENSE_BASE}/{project}/main/OFL.txt", license_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the Noto fonts used for Indic PDFs")
+    parser.add_argument('--font-dir', default=os.getenv(
+        "PDF_FONT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+    ), help="target directory (default: PDF_FONT_DIR or backend/fonts)")
+    parser.add_argument('--force', action='store_true', help="download again even if present")
+    args = parser.parse_args()
+
+    os.makedirs(args.font_dir, exist_ok=True)
+    print(f"Fetching PDF fonts into {args.font_dir}")
+    try:
+        for family, project in FONT_FAMILIES.items():
+            fetch_family(family, project, args.font_dir, args.force)
+    except Exception as e:
+        print(f"FAIL: {e}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,54 @@
 from fastapi import FastAPI, HTTPException, Depends, Header, Request, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime, timedelta
 import os
 import io
 import hmac
 import hashlib
+import json
+import math
+import multiprocessing
+import random
 import uuid
 import base64
+import contextlib
+import copy
+import re
 import secrets
+import tempfile
+import threading
+import time
+import unicodedata
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
+# Streaming multipart parsing (python-multipart)
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
 # Rate limiting
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+from limits import parse as parse_rate_limit
 
 # PDF Generation
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch, cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Flowable
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
 
 # LLM Integration
 from emergentintegrations.llm.chat import LlmChat, UserMessage
@@ -91,6 +115,7 @@ class MockFirestoreDB:
             "lawyers": {},
             "lawyer_applications": {},  # For lawyer verification workflow
             "chats": {},
+            "chat_index": {},  # Per-session sidebar summaries (user_id, last_message, message_count)
             "documents": {},
             "bookings": {},
             "cases": {},
@@ -250,6 +275,27 @@ class MockFirestoreDB:
     def collection(self, name: str):
         """Get a collection reference"""
         return MockCollection(self._data, name)
+    
+    def batch(self):
+        """Get a write batch"""
+        return MockWriteBatch()
+
+
+class MockWriteBatch:
+    """Mock Firestore WriteBatch: queued writes are applied together on commit()"""
+    def __init__(self):
+        self._writes = []
+    
+    def set(self, ref, data: dict, merge: bool = False):
+        self._writes.append(lambda: ref.set(data, merge=merge))
+    
+    def update(self, ref, data: dict):
+        self._writes.append(lambda: ref.update(data))
+    
+    def commit(self):
+        for write in self._writes:
+            write()
+        self._writes = []
 
 
 class MockCollection:
@@ -396,6 +442,10 @@ class MockDocumentRef:
                 else:
                     self._data[self._collection][self._doc_id][key] = value
             self._data[self._collection][self._doc_id]["updated_at"] = datetime.now().isoformat()
+    
+    def delete(self):
+        """Delete document (no error if it does not exist)"""
+        self._data[self._collection].pop(self._doc_id, None)
 
 
 class MockDocumentSnapshot:
@@ -421,41 +471,356 @@ def ArrayUnion(values: list):
     return {"_array_union": values}
 
 
+# ============= CACHING HELPERS =============
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by entry count and/or total size, with an
+    optional TTL in seconds. Tracks hits, misses, evictions and expirations
+    so caches can be sized from metrics.
+    """
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, sizeof=len,
+                 ttl: Optional[float] = None):
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._ttl = ttl
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key):
+        """Return cached value (marking it most recently used) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, value):
+        """Insert value, evicting least recently used entries over the bounds"""
+        size = self._sizeof(value) if self._max_bytes is not None else 0
+        with self._lock:
+            # Values larger than the whole cache are never worth holding
+            if self._max_bytes is not None and size > self._max_bytes:
+                self._remove(key)
+                return
+            self._remove(key)
+            expires_at = time.monotonic() + self._ttl if self._ttl is not None else None
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._over_limit():
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+    
+    def pop(self, key):
+        """Drop key from the cache if present"""
+        with self._lock:
+            self._remove(key)
+    
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+    
+    def _over_limit(self) -> bool:
+        if self._max_entries is not None and len(self._entries) > self._max_entries:
+            return True
+        if self._max_bytes is not None and self._bytes > self._max_bytes:
+            return True
+        return False
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def stats(self) -> dict:
+        """Hit/miss/eviction/expiry counters plus current occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self._max_entries,
+            "max_bytes": self._max_bytes,
+            "ttl_seconds": self._ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
 # ============= MOCK FIREBASE STORAGE =============
+# Blobs live on disk under STORAGE_DIR; only recently downloaded blobs are
+# kept hot in memory (bounded LRU). Each owner has a byte quota.
+STORAGE_DIR = os.getenv("STORAGE_DIR", os.path.join(tempfile.gettempdir(), "sunolegal_storage"))
+STORAGE_QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", str(100 * 1024 * 1024)))  # 100 MB per owner
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # 32 MB hot tier
+# Downloads above this size stream from disk in chunks instead of via the hot tier
+STORAGE_STREAM_MIN_BYTES = int(os.getenv("STORAGE_STREAM_MIN_BYTES", str(1024 * 1024)))  # 1 MB
+
+# Signed-download offload: "" (serve from Python), "x-accel-redirect" (nginx),
+# "x-sendfile" (Apache/lighttpd) or "sendfile" (stream from disk in chunks)
+STORAGE_DOWNLOAD_OFFLOAD = os.getenv("STORAGE_DOWNLOAD_OFFLOAD", "").strip().lower()
+# nginx `internal` location that aliases STORAGE_DIR, used with x-accel-redirect
+STORAGE_ACCEL_REDIRECT_PREFIX = os.getenv("STORAGE_ACCEL_REDIRECT_PREFIX", "/protected-storage").rstrip("/")
+
+if STORAGE_DOWNLOAD_OFFLOAD not in ("", "x-accel-redirect", "x-sendfile", "sendfile"):
+    raise RuntimeError(f"Invalid STORAGE_DOWNLOAD_OFFLOAD: {STORAGE_DOWNLOAD_OFFLOAD!r}")
+
+
+class StorageQuotaExceededError(Exception):
+    """Raised when an upload would push an owner over their storage quota"""
+    pass
+
+
+class UploadTooLargeError(Exception):
+    """Raised when a streamed upload exceeds its size limit"""
+    pass
+
+
+class StorageUpload:
+    """
+    Incremental writer returned by MockFirebaseStorage.begin_upload().
+    Chunks are hashed and written straight to disk, so an upload is never
+    held in memory as a whole. Call commit() to publish or abort() to discard.
+    """
+    def __init__(self, storage: "MockFirebaseStorage", path: str, owner_uid: str,
+                 metadata: dict = None, max_bytes: Optional[int] = None):
+        self.path = path
+        self.owner_uid = owner_uid
+        self.metadata = dict(metadata or {})
+        self.size = 0
+        self._storage = storage
+        self._max_bytes = max_bytes
+        self._hash = hashlib.sha256()
+        self._tmp_path = f"{storage._disk_path(path)}.{uuid.uuid4().hex[:8]}.tmp"
+        self._file = open(self._tmp_path, "wb")
+    
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+    
+    def write(self, chunk: bytes):
+        """Append a chunk, enforcing the size limit and quota as bytes arrive"""
+        self.size += len(chunk)
+        if self._max_bytes is not None and self.size > self._max_bytes:
+            raise UploadTooLargeError(f"File exceeds maximum size of {self._max_bytes} bytes")
+        self._storage._check_quota(self.path, self.owner_uid, self.size)
+        self._hash.update(chunk)
+        self._file.write(chunk)
+    
+    def commit(self) -> dict:
+        """Publish the upload at its storage path"""
+        self._file.close()
+        storage = self._storage
+        with storage._lock:
+            try:
+                storage._check_quota(self.path, self.owner_uid, self.size)
+            except StorageQuotaExceededError:
+                os.remove(self._tmp_path)
+                raise
+            os.replace(self._tmp_path, storage._disk_path(self.path))
+            self.metadata["sha256"] = self.sha256
+            file_info = storage._record_file(self.path, self.owner_uid, self.size, self.metadata)
+        
+        return {
+            "path": self.path,
+            "size": self.size,
+            "sha256": self.sha256,
+            "created_at": file_info["created_at"]
+        }
+    
+    def abort(self):
+        """Discard everything written so far"""
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
 class MockFirebaseStorage:
     """
     Mock Firebase Storage for development/testing.
     Simulates private storage with signed URLs.
     SECURITY: All files are private by default - NO make_public() method.
+    
+    Tiering: file bytes are written to disk; an in-memory LRU holds only
+    recently downloaded blobs. Per-owner quotas are enforced on upload.
     """
-    def __init__(self):
-        self._files = {}  # path -> {"data": bytes, "metadata": dict, "owner_uid": str}
+    def __init__(self, root_dir: str = STORAGE_DIR, quota_bytes: int = STORAGE_QUOTA_BYTES,
+                 cache_max_bytes: int = STORAGE_CACHE_MAX_BYTES):
+        self._files = {}  # path -> {"disk_path": str, "metadata": dict, "owner_uid": str, "size": int}
         self._signed_url_tokens = {}  # token -> {"path": str, "expires": datetime}
+        self._usage = {}  # owner_uid -> total bytes stored
+        self._lock = threading.Lock()
+        self._root_dir = root_dir
+        self._quota_bytes = quota_bytes
+        self._cache = LRUCache(max_bytes=cache_max_bytes)
+        os.makedirs(self._root_dir, exist_ok=True)
+    
+    def _disk_path(self, path: str) -> str:
+        """Map a storage path to a file on disk (hashed, so no path traversal)"""
+        return os.path.join(self._root_dir, hashlib.sha256(path.encode()).hexdigest())
+    
+    def _check_quota(self, path: str, owner_uid: str, size: int):
+        """Raise if storing `size` bytes at `path` would exceed the owner's quota"""
+        used = self._usage.get(owner_uid, 0)
+        existing = self._files.get(path)
+        if existing and existing["owner_uid"] == owner_uid:
+            used -= existing["size"]  # Overwrite replaces the old blob
+        if used + size > self._quota_bytes:
+            raise StorageQuotaExceededError(
+                f"Storage quota exceeded: {used + size} of {self._quota_bytes} bytes"
+            )
+    
+    def _record_file(self, path: str, owner_uid: str, size: int, metadata: dict) -> dict:
+        """Register a blob that is already on disk and update usage accounting"""
+        existing = self._files.get(path)
+        if existing:
+            self._usage[existing["owner_uid"]] = self._usage.get(existing["owner_uid"], 0) - existing["size"]
+        
+        self._files[path] = {
+            "disk_path": self._disk_path(path),
+            "metadata": metadata or {},
+            "owner_uid": owner_uid,
+            "created_at": datetime.now().isoformat(),
+            "size": size
+        }
+        self._usage[owner_uid] = self._usage.get(owner_uid, 0) + size
+        
+        # Stale bytes must never be served from the hot tier
+        self._cache.pop(path)
+        return self._files[path]
     
     def upload_file(self, path: str, data: bytes, owner_uid: str, metadata: dict = None) -> dict:
         """
         Upload file to private storage.
         Path format: {collection}/{owner_uid}/{filename}
+        Raises StorageQuotaExceededError if the owner is over quota.
         """
         # Validate path includes owner_uid for security
         path_parts = path.split("/")
         if len(path_parts) < 3:
             raise ValueError("Invalid path format. Must be: collection/userId/filename")
         
-        self._files[path] = {
-            "data": data,
-            "metadata": metadata or {},
-            "owner_uid": owner_uid,
-            "created_at": datetime.now().isoformat(),
-            "size": len(data)
-        }
+        with self._lock:
+            self._check_quota(path, owner_uid, len(data))
+            
+            # Write atomically so readers never see a partial blob
+            disk_path = self._disk_path(path)
+            tmp_path = f"{disk_path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, disk_path)
+            
+            file_info = self._record_file(path, owner_uid, len(data), metadata)
         
         return {
             "path": path,
             "size": len(data),
-            "created_at": self._files[path]["created_at"]
+            "created_at": file_info["created_at"]
+        }
+    
+    def spool_path(self) -> str:
+        """
+        Scratch file on the storage filesystem for producers that write to a
+        path (e.g. PDF render workers); publish it with upload_from_path().
+        """
+        return os.path.join(self._root_dir, f"spool-{uuid.uuid4().hex}.tmp")
+    
+    def upload_from_path(self, path: str, src_path: str, owner_uid: str, metadata: dict = None) -> dict:
+        """
+        Move an already-written file into private storage without reading it.
+        The source is consumed (renamed into place, or removed if over quota).
+        Path format: {collection}/{owner_uid}/{filename}
+        """
+        path_parts = path.split("/")
+        if len(path_parts) < 3:
+            raise ValueError("Invalid path format. Must be: collection/userId/filename")
+        
+        size = os.path.getsize(src_path)
+        with self._lock:
+            try:
+                self._check_quota(path, owner_uid, size)
+            except StorageQuotaExceededError:
+                os.remove(src_path)
+                raise
+            os.replace(src_path, self._disk_path(path))
+            file_info = self._record_file(path, owner_uid, size, metadata)
+        
+        return {
+            "path": path,
+            "size": size,
+            "created_at": file_info["created_at"]
         }
     
+    def begin_upload(self, path: str, owner_uid: str, metadata: dict = None,
+                     max_bytes: Optional[int] = None) -> StorageUpload:
+        """
+        Start a streaming upload to private storage.
+        Path format: {collection}/{owner_uid}/{filename}
+        """
+        path_parts = path.split("/")
+        if len(path_parts) < 3:
+            raise ValueError("Invalid path format. Must be: collection/userId/filename")
+        
+        return StorageUpload(self, path, owner_uid, metadata, max_bytes)
+    
+    def read_file(self, path: str, promote: bool = True) -> Optional[bytes]:
+        """
+        Read file bytes WITHOUT an ownership check (hot tier first, then disk).
+        Only call after access was authorised, e.g. a validated signed URL.
+        Returns None if the file does not exist (or was deleted meanwhile).
+        promote=False leaves a disk read out of the hot tier (bulk reads).
+        """
+        file_info = self._files.get(path)
+        if not file_info:
+            return None
+        
+        data = self._cache.get(path)
+        if data is None:
+            try:
+                with open(file_info["disk_path"], "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return None  # Deleted between the lookup and the read
+            if promote:
+                self._cache.put(path, data)
+        return data
+    
+    def open_file(self, path: str):
+        """
+        Open a file for streaming WITHOUT an ownership check, bypassing the
+        hot tier. Returns None if the file does not exist (or was deleted
+        meanwhile); once open it stays readable even if deleted.
+        """
+        file_info = self._files.get(path)
+        if not file_info:
+            return None
+        try:
+            return open(file_info["disk_path"], "rb")
+        except FileNotFoundError:
+            return None
+    
+    def get_file_info(self, path: str) -> Optional[dict]:
+        """File metadata (including its on-disk location) WITHOUT an ownership check"""
+        file_info = self._files.get(path)
+        return dict(file_info) if file_info else None
+    
     def get_file(self, path: str, requester_uid: str, is_admin: bool = False) -> Optional[bytes]:
         """
         Get file - only if requester owns it or is admin.
@@ -470,7 +835,7 @@ class MockFirebaseStorage:
         if not is_admin and file_info["owner_uid"] != requester_uid:
             raise PermissionError("Access denied: You can only access your own files")
         
-        return file_info["data"]
+        return self.read_file(path)
     
     def generate_signed_url(self, path: str, requester_uid: str, is_admin: bool = False, 
                             expires_in_minutes: int = 15) -> str:
@@ -487,6 +852,14 @@ class MockFirebaseStorage:
         if not is_admin and file_info["owner_uid"] != requester_uid:
             raise PermissionError("Access denied: You can only access your own files")
         
+        return self.sign_path(path, expires_in_minutes)
+    
+    def sign_path(self, path: str, expires_in_minutes: int = 15) -> str:
+        """
+        Issue a signed URL for a path WITHOUT an existence or ownership check.
+        Only call after access was authorised, e.g. for a lazily rendered
+        document that has no stored blob yet.
+        """
         # Generate signed URL token
         token = secrets.token_urlsafe(32)
         expires = datetime.now() + timedelta(minutes=expires_in_minutes)
@@ -524,7 +897,14 @@ class MockFirebaseStorage:
         if not is_admin and file_info["owner_uid"] != requester_uid:
             raise PermissionError("Access denied: You can only delete your own files")
         
-        del self._files[path]
+        with self._lock:
+            del self._files[path]
+            self._usage[file_info["owner_uid"]] = self._usage.get(file_info["owner_uid"], 0) - file_info["size"]
+            self._cache.pop(path)
+            try:
+                os.remove(file_info["disk_path"])
+            except FileNotFoundError:
+                pass
         return True
     
     def list_user_files(self, collection: str, user_uid: str) -> List[dict]:
@@ -535,6 +915,25 @@ class MockFirebaseStorage:
             for path, info in self._files.items()
             if path.startswith(prefix)
         ]
+    
+    def get_usage(self, owner_uid: str) -> dict:
+        """Bytes used and remaining quota for an owner"""
+        used = self._usage.get(owner_uid, 0)
+        return {
+            "used_bytes": used,
+            "quota_bytes": self._quota_bytes,
+            "remaining_bytes": max(0, self._quota_bytes - used)
+        }
+    
+    def get_stats(self) -> dict:
+        """Storage and hot-tier cache metrics for monitoring"""
+        return {
+            "files": len(self._files),
+            "disk_bytes": sum(info["size"] for info in self._files.values()),
+            "owners": len(self._usage),
+            "quota_bytes_per_owner": self._quota_bytes,
+            "memory_cache": self._cache.stats()
+        }
 
 
 # Initialize Mock Storage
@@ -769,6 +1168,9 @@ class DocumentData(BaseModel):
     document_type: str  # rent_agreement, legal_notice, affidavit, consumer_complaint
     data: Dict[str, Any]
 
+class DocumentBatch(BaseModel):
+    documents: List[DocumentData]
+
 class BookingRequest(BaseModel):
     lawyer_id: str
     consultation_type: str  # chat, call, video
@@ -880,14 +1282,42 @@ async def health_check():
     health_status["features"] = {
         "database": "mock_firestore" if RAZORPAY_KEY_SECRET == "demo_secret" else "firebase_admin",
         "storage": "private_only",
+        "storage_download_offload": STORAGE_DOWNLOAD_OFFLOAD or "none",
         "payments": "mock_razorpay" if RAZORPAY_KEY_SECRET == "demo_secret" else "razorpay_live",
-        "llm": "emergent_integration",
+        "llm": llm_backend.name,
         "pdf_generation": "reportlab",
+        "pdf_scripts": sorted(pdf_fonts.fonts),
+        "document_storage_mode": DOCUMENT_STORAGE_MODE,
         "rate_limiting": "uid_based"
     }
     
     return health_status
 
+# ============= METRICS =============
+
+@app.get("/api/admin/metrics")
+async def get_metrics(admin = Depends(require_admin)):
+    """
+    ADMIN ONLY: Runtime metrics for sizing caches and pools.
+    """
+    return {
+        "success": True,
+        "storage": storage.get_stats(),
+        "pdf_render_pool": pdf_render_pool.stats(),
+        "document_result_cache": document_result_cache.stats(),
+        "document_jobs": document_job_queue.stats(),
+        "lazy_document_cache": lazy_document_cache.stats(),
+        "chat_faq_cache": chat_faq_cache.stats(),
+        "chat_single_flight": chat_flights.stats(),
+        "llm_backend": llm_backend.stats(),
+        "llm_guard": guarded_llm.stats(),
+        "chat_writes": chat_writes.stats(),
+        "llm_admission": llm_admission.stats(),
+        "chat_routing": chat_routes.stats(),
+        "law_retrieval": law_index.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
 # ============= USER PROFILE ENDPOINTS =============
 
 @app.post("/api/users/profile")
@@ -924,6 +1354,869 @@ async def get_profile(user = Depends(verify_token)):
     else:
         return {"success": False, "message": "Profile not found"}
 
+# ============= NYAYAI LLM BACKENDS =============
+# LLM_BACKEND=emergent: emergentintegrations LlmChat (whole completion, no token streaming)
+# LLM_BACKEND=openai:   any OpenAI-compatible API at LLM_API_BASE, streamed token by token
+# LLM_BACKEND=mock:     local stand-in for load tests, no tokens spent
+LLM_BACKEND = os.getenv("LLM_BACKEND", "emergent").lower()
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_API_BASE = os.getenv("LLM_API_BASE") or None  # Required for LLM_BACKEND=openai
+LLM_API_KEY = os.getenv("LLM_API_KEY") or None  # Required for LLM_BACKEND=openai; never the Emergent key
+EMERGENT_LLM_KEY = os.getenv("EMERGENT_LLM_KEY")
+LLM_EMERGENT_SESSIONS = int(os.getenv("LLM_EMERGENT_SESSIONS", "1000"))  # LlmChat sessions kept for reuse
+
+# Connection pool shared by every request and session (openai backend)
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "32"))
+LLM_POOL_KEEPALIVE_SECONDS = float(os.getenv("LLM_POOL_KEEPALIVE_SECONDS", "120"))
+LLM_POOL_WARM_CONNECTIONS = int(os.getenv("LLM_POOL_WARM_CONNECTIONS", "2"))  # Opened at startup
+
+
+class LlmClientPool:
+    """
+    Long-lived OpenAI-compatible client over a keep-alive httpx connection
+    pool, created at startup and shared by all requests and sessions, so a
+    message pays for the model call only, not client or TLS setup.
+    """
+    def __init__(self):
+        self.client = None
+        self._http = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+    
+    async def start(self):
+        """Create the client and open LLM_POOL_WARM_CONNECTIONS connections"""
+        import httpx
+        from openai import AsyncOpenAI
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_POOL_MAX_CONNECTIONS,
+                keepalive_expiry=LLM_POOL_KEEPALIVE_SECONDS
+            ),
+            timeout=httpx.Timeout(600, connect=10)
+        )
+        self.client = AsyncOpenAI(api_key=LLM_API_KEY, base_url=LLM_API_BASE, http_client=self._http)
+        warm = await asyncio.gather(
+            *[self.client.models.list() for _ in range(LLM_POOL_WARM_CONNECTIONS)],
+            return_exceptions=True
+        )
+        failed = sum(isinstance(result, Exception) for result in warm)
+        print(f"✅ LLM client pool started ({LLM_POOL_WARM_CONNECTIONS - failed}/{LLM_POOL_WARM_CONNECTIONS} connections warmed)")
+    
+    async def close(self):
+        if self.client:
+            await self.client.close()
+            self.client = None
+    
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        """The shared client, counted as in flight for the duration of a call"""
+        if self.client is None:
+            await self.start()  # Used outside the app lifecycle (scripts, tests)
+        self.calls += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield self.client
+        finally:
+            self.in_flight -= 1
+    
+    def stats(self) -> dict:
+        return {
+            "max_connections": LLM_POOL_MAX_CONNECTIONS,
+            "keepalive_seconds": LLM_POOL_KEEPALIVE_SECONDS,
+            "calls": self.calls,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+        }
+
+
+class EmergentLlmBackend:
+    """
+    emergentintegrations LlmChat; stream() yields the finished completion as
+    one chunk. LlmChat keeps the conversation it has seen, so one instance is
+    kept per chat session (bounded LRU) and reused for the next turn as long
+    as its history is exactly the prompt we would send. When the window slid,
+    the model changed or the session is busy (a hedge), a new one is built.
+    """
+    name = "emergent_integration"
+    
+    def __init__(self):
+        self._sessions = OrderedDict()  # (session_id, model) -> [LlmChat, history it holds, busy]
+        self.created = 0
+        self.reused = 0
+    
+    async def start(self):
+        pass
+    
+    async def close(self):
+        self._sessions.clear()
+    
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions), "created": self.created, "reused": self.reused}
+    
+    def _checkout(self, session_id: str, messages: List[dict], model: str):
+        """Session entry whose LlmChat already holds messages[:-1], or a new one"""
+        key = (session_id, model)
+        history = [(m["role"], m["content"]) for m in messages[:-1]]
+        entry = self._sessions.get(key)
+        if entry is not None and not entry[2] and entry[1] == history:
+            self._sessions.move_to_end(key)
+            self.reused += 1
+        else:
+            chat = LlmChat(
+                api_key=EMERGENT_LLM_KEY,
+                session_id=session_id,
+                system_message=messages[0]["content"],
+                initial_messages=messages[:-1]  # System prompt + windowed history
+            )
+            chat.with_model(LLM_PROVIDER, model)
+            entry = [chat, history, False]
+            self.created += 1
+            if key not in self._sessions or not self._sessions[key][2]:
+                self._sessions[key] = entry
+                while len(self._sessions) > LLM_EMERGENT_SESSIONS:
+                    self._sessions.popitem(last=False)
+        return key, entry
+    
+    async def complete(self, session_id: str, messages: List[dict], model: str = LLM_MODEL) -> str:
+        key, entry = self._checkout(session_id, messages, model)
+        entry[2] = True
+        try:
+            response = await entry[0].send_message(UserMessage(text=messages[-1]["content"]))
+        except BaseException:
+            if self._sessions.get(key) is entry:
+                del self._sessions[key]  # Its history is unknown after a failed send
+            raise
+        finally:
+            entry[2] = False
+        entry[1] = entry[1] + [("user", messages[-1]["content"]), ("assistant", response)]
+        return response
+    
+    async def stream(self, session_id: str, messages: List[dict], model: str = LLM_MODEL):
+        yield await self.complete(session_id, messages, model)
+
+
+class OpenAiLlmBackend:
+    """OpenAI-compatible chat completions with token streaming"""
+    name = "openai_compatible"
+    
+    def __init__(self):
+        # No fallback to EMERGENT_LLM_KEY: with a default base URL it would go to api.openai.com
+        if not LLM_API_KEY or not LLM_API_BASE:
+            raise RuntimeError("LLM_BACKEND=openai requires both LLM_API_KEY and LLM_API_BASE")
+        if EMERGENT_LLM_KEY and LLM_API_KEY == EMERGENT_LLM_KEY and "emergent" not in LLM_API_BASE:
+            raise RuntimeError(f"LLM_API_KEY is the Emergent key but LLM_API_BASE is {LLM_API_BASE}")
+        self.pool = LlmClientPool()
+    
+    async def start(self):
+        await self.pool.start()
+    
+    async def close(self):
+        await self.pool.close()
+    
+    def stats(self) -> dict:
+        return self.pool.stats()
+    
+    async def complete(self, session_id: str, messages: List[dict], model: str = LLM_MODEL) -> str:
+        async with self.pool.acquire() as client:
+            response = await client.chat.completions.create(model=model, messages=messages)
+        return response.choices[0].message.content or ""
+    
+    async def stream(self, session_id: str, messages: List[dict], model: str = LLM_MODEL):
+        async with self.pool.acquire() as client:
+            stream = await client.chat.completions.create(model=model, messages=messages, stream=True)
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()  # Also releases the upstream connection if the client went away
+
+
+# LLM_BACKEND=mock: offline stand-in for load tests. Latency, token rate and
+# failures are configurable and seeded, so runs are repeatable.
+LLM_MOCK_FIRST_CHUNK_MS = float(os.getenv("LLM_MOCK_FIRST_CHUNK_MS", "600"))  # Median time to first token
+LLM_MOCK_LATENCY = os.getenv("LLM_MOCK_LATENCY", "lognormal").lower()  # fixed | uniform | lognormal
+LLM_MOCK_LATENCY_SPREAD = float(os.getenv("LLM_MOCK_LATENCY_SPREAD", "0.5"))  # lognormal sigma / uniform +- fraction
+LLM_MOCK_TOKENS_PER_SECOND = float(os.getenv("LLM_MOCK_TOKENS_PER_SECOND", "60"))
+LLM_MOCK_RESPONSE_TOKENS = int(os.getenv("LLM_MOCK_RESPONSE_TOKENS", "150"))
+LLM_MOCK_ERROR_RATE = float(os.getenv("LLM_MOCK_ERROR_RATE", "0"))  # Fail before the first token
+LLM_MOCK_STALL_RATE = float(os.getenv("LLM_MOCK_STALL_RATE", "0"))  # Never answer (exercises deadlines)
+LLM_MOCK_SEED = int(os.getenv("LLM_MOCK_SEED", "42"))
+
+
+class MockLlmBackend:
+    """Deterministic offline LLM: sampled first-token latency, then paced word tokens"""
+    name = "mock"
+    
+    def __init__(self):
+        if LLM_MOCK_LATENCY not in ("fixed", "uniform", "lognormal"):
+            raise RuntimeError(f"Invalid LLM_MOCK_LATENCY: {LLM_MOCK_LATENCY!r}")
+        self._random = random.Random(LLM_MOCK_SEED)
+        self.calls = 0
+        self.errors = 0
+        self.stalls = 0
+    
+    async def start(self):
+        pass
+    
+    async def close(self):
+        pass
+    
+    def stats(self) -> dict:
+        return {"calls": self.calls, "injected_errors": self.errors, "injected_stalls": self.stalls}
+    
+    def _first_chunk_seconds(self) -> float:
+        median = LLM_MOCK_FIRST_CHUNK_MS / 1000
+        if LLM_MOCK_LATENCY == "fixed":
+            return median
+        if LLM_MOCK_LATENCY == "uniform":
+            return median * self._random.uniform(1 - LLM_MOCK_LATENCY_SPREAD, 1 + LLM_MOCK_LATENCY_SPREAD)
+        return median * self._random.lognormvariate(0, LLM_MOCK_LATENCY_SPREAD)
+    
+    async def complete(self, session_id: str, messages: List[dict], model: str = LLM_MODEL) -> str:
+        return "".join([text async for text in self.stream(session_id, messages, model)])
+    
+    async def stream(self, session_id: str, messages: List[dict], model: str = LLM_MODEL):
+        self.calls += 1
+        roll = self._random.random()
+        delay = self._first_chunk_seconds()
+        if roll < LLM_MOCK_STALL_RATE:
+            self.stalls += 1
+            await asyncio.Event().wait()  # Until cancelled
+        await asyncio.sleep(delay)
+        if roll < LLM_MOCK_STALL_RATE + LLM_MOCK_ERROR_RATE:
+            self.errors += 1
+            raise RuntimeError("Mock LLM: injected upstream error")
+        
+        question = " ".join(messages[-1]["content"].split()[:12])
+        words = f"[mock] General information about: {question}. ".split(" ")
+        filler = "Under Indian law the usual first step is to keep written records and send a formal notice.".split()
+        while len(words) < LLM_MOCK_RESPONSE_TOKENS:
+            words += filler
+        words = words[:LLM_MOCK_RESPONSE_TOKENS]
+        words += "For personalized legal advice, please consult a verified lawyer on our platform.".split()
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(1 / LLM_MOCK_TOKENS_PER_SECOND)
+            yield word if i == len(words) - 1 else word + " "
+
+
+LLM_BACKENDS = {"emergent": EmergentLlmBackend, "openai": OpenAiLlmBackend, "mock": MockLlmBackend}
+if LLM_BACKEND not in LLM_BACKENDS:
+    raise RuntimeError(f"Invalid LLM_BACKEND: {LLM_BACKEND!r}")
+llm_backend = LLM_BACKENDS[LLM_BACKEND]()
+print(f"✅ NyayAI LLM backend: {LLM_BACKEND} ({LLM_MODEL})")
+
+# Deadlines, circuit breaker and hedging around every LLM call. The emergent
+# backend delivers the whole completion as its first chunk, so there the
+# first-chunk deadline covers the full generation.
+LLM_FIRST_CHUNK_TIMEOUT_SECONDS = float(os.getenv("LLM_FIRST_CHUNK_TIMEOUT_SECONDS", "30"))
+LLM_TOTAL_TIMEOUT_SECONDS = float(os.getenv("LLM_TOTAL_TIMEOUT_SECONDS", "90"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # Consecutive failures that open it
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))  # Open time before a probe
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"  # Duplicate slow calls (costs tokens)
+LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "3"))  # Until p95 is known
+LLM_HEDGE_CLIENT = "hedge"  # Admission client for hedges; they never queue, so need a free slot
+
+
+class LlmUnavailableError(Exception):
+    """Raised when the circuit breaker is open or a call missed its deadline"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failures so callers fail fast; after
+    `reset_seconds` a single probe call is let through to test recovery.
+    """
+    def __init__(self, failures: int, reset_seconds: float):
+        self._failures = failures
+        self._reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opens = 0
+        self.rejected = 0
+    
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self._reset_seconds:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+        return True
+    
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probing = False
+    
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.consecutive_failures >= self._failures:
+            if self.state != "open":
+                self.opens += 1
+            self.state = "open"
+            self._opened_at = time.monotonic()
+    
+    def release(self):
+        """A call ended without an outcome (caller went away)"""
+        self._probing = False
+    
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+
+class GuardedLlm:
+    """llm_backend calls with deadlines, a circuit breaker and optional hedging"""
+    def __init__(self):
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+        self._first_chunk_ms = deque(maxlen=200)
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0
+    
+    def hedge_delay(self) -> float:
+        """p95 time to first chunk once there are enough samples"""
+        if len(self._first_chunk_ms) < 20:
+            return LLM_HEDGE_DELAY_SECONDS
+        ordered = sorted(self._first_chunk_ms)
+        return ordered[int(len(ordered) * 0.95)] / 1000
+    
+    async def stream(self, session_id: str, messages: List[dict], model: str = LLM_MODEL):
+        """Chunks of one completion; raises LlmUnavailableError when open or too slow"""
+        if not self.breaker.allow():
+            raise LlmUnavailableError("LLM circuit breaker is open")
+        started = time.monotonic()
+        outcome = None
+        gen = None
+        release = None
+        try:
+            gen, first, release = await self._first_chunk(session_id, messages, model, started)
+            self._first_chunk_ms.append((time.monotonic() - started) * 1000)
+            if first is not None:
+                yield first
+                while True:
+                    remaining = started + LLM_TOTAL_TIMEOUT_SECONDS - time.monotonic()
+                    try:
+                        text = await asyncio.wait_for(gen.__anext__(), max(remaining, 0))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        self.timeouts += 1
+                        raise LlmUnavailableError(f"LLM response exceeded {LLM_TOTAL_TIMEOUT_SECONDS}s")
+                    yield text
+            outcome = "success"
+        except Exception:
+            outcome = "failure"
+            raise
+        finally:
+            if outcome == "success":
+                self.breaker.record_success()
+            elif outcome == "failure":
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            if gen is not None:
+                await gen.aclose()
+            if release:
+                release()
+    
+    async def complete(self, session_id: str, messages: List[dict], model: str = LLM_MODEL) -> str:
+        return "".join([text async for text in self.stream(session_id, messages, model)])
+    
+    async def _first_chunk(self, session_id: str, messages: List[dict], model: str, started: float):
+        """
+        Start the call, plus a hedge if it is slower than p95 or fails first.
+        The caller's admission covers the primary; a hedge takes its own
+        llm_admission slot and is skipped when none is free.
+        Returns the generator that produced a chunk first, that chunk (None
+        for an empty completion) and the release() of its hedge slot, if
+        any; the other attempt is cancelled.
+        """
+        attempts = {}  # pending __anext__ task -> generator
+        slots = {}  # hedge generator -> release()
+        
+        def launch():
+            gen = llm_backend.stream(session_id, messages, model)
+            attempts[asyncio.ensure_future(gen.__anext__())] = gen
+            return gen
+        
+        primary = launch()
+        deadline = started + LLM_FIRST_CHUNK_TIMEOUT_SECONDS
+        hedge_at = started + self.hedge_delay() if LLM_HEDGE else None
+        error = None
+        try:
+            while True:
+                if not attempts and hedge_at is not None:
+                    hedge_at = time.monotonic()  # Primary failed fast: hedge now as a retry
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    release = llm_admission.try_acquire(LLM_HEDGE_CLIENT)
+                    if release:
+                        self.hedges += 1
+                        slots[launch()] = release
+                    else:
+                        self.hedges_skipped += 1
+                if not attempts:
+                    raise error
+                wake = min(deadline, hedge_at) if hedge_at is not None else deadline
+                done, _ = await asyncio.wait(
+                    attempts, timeout=max(wake - time.monotonic(), 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    gen = attempts.pop(task)
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        first = None
+                    except Exception as e:
+                        error = e
+                        if gen in slots:
+                            slots.pop(gen)()
+                        continue
+                    if gen is not primary:
+                        self.hedge_wins += 1
+                    return gen, first, slots.pop(gen, None)
+                if not done and time.monotonic() >= deadline:
+                    self.timeouts += 1
+                    raise LlmUnavailableError(f"No LLM response within {LLM_FIRST_CHUNK_TIMEOUT_SECONDS}s")
+        finally:
+            for task, gen in attempts.items():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await gen.aclose()
+                if gen in slots:
+                    slots.pop(gen)()
+    
+    def stats(self) -> dict:
+        return {
+            "breaker": self.breaker.stats(),
+            "timeouts": self.timeouts,
+            "hedging": LLM_HEDGE,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedges_skipped": self.hedges_skipped,  # No admission slot free
+        }
+
+
+guarded_llm = GuardedLlm()
+
+
+@app.on_event("startup")
+async def start_llm_backend():
+    await llm_backend.start()
+
+
+@app.on_event("shutdown")
+async def stop_llm_backend():
+    await llm_backend.close()
+
+# ============= LLM ADMISSION CONTROL =============
+# Caps concurrent upstream LLM calls. Callers beyond the cap queue per client
+# (uid, or IP for guests, as in the rate limiter) and are granted round-robin
+# across clients, so a few heavy users can't starve everyone else.
+# Authenticated users go first, but every LLM_GUEST_SHARE-th grant goes to a
+# waiting guest. Requests that can't start within LLM_QUEUE_TIMEOUT_SECONDS
+# are shed with 503 rather than left to hit client or upstream timeouts.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "256"))  # Waiting requests, all clients
+LLM_QUEUE_MAX_PER_CLIENT = int(os.getenv("LLM_QUEUE_MAX_PER_CLIENT", "3"))  # Running + waiting per client
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+LLM_GUEST_SHARE = int(os.getenv("LLM_GUEST_SHARE", "4"))  # 0 = guests only when no user waits
+
+if LLM_MAX_CONCURRENCY < 1 or LLM_GUEST_SHARE < 0:
+    raise RuntimeError(f"Invalid LLM admission settings: LLM_MAX_CONCURRENCY={LLM_MAX_CONCURRENCY}, LLM_GUEST_SHARE={LLM_GUEST_SHARE}")
+
+
+class LlmAdmissionRejected(Exception):
+    """Raised when an LLM call is shed instead of queued"""
+    pass
+
+
+class LlmAdmission:
+    """Global concurrency cap with per-client fair queuing and guest/user priority"""
+    def __init__(self):
+        self._running = 0
+        self._waiting = 0
+        self._queues = {"user": OrderedDict(), "guest": OrderedDict()}  # client -> deque of futures
+        self._per_client: Dict[str, int] = {}  # Running + waiting
+        self._grants = 0
+        self._queue_ms = deque(maxlen=1000)
+        self.admitted = 0
+        self.shed = 0
+        self.peak_waiting = 0
+    
+    async def acquire(self, client: str, guest: bool):
+        """Wait for a slot; returns an idempotent release(). Raises LlmAdmissionRejected."""
+        if self._per_client.get(client, 0) >= LLM_QUEUE_MAX_PER_CLIENT:
+            self.shed += 1
+            raise LlmAdmissionRejected("Too many NyayAI requests in progress; wait for one to finish")
+        release = self.try_acquire(client)
+        if release:
+            return release
+        if self._waiting >= LLM_QUEUE_MAX:
+            self.shed += 1
+            raise LlmAdmissionRejected("NyayAI is at capacity; please retry shortly")
+        
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues["guest" if guest else "user"].setdefault(client, deque())
+        queue.append(future)
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        self._waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self._waiting)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), LLM_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._withdraw(guest, client, future)
+                self.shed += 1
+                raise LlmAdmissionRejected("NyayAI is busy; please retry shortly")
+        except asyncio.CancelledError:
+            if future.done():
+                self._release(client)  # Granted as the caller went away
+            else:
+                self._withdraw(guest, client, future)
+            raise
+        self._admit((time.monotonic() - started) * 1000)
+        return self._releaser(client)
+    
+    def try_acquire(self, client: str):
+        """A slot only if one is free and nobody is waiting; returns release() or None"""
+        if self._running >= LLM_MAX_CONCURRENCY or self._waiting:
+            return None
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        self._running += 1
+        self._admit(0.0)
+        return self._releaser(client)
+    
+    def _admit(self, queue_ms: float):
+        self.admitted += 1
+        self._queue_ms.append(queue_ms)
+    
+    def _releaser(self, client: str):
+        released = False
+        
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._release(client)
+        return release
+    
+    def _withdraw(self, guest: bool, client: str, future):
+        queues = self._queues["guest" if guest else "user"]
+        queues[client].remove(future)
+        if not queues[client]:
+            del queues[client]
+        self._waiting -= 1
+        self._drop_client(client)
+    
+    def _release(self, client: str):
+        self._running -= 1
+        self._drop_client(client)
+        self._dispatch()
+    
+    def _drop_client(self, client: str):
+        self._per_client[client] -= 1
+        if not self._per_client[client]:
+            del self._per_client[client]
+    
+    def _dispatch(self):
+        """Hand free slots to waiters: users first, every Nth to guests, round-robin by client"""
+        users, guests = self._queues["user"], self._queues["guest"]
+        while self._running < LLM_MAX_CONCURRENCY and self._waiting:
+            self._grants += 1
+            guest_turn = LLM_GUEST_SHARE > 0 and self._grants % LLM_GUEST_SHARE == 0
+            queues = guests if guests and (guest_turn or not users) else users
+            client, waiters = queues.popitem(last=False)
+            future = waiters.popleft()
+            if waiters:
+                queues[client] = waiters  # Back of the line for this client's next request
+            self._waiting -= 1
+            self._running += 1
+            future.set_result(True)
+    
+    def stats(self) -> dict:
+        ordered = sorted(self._queue_ms)
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else 0.0
+        return {
+            "max_concurrency": LLM_MAX_CONCURRENCY,
+            "running": self._running,
+            "waiting": self._waiting,
+            "waiting_guests": sum(len(q) for q in self._queues["guest"].values()),
+            "peak_waiting": self.peak_waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "queue_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99)},
+        }
+
+
+llm_admission = LlmAdmission()
+
+
+async def admit_llm_call(request: Request, user: dict):
+    """Admission for one upstream LLM call; returns release(), or 503 when shed"""
+    try:
+        return await llm_admission.acquire(get_rate_limit_key(request), user.get("is_guest", False))
+    except LlmAdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+# ============= CHAT WRITE-BEHIND =============
+# Chat turns are acknowledged as soon as the reply is ready and persisted by
+# a background flusher in batches. Pending turns are grouped per session in
+# arrival order and flushes never overlap, so each session's writes stay
+# ordered. Readers see pending turns through overlay().
+# Each flush also maintains chat_index: one small record per session with
+# the sidebar fields, so listing chats never loads message arrays.
+CHAT_WRITE_FLUSH_INTERVAL_MS = int(os.getenv("CHAT_WRITE_FLUSH_INTERVAL_MS", "250"))
+CHAT_WRITE_BATCH_SESSIONS = int(os.getenv("CHAT_WRITE_BATCH_SESSIONS", "50"))  # 2 writes each; Firestore caps a batch at 500
+CHAT_INDEX_PREVIEW_CHARS = int(os.getenv("CHAT_INDEX_PREVIEW_CHARS", "200"))  # last_message length in the index
+CHAT_WRITE_MAX_PENDING = int(os.getenv("CHAT_WRITE_MAX_PENDING", "5000"))  # Turns; beyond this writers wait
+
+
+class ChatWriteBehind:
+    """Write-behind buffer for chat turns with per-session ordering"""
+    def __init__(self):
+        self._pending: "OrderedDict[str, dict]" = OrderedDict()  # session_id -> entry
+        self._writing: Dict[str, dict] = {}  # Entries of the batch being written
+        self._pending_turns = 0
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.turns_written = 0
+        self.flushes = 0
+        self.write_failures = 0
+        self.peak_pending_turns = 0
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def shutdown(self):
+        """Stop the flusher and persist everything still pending"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        print(f"✅ Chat write-behind flushed ({self.turns_written} turn(s) written)")
+    
+    async def enqueue(self, user_id: str, session_id: str, messages: List[dict], fields: dict):
+        """Queue messages (and session fields) for session_id; returns without a database round-trip"""
+        now = datetime.now().isoformat()
+        entry = self._pending.get(session_id)
+        if entry is None:
+            entry = self._pending[session_id] = {"user_id": user_id, "created_at": now, "messages": [], "fields": {}}
+        entry["messages"].extend(messages)
+        entry["fields"].update(fields, updated_at=now)
+        self._pending_turns += 1
+        self.peak_pending_turns = max(self.peak_pending_turns, self._pending_turns)
+        if self._task is None:
+            await self.flush()  # No flusher (outside the app lifecycle): write through
+        elif self._pending_turns >= CHAT_WRITE_MAX_PENDING:
+            await self.flush()  # Backpressure while the database lags
+    
+    def overlay(self, session_id: str, chat_data: Optional[dict]) -> Optional[dict]:
+        """Stored session data with turns that are not persisted yet applied on top"""
+        for entry in (self._writing.get(session_id), self._pending.get(session_id)):
+            if entry is None:
+                continue
+            if chat_data is None:
+                chat_data = {"id": session_id, "user_id": entry["user_id"], "session_id": session_id,
+                             "messages": [], "created_at": entry["created_at"]}
+            stored = chat_data.get("messages", [])
+            # The batch being written may already be in the snapshot
+            seen = {(m.get("timestamp"), m.get("role")) for m in stored[-len(entry["messages"]):]}
+            chat_data["messages"] = stored + [m for m in entry["messages"]
+                                              if (m["timestamp"], m["role"]) not in seen]
+            chat_data.update(entry["fields"])
+        return chat_data
+    
+    def index_overlay(self, user_id: str, stored: Dict[str, dict]) -> Dict[str, dict]:
+        """
+        chat_index records for user_id's sessions with unpersisted turns.
+        `stored` maps session_id to records already read; others are fetched.
+        """
+        records = {}
+        for entries in (self._writing, self._pending):
+            for session_id, entry in entries.items():
+                if entry["user_id"] != user_id:
+                    continue
+                base = records.get(session_id) or stored.get(session_id)
+                if base is None:
+                    doc = db.collection("chat_index").document(session_id).get()
+                    base = doc.to_dict() if doc.exists else {}
+                if base.get("updated_at", "") >= entry["fields"]["updated_at"]:
+                    continue  # The batch being written already landed
+                records[session_id] = chat_index_record(
+                    user_id, session_id, entry["messages"][-1]["content"],
+                    base.get("message_count", 0) + len(entry["messages"]), entry["fields"]["updated_at"]
+                )
+        return records
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), CHAT_WRITE_FLUSH_INTERVAL_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Chat write-behind flush failed: {e}")
+    
+    async def flush(self):
+        """Write all pending turns, CHAT_WRITE_BATCH_SESSIONS sessions at a time"""
+        async with self._flush_lock:
+            while self._pending:
+                batch = {}
+                while self._pending and len(batch) < CHAT_WRITE_BATCH_SESSIONS:
+                    session_id, entry = self._pending.popitem(last=False)
+                    batch[session_id] = entry
+                self._writing = batch
+                try:
+                    failed = await asyncio.to_thread(self._write_batch, batch)
+                finally:
+                    self._writing = {}
+                self.flushes += 1
+                for session_id, entry in batch.items():
+                    if session_id in failed:
+                        self._requeue(session_id, entry)
+                    else:
+                        self._pending_turns -= len(entry["messages"]) // 2
+                        self.turns_written += len(entry["messages"]) // 2
+                if failed:
+                    break  # Retry on the next tick rather than spinning
+    
+    def _write_batch(self, batch: Dict[str, dict]) -> set:
+        """Persist the batch in one commit; returns the sessions that failed (all or none)"""
+        try:
+            writes = db.batch()
+            for session_id, entry in batch.items():
+                self._stage_session(writes, session_id, entry)
+            writes.commit()
+        except Exception as e:
+            logger.warning(f"Chat write batch of {len(batch)} session(s) failed, will retry: {e}")
+            self.write_failures += 1
+            return set(batch)
+        return set()
+    
+    def _stage_session(self, writes, session_id: str, entry: dict):
+        """Stage the chat document append and its chat_index record"""
+        chat_ref = db.collection("chats").document(session_id)
+        index_ref = db.collection("chat_index").document(session_id)
+        
+        index = index_ref.get()
+        if index.exists:
+            exists, message_count = True, index.to_dict().get("message_count", 0)
+        else:
+            # New session, or one stored before the index existed
+            chat = chat_ref.get()
+            exists = chat.exists
+            message_count = len(chat.to_dict().get("messages", [])) if exists else 0
+        
+        if exists:
+            writes.update(chat_ref, {"messages": ArrayUnion(entry["messages"]), **entry["fields"]})
+        else:
+            writes.set(chat_ref, {
+                "user_id": entry["user_id"],
+                "session_id": session_id,
+                "messages": entry["messages"],
+                "created_at": entry["created_at"],
+                **entry["fields"]
+            })
+        writes.set(index_ref, chat_index_record(
+            entry["user_id"], session_id, entry["messages"][-1]["content"],
+            message_count + len(entry["messages"]), entry["fields"]["updated_at"]
+        ), merge=True)
+    
+    def _requeue(self, session_id: str, entry: dict):
+        """Put a failed entry back ahead of anything queued for the session since"""
+        newer = self._pending.pop(session_id, None)
+        if newer:
+            entry["messages"].extend(newer["messages"])
+            entry["fields"].update(newer["fields"])
+        self._pending[session_id] = entry
+        self._pending.move_to_end(session_id, last=False)
+    
+    def stats(self) -> dict:
+        return {
+            "pending_sessions": len(self._pending),
+            "pending_turns": self._pending_turns,
+            "peak_pending_turns": self.peak_pending_turns,
+            "turns_written": self.turns_written,
+            "flushes": self.flushes,
+            "write_failures": self.write_failures,
+        }
+
+
+def chat_index_record(user_id: str, session_id: str, last_message: str, message_count: int,
+                      updated_at: str) -> dict:
+    return {
+        "user_id": user_id,
+        "session_id": session_id,
+        "last_message": last_message[:CHAT_INDEX_PREVIEW_CHARS],
+        "message_count": message_count,
+        "updated_at": updated_at,
+    }
+
+
+def backfill_chat_index():
+    """One-off: index sessions stored before chat_index existed"""
+    marker = db.collection("_migrations").document("chat_index")
+    if marker.get().exists:
+        return
+    indexed = 0
+    for chat in db.collection("chats").stream():
+        chat_data = chat.to_dict()
+        index_ref = db.collection("chat_index").document(chat.id)
+        messages = chat_data.get("messages", [])
+        if index_ref.get().exists or not messages:
+            continue
+        index_ref.set(chat_index_record(
+            chat_data.get("user_id"), chat_data.get("session_id", chat.id), messages[-1].get("content", ""),
+            len(messages), chat_data.get("updated_at")
+        ))
+        indexed += 1
+    marker.set({"completed_at": datetime.now().isoformat()})
+    print(f"✅ Chat index backfilled: {indexed} session(s)")
+
+
+chat_writes = ChatWriteBehind()
+
+
+@app.on_event("startup")
+async def start_chat_writes():
+    await asyncio.to_thread(backfill_chat_index)
+    chat_writes.start()
+
+
+@app.on_event("shutdown")
+async def flush_chat_writes():
+    await chat_writes.shutdown()
+
 # ============= NYAYAI CHAT ENDPOINTS =============
 
 LEGAL_SYSTEM_PROMPT = """You are NyayAI, a helpful legal information assistant for India. 
@@ -950,80 +2243,804 @@ KEY AREAS:
 Always end responses with: "For personalized legal advice, please consult a verified lawyer on our platform."
 """
 
-@app.post("/api/chat/nyayai")
-@limiter.limit("20/minute")  # Rate limit: 20 requests per minute
-async def chat_with_nyayai(
-    request: Request,
-    message: ChatMessage,
-    user = Depends(verify_token)
-):
-    """Chat with NyayAI legal assistant"""
-    user_id = user["uid"]
-    session_id = message.session_id or f"{user_id}_{int(datetime.now().timestamp())}"
-    
-    try:
-        # Initialize LlmChat with Emergent Integration
-        chat = LlmChat(
-            api_key=os.getenv("EMERGENT_LLM_KEY"),
-            session_id=session_id,
-            system_message=LEGAL_SYSTEM_PROMPT
-        )
-        chat.with_model("openai", "gpt-4o-mini")
-        
-        # Send message to AI
-        user_message = UserMessage(text=message.message)
-        response = await chat.send_message(user_message)
-        
-        # Store chat in database
-        chat_ref = db.collection("chats").document(session_id)
-        chat_data = chat_ref.get()
-        
-        new_messages = [
-            {"role": "user", "content": message.message, "timestamp": datetime.now().isoformat()},
-            {"role": "assistant", "content": response, "timestamp": datetime.now().isoformat()}
-        ]
-        
-        if chat_data.exists:
-            chat_ref.update({
-                "messages": ArrayUnion(new_messages),
-                "updated_at": datetime.now().isoformat()
-            })
-        else:
-            chat_ref.set({
-                "user_id": user_id,
-                "session_id": session_id,
-                "messages": new_messages,
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat()
-            })
-        
-        return {
-            "success": True,
-            "response": response,
-            "session_id": session_id
-        }
-    except Exception as e:
-        # Fallback response if LLM fails
-        return {
-            "success": True,
-            "response": f"I apologize, but I'm having trouble connecting right now. Your question was: '{message.message}'. Please try again in a moment, or consult with a lawyer on our platform for immediate assistance.",
-            "session_id": session_id,
-            "error": str(e)
-        }
 
-@app.get("/api/chat/history/{session_id}")
-async def get_chat_history(session_id: str, user = Depends(verify_token)):
-    """Get chat history for a session"""
-    user_id = user["uid"]
-    
+def chat_fallback_response(question: str) -> str:
+    """Shown when the LLM is unreachable"""
+    return f"I apologize, but I'm having trouble connecting right now. Your question was: '{question}'. Please try again in a moment, or consult with a lawyer on our platform for immediate assistance."
+
+
+def load_chat_session(session_id: str, user: dict) -> Optional[dict]:
+    """Session including unpersisted turns (None if new); another user's session is refused"""
     doc = db.collection("chats").document(session_id).get()
-    
-    if doc.exists:
-        chat_data = doc.to_dict()
-        # Verify ownership (skip for guests viewing their own session)
-        if not user.get("is_guest") and chat_data.get("user_id") != user_id:
-            raise HTTPException(status_code=403, detail="Access denied")
+    chat_data = chat_writes.overlay(session_id, doc.to_dict() if doc.exists else None)
+    if chat_data is None:
+        return None
+    # Same ownership rule as /api/chat/history
+    if not user.get("is_guest") and chat_data.get("user_id") != user["uid"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return chat_data
+
+
+def new_chat_session_id(user_id: str) -> str:
+    # Random, not a timestamp: every guest shares one uid
+    return f"{user_id}_{uuid.uuid4().hex}"
+
+
+def prompt_history(chat: Optional[dict], user: dict) -> Optional[dict]:
+    """
+    The stored session to continue in the prompt, or None to answer the turn
+    on its own. Only the caller's own sessions qualify; guests all share one
+    uid, so a stored session can never be attributed to a particular guest.
+    """
+    if not chat or user.get("is_guest") or chat.get("user_id") != user["uid"]:
+        return None
+    return chat
+
+
+# First-turn answers depend only on the system prompt, model and question, so
+# they can be shared between users. Keyed on the normalised question.
+CHAT_FAQ_CACHE_SIZE = int(os.getenv("CHAT_FAQ_CACHE_SIZE", "1000"))
+CHAT_FAQ_CACHE_TTL_SECONDS = int(os.getenv("CHAT_FAQ_CACHE_TTL_SECONDS", str(24 * 3600)))
+CHAT_FAQ_MAX_QUESTION_CHARS = int(os.getenv("CHAT_FAQ_MAX_QUESTION_CHARS", "300"))  # Long questions rarely repeat
+
+chat_faq_cache = LRUCache(max_entries=CHAT_FAQ_CACHE_SIZE, ttl=CHAT_FAQ_CACHE_TTL_SECONDS)
+
+
+def normalize_question(text: str) -> str:
+    """Case-, whitespace- and punctuation-insensitive form of a question"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    return " ".join(text.split())
+
+
+def shared_answer_key(chat: Optional[dict], question: str, model: str,
+                      laws: Optional[List[dict]] = None) -> Optional[str]:
+    """
+    Key under which a first-turn answer can be shared between users (FAQ
+    cache, single-flight), or None for turns whose answer is private.
+    Covers the whole system prompt, including the catalogue entries quoted
+    in it, so an edited or newly matching entry isn't answered from cache.
+    """
+    if chat and chat.get("messages"):
+        return None  # Follow-up turn
+    normalized = normalize_question(question)
+    if not normalized or len(normalized) > CHAT_FAQ_MAX_QUESTION_CHARS:
+        return None
+    context = "\0".join(law_snippet(law) for law in laws or [])
+    digest = hashlib.sha256(f"{LEGAL_SYSTEM_PROMPT}\0{context}\0{LLM_BACKEND}:{LLM_PROVIDER}/{model}".encode()).hexdigest()
+    return f"{digest[:16]}:{normalized}"
+
+
+# Single-flight: concurrent identical first-turn questions (a news event
+# sends hundreds within seconds) share one upstream completion. Each caller
+# replays the chunks as they arrive and stores the exchange in its own session.
+class ChatFlight:
+    """One upstream completion streamed to every caller that joined it"""
+    def __init__(self, source):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self._changed = asyncio.Condition()
+        self.task = asyncio.create_task(self._run(source))
+    
+    async def _run(self, source):
+        try:
+            async for text in source:
+                async with self._changed:
+                    self.chunks.append(text)
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        except asyncio.CancelledError:
+            # A caller that joined but hadn't started following yet
+            self.error = LlmUnavailableError("LLM call cancelled")
+            raise
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+    
+    async def follow(self):
+        """Yield every chunk from the start; raise if the completion failed"""
+        self.followers += 1
+        sent = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: sent < len(self.chunks) or self.done)
+                while sent < len(self.chunks):
+                    sent += 1
+                    yield self.chunks[sent - 1]
+                if self.done:
+                    if self.error:
+                        raise self.error
+                    return
+        finally:
+            self.followers -= 1
+            if self.followers == 0 and not self.done:
+                self.task.cancel()  # Last caller went away; stop the upstream call
+
+
+class ChatFlights:
+    """In-flight completions by shared-answer key; entries leave when the call ends"""
+    def __init__(self):
+        self._flights: Dict[str, ChatFlight] = {}
+        self.started = 0
+        self.joined = 0
+    
+    def active(self, key: Optional[str]) -> Optional[ChatFlight]:
+        """The in-flight completion for key, if any"""
+        return self._flights.get(key) if key else None
+    
+    def join(self, key: Optional[str], start) -> ChatFlight:
+        """Join the flight for key, or start one from start() (always, when key is None)"""
+        flight = self._flights.get(key) if key else None
+        if flight is not None:
+            self.joined += 1
+            return flight
+        flight = ChatFlight(start())
+        self.started += 1
+        if key:
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._flights.pop(key, None))
+        return flight
+    
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "started": self.started, "joined": self.joined}
+
+
+chat_flights = ChatFlights()
+
+
+async def start_chat_flight(request: Request, user: dict, key: Optional[str], start):
+    """
+    Join the in-flight completion for key, or take an admission slot and
+    start one. Returns (flight, release); release is None for joiners.
+    Nothing is awaited between the final check and the join, so every
+    upstream call is started by a caller holding a slot. 503 when shed.
+    """
+    release = None
+    if not chat_flights.active(key):
+        release = await admit_llm_call(request, user)
+        if chat_flights.active(key):
+            release()  # Started by another caller while this one queued
+            release = None
+    return chat_flights.join(key, start), release
+
+
+# Conversation window: history sent to the model is capped at CHAT_CONTEXT_TOKEN_BUDGET: recent
+# turns go verbatim, older ones are folded into a rolling summary stored on
+# the session. When the window overflows it slides back to half the budget,
+# so the summary is regenerated once every few turns, not on every message.
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "3000"))
+CHAT_SUMMARY_MAX_WORDS = int(os.getenv("CHAT_SUMMARY_MAX_WORDS", "250"))
+
+CHAT_SUMMARY_PROMPT = f"""Summarise the conversation below between a user and NyayAI, a legal information assistant for India, in at most {CHAT_SUMMARY_MAX_WORDS} words.
+If an earlier summary is given, merge it with the new messages.
+Keep every fact the user shared about their situation (parties, places, dates, amounts, documents), the questions asked and the guidance already given.
+Write in the language the user writes in. Output only the summary."""
+
+
+def _load_token_encoding():
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(LLM_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:  # Not installed, or BPE files can't be fetched offline
+        print(f"🔶 tiktoken unavailable ({e}); estimating chat tokens from length")
+        return None
+
+chat_token_encoding = _load_token_encoding()
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text for LLM_MODEL (about 4 characters each without tiktoken)"""
+    if chat_token_encoding is not None:
+        return len(chat_token_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def window_start(history: List[dict], start: int) -> int:
+    """
+    Index of the first message sent verbatim. Stays at `start` while the
+    window fits the budget; otherwise slides forward to a user message so
+    that what is left fits half the budget.
+    """
+    sizes = [count_tokens(m["content"]) + 4 for m in history]  # ~4 tokens of per-message framing
+    if sum(sizes[start:]) <= CHAT_CONTEXT_TOKEN_BUDGET:
+        return start
+    new_start, kept = len(history), 0
+    for i in range(len(history) - 1, start - 1, -1):
+        kept += sizes[i]
+        if kept > CHAT_CONTEXT_TOKEN_BUDGET // 2:
+            break
+        new_start = i
+    while new_start < len(history) and history[new_start]["role"] != "user":
+        new_start += 1
+    return new_start
+
+
+async def summarize_history(session_id: str, summary: str, messages: List[dict]) -> str:
+    """Fold messages into the previous rolling summary"""
+    transcript = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    if summary:
+        transcript = f"EARLIER SUMMARY:\n{summary}\n\nNEW MESSAGES:\n{transcript}"
+    return await chat_routes.complete("fast", f"{session_id}_summary", [
+        {"role": "system", "content": CHAT_SUMMARY_PROMPT},
+        {"role": "user", "content": transcript}
+    ])
+
+
+async def build_chat_prompt(session_id: str, chat: Optional[dict], question: str,
+                            laws: Optional[List[dict]] = None):
+    """
+    Messages for the next turn, plus the summary fields to store on the
+    session when the window slid (None otherwise). `laws` are catalogue
+    entries relevant to the question, quoted in the system prompt.
+    """
+    chat = chat or {}
+    history = [{"role": m["role"], "content": m["content"]} for m in chat.get("messages", [])]
+    summary = chat.get("summary", "")
+    summarized = chat.get("summary_upto", 0)
+    
+    start = window_start(history, summarized)
+    summary_update = None
+    if start > summarized:
+        try:
+            summary = await summarize_history(session_id, summary, history[summarized:start])
+            summary_update = {"summary": summary, "summary_upto": start}
+        except Exception as e:
+            # Keep the prompt bounded anyway; the skipped turns are retried next time
+            logger.warning(f"Chat summary for {session_id} failed: {e}")
+    
+    system = LEGAL_SYSTEM_PROMPT
+    if laws:
+        entries = "\n".join(f"- {law_snippet(law)}" for law in laws)
+        system += f"\nRELEVANT ENTRIES FROM THE SUNOLEGAL LAWS CATALOGUE (use them where they apply):\n{entries}\n"
+    if summary:
+        system += f"\nSUMMARY OF THE EARLIER CONVERSATION:\n{summary}\n"
+    return [
+        {"role": "system", "content": system},
+        *history[start:],
+        {"role": "user", "content": question}
+    ], summary_update
+
+
+# Model routing: each turn goes to the "fast" or the "strong" model. The
+# router is chosen by CHAT_ROUTER; "heuristic" scores the question locally
+# (length, legal-complexity keywords, conversation depth), so routing costs
+# no tokens and well under a millisecond. Summaries always use "fast".
+CHAT_ROUTER = os.getenv("CHAT_ROUTER", "heuristic").lower()  # heuristic | fast | strong
+LLM_MODEL_FAST = os.getenv("LLM_MODEL_FAST", LLM_MODEL)
+LLM_MODEL_STRONG = os.getenv("LLM_MODEL_STRONG", "gpt-4o")
+# USD per million input/output tokens, for cost accounting (defaults: gpt-4o-mini, gpt-4o)
+LLM_MODEL_FAST_PRICE_IN = float(os.getenv("LLM_MODEL_FAST_PRICE_IN", "0.15"))
+LLM_MODEL_FAST_PRICE_OUT = float(os.getenv("LLM_MODEL_FAST_PRICE_OUT", "0.60"))
+LLM_MODEL_STRONG_PRICE_IN = float(os.getenv("LLM_MODEL_STRONG_PRICE_IN", "2.50"))
+LLM_MODEL_STRONG_PRICE_OUT = float(os.getenv("LLM_MODEL_STRONG_PRICE_OUT", "10.00"))
+CHAT_ROUTE_LONG_TOKENS = int(os.getenv("CHAT_ROUTE_LONG_TOKENS", "80"))  # Question length that alone means "strong"
+CHAT_ROUTE_DEEP_TURNS = int(os.getenv("CHAT_ROUTE_DEEP_TURNS", "6"))  # Earlier user turns that add to the score
+CHAT_ROUTE_STRONG_SCORE = int(os.getenv("CHAT_ROUTE_STRONG_SCORE", "2"))
+
+# Signs of a situation-specific question rather than a definition lookup
+CHAT_COMPLEX_TERMS = (
+    "dispute", "litigation", "appeal", "partition", "inheritance", "succession", "ancestral",
+    "breach", "liability", "compensation", "damages", "divorce", "custody", "maintenance",
+    "arbitration", "injunction", "bail", "anticipatory", "jurisdiction", "stay order",
+    "section", "versus", " vs ", "compare", "difference between", "draft", "strategy",
+    "multiple", "co-owner", "power of attorney", "encroach", "fraud", "cheque bounce",
+)
+CHAT_SIMPLE_PREFIXES = ("what is", "what are", "what does", "define", "meaning of", "full form", "who is", "who can")
+
+
+class HeuristicChatRouter:
+    """Scores length, complexity keywords, question count and turn depth"""
+    name = "heuristic"
+    
+    def route(self, chat: Optional[dict], question: str) -> Tuple[str, str]:
+        """(route, reason) for the next turn"""
+        tokens = count_tokens(question)
+        text = f" {normalize_question(question)} "
+        score, reasons = 0, []
+        if tokens >= CHAT_ROUTE_LONG_TOKENS:
+            score += 2
+            reasons.append("long")
+        elif tokens >= CHAT_ROUTE_LONG_TOKENS // 2:
+            score += 1
+            reasons.append("medium")
+        terms = sum(term in text for term in CHAT_COMPLEX_TERMS)
+        if terms:
+            score += min(terms, 2)
+            reasons.append(f"terms={terms}")
+        if question.count("?") > 1:
+            score += 1
+            reasons.append("questions")
+        turns = sum(1 for m in (chat or {}).get("messages", []) if m["role"] == "user")
+        if turns >= CHAT_ROUTE_DEEP_TURNS:
+            score += 1
+            reasons.append("deep")
+        if text.strip().startswith(CHAT_SIMPLE_PREFIXES) and tokens < CHAT_ROUTE_LONG_TOKENS // 2:
+            score -= 1
+            reasons.append("lookup")
+        route = "strong" if score >= CHAT_ROUTE_STRONG_SCORE else "fast"
+        return route, ",".join(reasons) or "short"
+
+
+class FixedChatRouter:
+    """Sends every turn to one route, which is also its name"""
+    def __init__(self, route: str):
+        self.name = route
+    
+    def route(self, chat: Optional[dict], question: str) -> Tuple[str, str]:
+        return self.name, "fixed"
+
+
+class ChatModelRoutes:
+    """Route -> model calls through guarded_llm, with per-route latency, token and cost accounting"""
+    def __init__(self, router):
+        self.router = router
+        self.models = {
+            "fast": (LLM_MODEL_FAST, LLM_MODEL_FAST_PRICE_IN, LLM_MODEL_FAST_PRICE_OUT),
+            "strong": (LLM_MODEL_STRONG, LLM_MODEL_STRONG_PRICE_IN, LLM_MODEL_STRONG_PRICE_OUT),
+        }
+        self._routes = {
+            name: {
+                "decisions": 0, "calls": 0, "failures": 0,
+                "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0,
+                "first_chunk_ms": deque(maxlen=500), "total_ms": deque(maxlen=500),
+            }
+            for name in self.models
+        }
+    
+    def model(self, route: str) -> str:
+        return self.models[route][0]
+    
+    def pick(self, chat: Optional[dict], question: str) -> str:
+        """Route for the next turn of chat"""
+        route, reason = self.router.route(chat, question)
+        self._routes[route]["decisions"] += 1
+        logger.info(f"NyayAI route: {route} ({reason})")
+        return route
+    
+    async def stream(self, route: str, session_id: str, messages: List[dict]):
+        """guarded_llm.stream on the route's model, accounted to the route"""
+        model, price_in, price_out = self.models[route]
+        stats = self._routes[route]
+        stats["calls"] += 1
+        started = time.monotonic()
+        parts = []
+        completed = False
+        try:
+            async for text in guarded_llm.stream(session_id, messages, model):
+                if not parts:
+                    stats["first_chunk_ms"].append((time.monotonic() - started) * 1000)
+                parts.append(text)
+                yield text
+            completed = True
+            stats["total_ms"].append((time.monotonic() - started) * 1000)
+        except Exception:
+            stats["failures"] += 1
+            raise
+        finally:
+            # Billed for what was sent and received, even if the call was cut short
+            answered = completed or parts
+            input_tokens = sum(count_tokens(m["content"]) + 4 for m in messages) if answered else 0
+            output_tokens = count_tokens("".join(parts)) if parts else 0
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cost_usd"] += (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+    
+    async def complete(self, route: str, session_id: str, messages: List[dict]) -> str:
+        return "".join([text async for text in self.stream(route, session_id, messages)])
+    
+    def stats(self) -> dict:
+        def pct(samples, p):
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else 0.0
+        routes = {}
+        for name, stats in self._routes.items():
+            routes[name] = {
+                "model": self.models[name][0],
+                **{key: stats[key] for key in ("decisions", "calls", "failures", "input_tokens", "output_tokens")},
+                "cost_usd": round(stats["cost_usd"], 6),
+                "first_chunk_ms": {"p50": pct(stats["first_chunk_ms"], 0.50), "p95": pct(stats["first_chunk_ms"], 0.95)},
+                "total_ms": {"p50": pct(stats["total_ms"], 0.50), "p95": pct(stats["total_ms"], 0.95)},
+            }
+        return {"router": self.router.name, "routes": routes}
+
+
+if CHAT_ROUTER not in ("heuristic", "fast", "strong"):
+    raise RuntimeError(f"Invalid CHAT_ROUTER: {CHAT_ROUTER!r}")
+chat_routes = ChatModelRoutes(HeuristicChatRouter() if CHAT_ROUTER == "heuristic" else FixedChatRouter(CHAT_ROUTER))
+
+
+# Law retrieval: an in-process BM25 index over the `laws` collection. Short
+# first-turn questions that only ask for the eligibility, how_to_apply or
+# required_docs of one catalogue entry (no conditions or other details) are
+# answered from those fields with no LLM call; other turns get the top-k
+# matching entries as prompt context.
+LAWS_INDEX_REFRESH_SECONDS = int(os.getenv("LAWS_INDEX_REFRESH_SECONDS", "300"))  # Picks up catalogue edits
+LAWS_PROMPT_TOP_K = int(os.getenv("LAWS_PROMPT_TOP_K", "2"))  # Entries added to the system prompt (0 = none)
+LAWS_ANSWER_MAX_TOKENS = int(os.getenv("LAWS_ANSWER_MAX_TOKENS", "30"))  # Longer questions always go to the LLM
+LAWS_ANSWER_MARGIN = float(os.getenv("LAWS_ANSWER_MARGIN", "1.5"))  # Best match must beat the runner-up by this factor
+LAWS_ANSWER_ENABLED = os.getenv("LAWS_ANSWER_ENABLED", "true").lower() == "true"
+
+LAW_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from get how i if in is it me my of on or "
+    "should the to what when where which who will with you your about under this that".split()
+)
+# Too common in titles to identify an entry on their own
+LAW_GENERIC_TERMS = frozenset("act law india indian right scheme yojana info all".split())
+LAW_FIELD_WEIGHTS = {"title": 3, "category": 2, "description": 1, "key_points": 1, "eligibility": 1}
+LAW_QUESTION_INTENTS = {
+    "eligibility": ("eligib", "who can", "qualif", "criteria", "entitled", "who is covered"),
+    "how_to_apply": ("how to apply", "how do i apply", "how can i apply", "apply for", "how to file",
+                     "how do i file", "how can i file", "where to file", "procedure", "process"),
+    "required_docs": ("document", "docs", "papers", "paperwork", "proof"),
+}
+# Words that only say what is being asked; anything else left in a question
+# besides the entry's name is a detail the canned answer can't address
+LAW_INTENT_TERMS = frozenset(
+    "eligible eligibility qualify criteria entitled covered apply application file filing procedure process "
+    "document docs paper paperwork proof required need needed submit step list tell know".split()
+)
+# Conditions and extra clauses ("if I already own a house", "..., and ...") need the LLM
+LAW_CLAUSE_MARKERS = (" if ", " and ", " but ", " unless ", " already ", " whether ", " or ", " against ")
+LAW_ANSWER_FOOTER = "For personalized legal advice, please consult a verified lawyer on our platform."
+
+
+def law_terms(text: str) -> List[str]:
+    """Index terms: normalised words without stopwords, plural -s stripped"""
+    terms = []
+    for word in normalize_question(text).split():
+        if word in LAW_STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def law_names(law: dict) -> set:
+    """Terms that identify an entry: its title and category, minus generic words"""
+    return set(law_terms(f"{law.get('title', '')} {law.get('category', '')}")) - LAW_GENERIC_TERMS
+
+
+def law_snippet(law: dict) -> str:
+    """One-paragraph summary of a catalogue entry for the system prompt"""
+    parts = [f"{law.get('title', '')} ({law.get('type', 'law')}, {law.get('state', 'All India')}): {law.get('description', '')}"]
+    if law.get("eligibility"):
+        parts.append(f"Eligibility: {law['eligibility']}.")
+    if law.get("how_to_apply"):
+        parts.append(f"How to apply: {law['how_to_apply']}.")
+    if law.get("required_docs"):
+        parts.append(f"Documents: {', '.join(law['required_docs'])}.")
+    return " ".join(parts)
+
+
+def law_answer(law: dict, intents: List[str]) -> str:
+    """Answer to a catalogue question, built from the entry's structured fields"""
+    lines = [f"**{law.get('title', '')}**", "", law.get("description", ""), ""]
+    if "eligibility" in intents:
+        lines.append(f"**Who is eligible:** {law.get('eligibility')}")
+    if "how_to_apply" in intents:
+        lines.append(f"**How to apply:** {law.get('how_to_apply')}")
+    if "required_docs" in intents:
+        lines.append("**Documents required:**")
+        lines.extend(f"- {doc}" for doc in law.get("required_docs", []))
+    lines += ["", LAW_ANSWER_FOOTER]
+    return "\n".join(lines)
+
+
+class LawIndex:
+    """BM25 over weighted law fields, rebuilt from the `laws` collection every LAWS_INDEX_REFRESH_SECONDS"""
+    K1 = 1.2
+    B = 0.75
+    
+    def __init__(self):
+        self._docs = []  # (law, term counts, length, identifying terms)
+        self._idf: Dict[str, float] = {}
+        self._avg_length = 1.0
+        self._task = None
+        self.built_at = None
+        self.answered = 0
+        self.augmented = 0
+        self.misses = 0
+        self._lookup_us = deque(maxlen=1000)
+    
+    def build(self):
+        """Read the catalogue and swap in a fresh index (blocking; run in a thread)"""
+        docs = []
+        df: Dict[str, int] = {}
+        for doc in db.collection("laws").stream():
+            law = doc.to_dict()
+            counts: Dict[str, int] = {}
+            for field, weight in LAW_FIELD_WEIGHTS.items():
+                value = law.get(field) or ""
+                text = " ".join(value) if isinstance(value, list) else str(value)
+                for term in law_terms(text):
+                    counts[term] = counts.get(term, 0) + weight
+            names = law_names(law)
+            docs.append((law, counts, sum(counts.values()), names))
+            for term in counts:
+                df[term] = df.get(term, 0) + 1
+        n = len(docs)
+        self._idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+        self._avg_length = sum(length for _, _, length, _ in docs) / n if n else 1.0
+        self._docs = docs
+        self.built_at = time.time()
+    
+    async def start(self):
+        await asyncio.to_thread(self.build)
+        print(f"✅ Law retrieval index built ({len(self._docs)} entries)")
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+    
+    async def _refresh(self):
+        while True:
+            await asyncio.sleep(LAWS_INDEX_REFRESH_SECONDS)
+            try:
+                await asyncio.to_thread(self.build)
+            except Exception as e:
+                logger.error(f"Law index refresh failed: {e}")
+    
+    def search(self, question: str) -> List[Tuple[float, dict, bool]]:
+        """(score, law, names the entry) for matching laws, best first"""
+        if self.built_at is None:
+            self.build()  # Used outside the app lifecycle (scripts, tests)
+        terms = set(law_terms(question))
+        results = []
+        for law, counts, length, names in self._docs:
+            score = 0.0
+            for term in terms:
+                tf = counts.get(term)
+                if tf:
+                    norm = tf + self.K1 * (1 - self.B + self.B * length / self._avg_length)
+                    score += self._idf[term] * tf * (self.K1 + 1) / norm
+            if score > 0:
+                results.append((score, law, bool(terms & names)))
+        results.sort(key=lambda result: result[0], reverse=True)
+        return results
+    
+    def lookup(self, question: str, follow_up: bool = False) -> Tuple[Optional[dict], List[dict]]:
+        """
+        (answer, context) for a question: answer is {"law_id", "text"} when
+        the catalogue answers it outright, otherwise context holds up to
+        LAWS_PROMPT_TOP_K relevant entries for the prompt. Follow-up turns
+        depend on the conversation, so they are never answered outright.
+        """
+        started = time.perf_counter()
+        try:
+            results = self.search(question)
+            if not results:
+                self.misses += 1
+                return None, []
+            best_score, best, named = results[0]
+            text = f" {normalize_question(question)} "
+            intents = [field for field, cues in LAW_QUESTION_INTENTS.items()
+                       if best.get(field) and any(cue in text for cue in cues)]
+            details = set(law_terms(question)) - law_names(best) - LAW_GENERIC_TERMS - LAW_INTENT_TERMS
+            confident = (
+                LAWS_ANSWER_ENABLED and intents and named and not follow_up and not details
+                and count_tokens(question) <= LAWS_ANSWER_MAX_TOKENS
+                and not any(marker in text for marker in LAW_CLAUSE_MARKERS)
+                and question.count("?") <= 1 and not any(mark in question for mark in ",;")
+                and not any(term in text for term in CHAT_COMPLEX_TERMS)  # Situation-specific: needs the LLM
+                and (len(results) == 1 or best_score >= LAWS_ANSWER_MARGIN * results[1][0])
+            )
+            if confident:
+                self.answered += 1
+                return {"law_id": best.get("id"), "text": law_answer(best, intents)}, []
+            context = [law for score, law, _ in results[:LAWS_PROMPT_TOP_K] if score >= best_score / 2]
+            if context:
+                self.augmented += 1
+            return None, context
+        finally:
+            self._lookup_us.append((time.perf_counter() - started) * 1_000_000)
+    
+    def stats(self) -> dict:
+        ordered = sorted(self._lookup_us)
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else 0.0
+        return {
+            "entries": len(self._docs),
+            "age_seconds": round(time.time() - self.built_at) if self.built_at else None,
+            "answered": self.answered,
+            "augmented": self.augmented,
+            "misses": self.misses,
+            "lookup_us": {"p50": pct(0.50), "p95": pct(0.95)},
+        }
+
+
+law_index = LawIndex()
+
+
+@app.on_event("startup")
+async def start_law_index():
+    await law_index.start()
+
+
+@app.on_event("shutdown")
+async def stop_law_index():
+    await law_index.stop()
+
+
+async def save_chat_exchange(user_id: str, session_id: str, question: str, response: str,
+                             summary_update: Optional[dict] = None):
+    """Queue a user/assistant exchange for the session; persisted by chat_writes"""
+    new_messages = [
+        {"role": "user", "content": question, "timestamp": datetime.now().isoformat()},
+        {"role": "assistant", "content": response, "timestamp": datetime.now().isoformat()}
+    ]
+    await chat_writes.enqueue(user_id, session_id, new_messages, summary_update or {})
+
+@app.post("/api/chat/nyayai")
+@limiter.limit("20/minute")  # Rate limit: 20 requests per minute
+async def chat_with_nyayai(
+    request: Request,
+    message: ChatMessage,
+    user = Depends(verify_token)
+):
+    """Chat with NyayAI legal assistant"""
+    user_id = user["uid"]
+    session_id = message.session_id or new_chat_session_id(user_id)
+    
+    stored = load_chat_session(session_id, user)
+    chat = prompt_history(stored, user)
+    catalogue, laws = law_index.lookup(message.message, follow_up=bool(stored and stored.get("messages")))
+    if catalogue:
+        await save_chat_exchange(user_id, session_id, message.message, catalogue["text"])
+        return {
+            "success": True,
+            "response": catalogue["text"],
+            "session_id": session_id,
+            "cached": False,
+            "law_id": catalogue["law_id"]
+        }
+    
+    route = chat_routes.pick(chat, message.message)
+    shared_key = shared_answer_key(chat, message.message, chat_routes.model(route), laws)
+    response = chat_faq_cache.get(shared_key) if shared_key else None
+    cached = response is not None
+    summary_update = None
+    
+    async def upstream():
+        nonlocal summary_update
+        messages, summary_update = await build_chat_prompt(session_id, chat, message.message, laws)
+        async for text in chat_routes.stream(route, session_id, messages):
+            yield text
+    
+    # Cache hits and joined flights make no upstream call of their own
+    flight, release = (None, None) if cached else await start_chat_flight(request, user, shared_key, upstream)
+    
+    try:
+        if not cached:
+            response = "".join([text async for text in flight.follow()])
+            if shared_key:
+                chat_faq_cache.put(shared_key, response)
+        
+        # Store chat in database
+        await save_chat_exchange(user_id, session_id, message.message, response, summary_update)
+        
+        return {
+            "success": True,
+            "response": response,
+            "session_id": session_id,
+            "cached": cached
+        }
+    except Exception as e:
+        # Fallback response if LLM fails
+        return {
+            "success": True,
+            "response": chat_fallback_response(message.message),
+            "session_id": session_id,
+            "error": str(e)
+        }
+    finally:
+        if release:
+            release()
+
+@app.post("/api/chat/nyayai/stream")
+@limiter.limit("20/minute")  # Rate limit: 20 requests per minute
+async def stream_chat_with_nyayai(
+    request: Request,
+    message: ChatMessage,
+    user = Depends(verify_token)
+):
+    """
+    Chat with NyayAI over server-sent events: `token` events carry text as
+    it is generated, then a single `done` event. The exchange is stored
+    once the response is complete; failed or abandoned streams are not.
+    """
+    user_id = user["uid"]
+    session_id = message.session_id or new_chat_session_id(user_id)
+    
+    stored = load_chat_session(session_id, user)
+    chat = prompt_history(stored, user)
+    catalogue, laws = law_index.lookup(message.message, follow_up=bool(stored and stored.get("messages")))
+    route = None if catalogue else chat_routes.pick(chat, message.message)
+    shared_key = shared_answer_key(chat, message.message, chat_routes.model(route), laws) if route else None
+    cached = chat_faq_cache.get(shared_key) if shared_key else None
+    summary_update = None
+    
+    async def upstream():
+        nonlocal summary_update
+        messages, summary_update = await build_chat_prompt(session_id, chat, message.message, laws)
+        async for text in chat_routes.stream(route, session_id, messages):
+            yield text
+    
+    # Joined or admitted before the response starts, so shedding is a real 503
+    flight, release = None, None
+    if not catalogue and cached is None:
+        flight, release = await start_chat_flight(request, user, shared_key, upstream)
+    
+    def abandon():
+        if release:
+            release()
+        if flight and not flight.followers and not flight.done:
+            flight.task.cancel()  # The body never started; nobody will follow
+    
+    async def event_stream():
+        try:
+            async for event in chat_events():
+                yield event
+        finally:
+            if release:
+                release()
+    
+    async def chat_events():
+        if catalogue:
+            await save_chat_exchange(user_id, session_id, message.message, catalogue["text"])
+            yield f"event: token\ndata: {json.dumps({'text': catalogue['text']})}\n\n"
+            yield f"event: done\ndata: {json.dumps({'session_id': session_id, 'cached': False, 'law_id': catalogue['law_id']})}\n\n"
+            return
+        
+        if cached is not None:
+            await save_chat_exchange(user_id, session_id, message.message, cached)
+            yield f"event: token\ndata: {json.dumps({'text': cached})}\n\n"
+            yield f"event: done\ndata: {json.dumps({'session_id': session_id, 'cached': True})}\n\n"
+            return
         
+        parts = []
+        try:
+            async for text in flight.follow():
+                parts.append(text)
+                yield f"event: token\ndata: {json.dumps({'text': text})}\n\n"
+        except Exception as e:
+            logger.warning(f"NyayAI stream failed after {len(parts)} chunk(s): {e}")
+            if not parts:
+                yield f"event: token\ndata: {json.dumps({'text': chat_fallback_response(message.message)})}\n\n"
+            yield f"event: done\ndata: {json.dumps({'session_id': session_id, 'error': str(e)})}\n\n"
+            return
+        
+        response = "".join(parts)
+        if shared_key:
+            chat_faq_cache.put(shared_key, response)
+        await save_chat_exchange(user_id, session_id, message.message, response, summary_update)
+        yield f"event: done\ndata: {json.dumps({'session_id': session_id, 'cached': False})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(abandon) if flight else None  # In case the body never started
+    )
+
+@app.get("/api/chat/history/{session_id}")
+async def get_chat_history(session_id: str, user = Depends(verify_token)):
+    """Get chat history for a session"""
+    # Verifies ownership (skipped for guests viewing their own session)
+    chat_data = load_chat_session(session_id, user)
+    
+    if chat_data:
         return {"success": True, "chat": chat_data}
     else:
         return {"success": False, "message": "Chat not found"}
@@ -1041,6 +3058,8 @@ async def get_user_chats(
     - Max limit: 100
     - Ordered by updated_at descending (most recent first)
     - Cursor-based pagination using updated_at value
+    - Reads chat_index summaries, never the message arrays
+    - Includes turns still queued in chat_writes (read-your-writes)
     """
     user_id = user["uid"]
     
@@ -1048,7 +3067,7 @@ async def get_user_chats(
     limit = min(max(1, limit), 100)  # Clamp between 1 and 100
     
     # Build query with ordering and limit
-    query = db.collection("chats").where("user_id", "==", user_id)
+    query = db.collection("chat_index").where("user_id", "==", user_id)
     query = query.order_by("updated_at", direction="DESCENDING")
     
     # Apply cursor if provided
@@ -1058,24 +3077,26 @@ async def get_user_chats(
     # Apply limit + 1 to check if there are more results
     query = query.limit(limit + 1)
     
-    chats = query.stream()
+    stored = [chat.to_dict() for chat in query.stream()]
+    
+    # Sessions with queued turns move to the top, so they only appear on the first page
+    pending = chat_writes.index_overlay(user_id, {summary["session_id"]: summary for summary in stored})
+    summaries = [summary for summary in stored if summary["session_id"] not in pending]
+    if not cursor:
+        summaries = sorted(summaries + list(pending.values()), key=lambda summary: summary["updated_at"], reverse=True)
     
     chat_list = []
-    for chat in chats:
-        chat_data = chat.to_dict()
-        messages = chat_data.get("messages", [])
-        last_message = messages[-1] if messages else None
-        
+    for summary in summaries:
         chat_list.append({
-            "session_id": chat_data.get("session_id"),
-            "last_message": last_message.get("content") if last_message else None,
-            "updated_at": chat_data.get("updated_at"),
-            "message_count": len(messages)
+            "session_id": summary.get("session_id"),
+            "last_message": summary.get("last_message"),
+            "updated_at": summary.get("updated_at"),
+            "message_count": summary.get("message_count", 0)
         })
     
     # Determine next_cursor
     next_cursor = None
-    if len(chat_list) > limit:
+    if len(chat_list) > limit or len(stored) > limit:
         chat_list = chat_list[:limit]  # Trim to requested limit
         next_cursor = chat_list[-1]["updated_at"] if chat_list else None
     
@@ -1085,159 +3106,569 @@ async def get_user_chats(
         "next_cursor": next_cursor
     }
 
-# ============= DOCUMENT GENERATOR ENDPOINTS =============
+# ============= PDF FONT REGISTRY =============
+# The base-14 Helvetica has no Indic glyphs. Noto TTFs for each script are
+# parsed and registered once per process (at import, so once per render
+# worker) and shared by every template; reportlab embeds only the glyphs a
+# document actually uses. Complex-script shaping needs uharfbuzz.
+# The fonts (SIL OFL) are fetched into PDF_FONT_DIR by `python fetch_fonts.py`;
+# the server refuses to start without them rather than print boxes.
+PDF_FONT_DIR = os.getenv("PDF_FONT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts"))
+
+# script -> (font family, characters of that script, warm-up sample)
+SCRIPT_FONTS = {
+    "devanagari": ("NotoSansDevanagari", "[\u0900-\u097F\uA8E0-\uA8FF\u1CD0-\u1CFF]",
+                   "किरायानामा कानूनी नोटिस शपथ पत्र उपभोक्ता शिकायत"),  # Hindi, Marathi
+    "kannada": ("NotoSansKannada", "[\u0C80-\u0CFF]",
+                "ಬಾಡಿಗೆ ಒಪ್ಪಂದ ಕಾನೂನು ನೋಟಿಸ್ ಪ್ರಮಾಣ ಪತ್ರ"),
+}
+
+
+class PdfFontRegistry:
+    """
+    Registered Indic font families, keyed by script.
+    Latin text stays in Helvetica; only runs of a registered script are
+    switched to its TTF, so mixed English/Hindi paragraphs render correctly.
+    """
+    def __init__(self, font_dir: str = PDF_FONT_DIR, scripts: Dict[str, tuple] = SCRIPT_FONTS):
+        self._font_dir = font_dir
+        self._scripts = scripts
+        self.fonts = {}  # script -> {"regular": font name, "bold": font name}
+        self._patterns = {}  # script -> compiled run regex
+        self._latin = {}  # script font name -> Helvetica equivalent
+        self.missing = []
+    
+    def register(self):
+        """Parse and register every available family, then warm its glyph metrics"""
+        for script, (family, pattern, sample) in self._scripts.items():
+            regular_path = os.path.join(self._font_dir, f"{family}-Regular.ttf")
+            bold_path = os.path.join(self._font_dir, f"{family}-Bold.ttf")
+            if not os.path.exists(regular_path):
+                self.missing.append(family)
+                continue
+            
+            regular, bold = family, f"{family}-Bold"
+            pdfmetrics.registerFont(TTFont(regular, regular_path))
+            if os.path.exists(bold_path):
+                pdfmetrics.registerFont(TTFont(bold, bold_path))
+            else:
+                bold = regular
+            # So <b> inside a script-font paragraph resolves to the bold face
+            pdfmetrics.registerFontFamily(regular, normal=regular, bold=bold, italic=regular, boldItalic=bold)
+            
+            for name in {regular, bold}:
+                pdfmetrics.stringWidth(sample, name, 10)
+                font = pdfmetrics.getFont(name)
+                if font.shapable:
+                    font.hbFace  # Load the HarfBuzz face now rather than mid-render
+            
+            self.fonts[script] = {"regular": regular, "bold": bold}
+            self._patterns[script] = re.compile(pattern)
+            self._latin[regular] = "Helvetica"
+            self._latin[bold] = "Helvetica-Bold"
+        
+        if self.missing:
+            raise RuntimeError(
+                f"PDF fonts not found in {self._font_dir}: {', '.join(self.missing)}. "
+                f"Run `python fetch_fonts.py` or set PDF_FONT_DIR to a directory with the Noto TTFs"
+            )
+        print(f"✅ PDF fonts registered: {', '.join(sorted(self.fonts))}")
+    
+    def script_font(self, script: str, latin_font: str) -> str:
+        """Script font standing in for a Helvetica face"""
+        weight = "bold" if "Bold" in latin_font else "regular"
+        return self.fonts[script][weight]
+    
+    def detect_script(self, data: Any) -> Optional[str]:
+        """First registered script found in the user's fields, if any"""
+        if isinstance(data, str):
+            for script, pattern in self._patterns.items():
+                if pattern.search(data):
+                    return script
+            return None
+        values = data.values() if isinstance(data, dict) else data if isinstance(data, (list, tuple)) else ()
+        for value in values:
+            script = self.detect_script(value)
+            if script:
+                return script
+        return None
+    
+    def split_runs(self, paragraph: Paragraph, script: str):
+        """
+        Move every word without script characters back to Helvetica.
+        Whole words switch font, never part of one: the shaper can't mix a
+        TTF and a base-14 font inside a word.
+        """
+        pattern = self._patterns[script]
+        frags = []
+        segment = []  # Adjacent text frags; words may span them (e.g. <b>..</b>)
+        
+        def flush():
+            text = "".join(frag.text for frag in segment)
+            in_script = [False] * len(text)
+            for word in re.finditer(r"\S+", text):
+                if pattern.search(word.group()):
+                    in_script[word.start():word.end()] = [True] * (word.end() - word.start())
+            
+            offset = 0
+            for frag in segment:
+                start, end = offset, offset + len(frag.text)
+                while start < end:
+                    stop = start
+                    while stop < end and in_script[stop] == in_script[start]:
+                        stop += 1
+                    piece = text[start:stop]
+                    if in_script[start]:
+                        frags.append(frag.clone(text=piece))
+                    else:
+                        frags.append(frag.clone(text=piece, fontName=self._latin[frag.fontName]))
+                    start = stop
+                offset = end
+            segment.clear()
+        
+        for frag in paragraph.frags:
+            if getattr(frag, "text", "") and frag.fontName in self._latin and not hasattr(frag, "cbDefn"):
+                segment.append(frag)
+            else:
+                flush()
+                frags.append(frag)
+        flush()
+        paragraph.frags = frags
+    
+    def localize(self, flowables: list, script: str, cell_style: ParagraphStyle):
+        """Apply per-run fonts to a built document; table cells with script text become Paragraphs"""
+        for flowable in flowables:
+            if isinstance(flowable, Paragraph):
+                self.split_runs(flowable, script)
+            elif isinstance(flowable, Table):
+                for row in flowable._cellvalues:
+                    for col, value in enumerate(row):
+                        if isinstance(value, str) and self._patterns[script].search(value):
+                            row[col] = Paragraph(value, cell_style)
+                            self.split_runs(row[col], script)
+    
+    def stats(self) -> dict:
+        return {
+            "font_dir": self._font_dir,
+            "scripts": sorted(self.fonts),
+            "shaping": any(pdfmetrics.getFont(f["regular"]).shapable for f in self.fonts.values()),
+        }
 
-def generate_rent_agreement_pdf(data: Dict[str, Any]) -> io.BytesIO:
-    """Generate Rent Agreement PDF"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*cm, bottomMargin=1*cm)
-    styles = getSampleStyleSheet()
+
+pdf_fonts = PdfFontRegistry()
+pdf_fonts.register()
+
+
+# ============= DOCUMENT TEMPLATES =============
+# Each document type is declared once with @document_template. Its styles
+# and static clauses are compiled at startup and cached; a render only
+# builds the paragraphs that carry user fields.
+
+BLANK = "_____________"
+
+# Lazily rendered documents carry their creation date here so the printed
+# default date doesn't drift to the day of first download
+DOCUMENT_DATE_FIELD = "_document_date"
+
+
+def document_date(data: Dict[str, Any]) -> str:
+    """Date printed when the user gave none"""
+    return data.get(DOCUMENT_DATE_FIELD) or datetime.now().strftime('%d/%m/%Y')
+
+
+# Usable frame width of SimpleDocTemplate(A4): 1 inch side margins, 6pt frame padding
+DOCUMENT_FRAME_WIDTH = A4[0] - 2 * inch - 12
+
+PDF_FONT_REF = re.compile(r"/F\d+\b")
+
+
+class FixedSection:
+    """
+    A run of static clauses (witness blocks, verification clauses, ...)
+    laid out once per template version and drawn as a PDF form XObject.
+    The form's operators are recorded the first time it is drawn in this
+    process and replayed into later documents, so the section costs
+    neither wrapping nor drawing per request.
+    """
+    def __init__(self, name: str, flowables: list, width: float = DOCUMENT_FRAME_WIDTH):
+        self.form_name = re.sub(r"\W", "_", name)
+        self._recorded = None  # (operator lines, {font ref: font name})
+        self._lock = threading.Lock()
+        
+        # Stack the flowables the way a Frame would (collapsing adjacent spacing)
+        placed, y, space_after = [], 0, None
+        for flowable in flowables:
+            _, height = flowable.wrap(width, 10**6)
+            if space_after is not None:
+                y += space_after + max(flowable.getSpaceBefore() - space_after, 0)
+            y += height
+            placed.append((flowable, y))
+            space_after = flowable.getSpaceAfter()
+        
+        self.width, self.height = width, y
+        self.space_before = flowables[0].getSpaceBefore()
+        self.space_after = space_after
+        self._placed = [(flowable, self.height - bottom) for flowable, bottom in placed]
+    
+    def flowable(self) -> Flowable:
+        """Per-document flowable; frames set attributes on it, so it is never shared"""
+        return FixedSectionFlowable(self)
+    
+    def define_form(self, canv):
+        """Add this section's form to a document, replaying recorded operators when possible"""
+        # Pad the bounding box: glyphs (underscores, descenders) overhang their line box
+        pad = 12
+        canv.beginForm(self.form_name, -pad, -pad, self.width + pad, self.height + pad)
+        with self._lock:
+            if self._recorded:
+                lines, fonts = self._recorded
+                refs = {ref: canv._doc.getInternalFontName(font) for ref, font in fonts.items()}
+                canv._code.extend(PDF_FONT_REF.sub(lambda m: refs.get(m.group(), m.group()), line) for line in lines)
+            else:
+                start = len(canv._code)
+                for flowable, y in self._placed:
+                    flowable.drawOn(canv, 0, y)
+                self._recorded = self._record(canv, canv._code[start:])
+        # A few hundred bytes of operators: compressing (and ASCII85-encoding)
+        # them per document would cost more than it saves
+        canv.endForm(compression=0)
+    
+    def _record(self, canv, lines: list) -> Optional[tuple]:
+        """Operators plus the fonts they reference; None if a font can't be replayed"""
+        font_names = {ref: font for font, ref in canv._doc.fontMapping.items()}
+        # First-use order, so a replay registers fonts in the order drawing would
+        fonts = {ref: font_names[ref] for ref in dict.fromkeys(PDF_FONT_REF.findall("\n".join(lines)))}
+        # Embedded TTFs track their glyph subset while drawing, so only
+        # base-14 fonts are safe to replay
+        if any(pdfmetrics.getFont(font)._dynamicFont for font in fonts.values()):
+            return None
+        return list(lines), fonts
+
+
+class FixedSectionFlowable(Flowable):
+    """Draws a FixedSection by reference; kept together on one page"""
+    def __init__(self, section: FixedSection):
+        Flowable.__init__(self)
+        self.section = section
+        self.spaceBefore = section.space_before
+        self.spaceAfter = section.space_after
+    
+    def wrap(self, availWidth, availHeight):
+        return self.section.width, self.section.height
+    
+    def draw(self):
+        if not self.canv.hasForm(self.section.form_name):
+            self.section.define_form(self.canv)
+        self.canv.doForm(self.section.form_name)
+
+
+class DocumentTemplate:
+    """
+    A registered document type.
+    - styles: name -> ParagraphStyle kwargs ("parent" names a sample style)
+    - static: name -> (style name, markup) for boilerplate that never changes
+    - fixed: name -> [static name | spacer height, ...] sections pre-rendered
+      as form XObjects (see FixedSection)
+    - build: fn(data, template) -> list of flowables
+    Bump `version` whenever the rendered output changes, and keep the old
+    definition registered with retired=True while lazily stored documents
+    still reference it.
+    Documents containing Indic text render through a per-script variant
+    whose styles use that script's registered font.
+    """
+    def __init__(self, doc_type: str, version: str, styles: Dict[str, dict],
+                 static: Dict[str, tuple], fixed: Dict[str, list], build):
+        self.doc_type = doc_type
+        self.version = version
+        self.styles = {}
+        self._style_spec = styles
+        self._static_spec = static
+        self._static = {}
+        self._fixed_spec = fixed
+        self._fixed = {}
+        self._build = build
+        self._variants = {}  # script -> DocumentTemplate with script-font styles
+        self.script = None
+    
+    def compile(self, sample_styles):
+        """Build ParagraphStyles and pre-parse static clauses (once per process)"""
+        for name, spec in self._style_spec.items():
+            spec = dict(spec)
+            parent = spec.pop("parent", None)
+            self.styles[name] = ParagraphStyle(
+                f"{self.doc_type}.{name}",
+                parent=sample_styles[parent] if parent else None,
+                **spec
+            )
+        for name, (style_name, markup) in self._static_spec.items():
+            self._static[name] = Paragraph(markup, self.styles[style_name])
+        for name, parts in self._fixed_spec.items():
+            self._fixed[name] = FixedSection(
+                f"{self.doc_type}.v{self.version}.{name}",
+                [Spacer(1, part) if isinstance(part, (int, float)) else self.static(part) for part in parts]
+            )
+        
+        # Static clauses are English and stay shared; only user-field styles vary
+        for script in pdf_fonts.fonts:
+            variant = copy.copy(self)
+            variant.script = script
+            variant.styles = {
+                name: ParagraphStyle(
+                    f"{self.doc_type}.{name}.{script}",
+                    parent=style,
+                    fontName=pdf_fonts.script_font(script, style.fontName),
+                    shaping=1
+                )
+                for name, style in self.styles.items()
+            }
+            variant.cell_style = ParagraphStyle(
+                f"{self.doc_type}.cell.{script}",
+                fontName=pdf_fonts.script_font(script, "Helvetica"),
+                fontSize=10,
+                leading=12,
+                shaping=1
+            )
+            self._variants[script] = variant
     
-    # Custom styles
-    title_style = ParagraphStyle('Title', parent=styles['Heading1'], alignment=TA_CENTER, fontSize=18, spaceAfter=30)
-    heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=12, spaceAfter=10, spaceBefore=15)
-    body_style = ParagraphStyle('Body', parent=styles['Normal'], fontSize=10, alignment=TA_JUSTIFY, spaceAfter=8)
+    def static(self, name: str) -> Paragraph:
+        """Fresh flowable for a static clause, reusing its parsed markup"""
+        compiled = self._static[name]
+        return Paragraph(compiled.text, compiled.style, frags=compiled.frags)
     
+    def fixed(self, name: str) -> Flowable:
+        """Flowable for a pre-rendered fixed section"""
+        return self._fixed[name].flowable()
+    
+    def render(self, data: Dict[str, Any], output=None):
+        """Render the document with the given user fields into `output` (a new BytesIO by default)"""
+        buffer = output if output is not None else io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*cm, bottomMargin=1*cm)
+        
+        template = self._variants.get(pdf_fonts.detect_script(data), self)
+        flowables = template._build(data, template)
+        if template.script:
+            pdf_fonts.localize(flowables, template.script, template.cell_style)
+        
+        doc.build(flowables)
+        buffer.seek(0)
+        return buffer
+
+
+DOCUMENT_TEMPLATES: Dict[str, DocumentTemplate] = {}  # Current version per type
+DOCUMENT_TEMPLATE_VERSIONS: Dict[Tuple[str, str], DocumentTemplate] = {}  # Every version, current and retired
+
+
+class DocumentTemplateRetiredError(Exception):
+    """Raised when a stored document's template version is no longer registered"""
+
+
+def document_template(doc_type: str, version: str, styles: Dict[str, dict], static: Dict[str, tuple] = None,
+                      fixed: Dict[str, list] = None, retired: bool = False):
+    """
+    Decorator registering a build function as a document template.
+    retired=True keeps an old version renderable without making it current.
+    """
+    def register(build):
+        template = DocumentTemplate(doc_type, version, styles, static or {}, fixed or {}, build)
+        DOCUMENT_TEMPLATE_VERSIONS[(doc_type, version)] = template
+        if not retired:
+            DOCUMENT_TEMPLATES[doc_type] = template
+        return build
+    return register
+
+
+def get_document_template(doc_type: str, version: Optional[str] = None) -> DocumentTemplate:
+    """The current template for a type, or a specific registered version of it"""
+    if version is None:
+        return DOCUMENT_TEMPLATES[doc_type]
+    template = DOCUMENT_TEMPLATE_VERSIONS.get((doc_type, version))
+    if template is None:
+        raise DocumentTemplateRetiredError(
+            f"Template {doc_type} v{version} is no longer available; please regenerate this document"
+        )
+    return template
+
+
+def compile_document_templates():
+    """Compile every registered template. Called once at import (and so in each worker)."""
+    sample_styles = getSampleStyleSheet()
+    for template in DOCUMENT_TEMPLATE_VERSIONS.values():
+        template.compile(sample_styles)
+
+
+SIGNATURE_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+])
+
+
+@document_template(
+    "rent_agreement",
+    version="3",
+    styles={
+        "title": dict(parent="Heading1", alignment=TA_CENTER, fontSize=18, spaceAfter=30),
+        "heading": dict(parent="Heading2", fontSize=12, spaceAfter=10, spaceBefore=15),
+        "body": dict(parent="Normal", fontSize=10, alignment=TA_JUSTIFY, spaceAfter=8),
+    },
+    static={
+        "title": ("title", "RENT AGREEMENT"),
+        "between": ("heading", "BETWEEN"),
+        "and": ("heading", "AND"),
+        "property_details": ("heading", "PROPERTY DETAILS"),
+        "terms": ("heading", "TERMS AND CONDITIONS"),
+        "maintenance": ("body", "<b>5. Maintenance:</b> The Tenant shall maintain the premises in good condition and shall be responsible for minor repairs."),
+        "subletting": ("body", "<b>6. Sub-letting:</b> The Tenant shall not sub-let or transfer the premises without prior written consent of the Landlord."),
+        "use_of_premises": ("body", "<b>8. Use of Premises:</b> The premises shall be used for residential purposes only."),
+        "in_witness": ("body", "IN WITNESS WHEREOF, the parties have signed this Agreement on the date mentioned above."),
+        "witnesses": ("heading", "WITNESSES:"),
+        "witness_1": ("body", "1. Name: _______________ Signature: _______________ Address: _______________"),
+        "witness_2": ("body", "2. Name: _______________ Signature: _______________ Address: _______________"),
+    },
+    fixed={
+        "attestation": ["in_witness", 40],
+        "witnesses": [30, "witnesses", "witness_1", "witness_2"],
+    }
+)
+def build_rent_agreement(data: Dict[str, Any], t: DocumentTemplate) -> list:
+    body_style = t.styles["body"]
     elements = []
     
     # Title
-    elements.append(Paragraph("RENT AGREEMENT", title_style))
+    elements.append(t.static("title"))
     elements.append(Spacer(1, 20))
     
     # Date and Place
-    elements.append(Paragraph(f"This Rent Agreement is executed on <b>{data.get('agreement_date', '_____________')}</b> at <b>{data.get('city', '_____________')}</b>", body_style))
+    elements.append(Paragraph(f"This Rent Agreement is executed on <b>{data.get('agreement_date', BLANK)}</b> at <b>{data.get('city', BLANK)}</b>", body_style))
     elements.append(Spacer(1, 15))
     
     # Parties
-    elements.append(Paragraph("BETWEEN", heading_style))
+    elements.append(t.static("between"))
     elements.append(Paragraph(f"""
-    <b>LANDLORD:</b> {data.get('landlord_name', '_____________')}<br/>
-    Address: {data.get('landlord_address', '_____________')}<br/>
+    <b>LANDLORD:</b> {data.get('landlord_name', BLANK)}<br/>
+    Address: {data.get('landlord_address', BLANK)}<br/>
     (hereinafter referred to as the "LANDLORD")
     """, body_style))
     
-    elements.append(Paragraph("AND", heading_style))
+    elements.append(t.static("and"))
     elements.append(Paragraph(f"""
-    <b>TENANT:</b> {data.get('tenant_name', '_____________')}<br/>
-    Address: {data.get('tenant_address', '_____________')}<br/>
+    <b>TENANT:</b> {data.get('tenant_name', BLANK)}<br/>
+    Address: {data.get('tenant_address', BLANK)}<br/>
     (hereinafter referred to as the "TENANT")
     """, body_style))
     
     # Property Details
-    elements.append(Paragraph("PROPERTY DETAILS", heading_style))
+    elements.append(t.static("property_details"))
     elements.append(Paragraph(f"""
     The Landlord hereby agrees to let out and the Tenant hereby agrees to take on rent the premises described below:<br/><br/>
-    <b>Property Address:</b> {data.get('property_address', '_____________')}<br/>
+    <b>Property Address:</b> {data.get('property_address', BLANK)}<br/>
     <b>Property Type:</b> {data.get('property_type', 'Residential')}<br/>
-    <b>Floor/Unit:</b> {data.get('floor_unit', '_____________')}
+    <b>Floor/Unit:</b> {data.get('floor_unit', BLANK)}
     """, body_style))
     
     # Terms
-    elements.append(Paragraph("TERMS AND CONDITIONS", heading_style))
-    
-    terms = [
-        f"<b>1. Rent:</b> The monthly rent shall be Rs. {data.get('monthly_rent', '_____________')}/- (Rupees {data.get('rent_in_words', '_____________')} only), payable on or before the {data.get('rent_due_date', '5th')} of every month.",
-        f"<b>2. Security Deposit:</b> The Tenant shall pay a security deposit of Rs. {data.get('security_deposit', '_____________')}/- which shall be refunded at the end of the tenancy after deducting any dues.",
-        f"<b>3. Term:</b> This agreement shall be valid for a period of {data.get('lease_duration', '11 months')} from {data.get('start_date', '_____________')} to {data.get('end_date', '_____________')}.",
-        f"<b>4. Utilities:</b> {data.get('utilities_arrangement', 'Electricity and water charges shall be borne by the Tenant.')}",
-        "<b>5. Maintenance:</b> The Tenant shall maintain the premises in good condition and shall be responsible for minor repairs.",
-        "<b>6. Sub-letting:</b> The Tenant shall not sub-let or transfer the premises without prior written consent of the Landlord.",
-        f"<b>7. Notice Period:</b> Either party may terminate this agreement by giving {data.get('notice_period', 'one month')} written notice.",
-        "<b>8. Use of Premises:</b> The premises shall be used for residential purposes only."
-    ]
-    
-    for term in terms:
-        elements.append(Paragraph(term, body_style))
+    elements.append(t.static("terms"))
+    elements.append(Paragraph(f"<b>1. Rent:</b> The monthly rent shall be Rs. {data.get('monthly_rent', BLANK)}/- (Rupees {data.get('rent_in_words', BLANK)} only), payable on or before the {data.get('rent_due_date', '5th')} of every month.", body_style))
+    elements.append(Paragraph(f"<b>2. Security Deposit:</b> The Tenant shall pay a security deposit of Rs. {data.get('security_deposit', BLANK)}/- which shall be refunded at the end of the tenancy after deducting any dues.", body_style))
+    elements.append(Paragraph(f"<b>3. Term:</b> This agreement shall be valid for a period of {data.get('lease_duration', '11 months')} from {data.get('start_date', BLANK)} to {data.get('end_date', BLANK)}.", body_style))
+    elements.append(Paragraph(f"<b>4. Utilities:</b> {data.get('utilities_arrangement', 'Electricity and water charges shall be borne by the Tenant.')}", body_style))
+    elements.append(t.static("maintenance"))
+    elements.append(t.static("subletting"))
+    elements.append(Paragraph(f"<b>7. Notice Period:</b> Either party may terminate this agreement by giving {data.get('notice_period', 'one month')} written notice.", body_style))
+    elements.append(t.static("use_of_premises"))
     
     elements.append(Spacer(1, 30))
     
     # Signatures
-    elements.append(Paragraph("IN WITNESS WHEREOF, the parties have signed this Agreement on the date mentioned above.", body_style))
-    elements.append(Spacer(1, 40))
+    elements.append(t.fixed("attestation"))
     
     # Signature table
     sig_data = [
         ["LANDLORD", "TENANT"],
         ["", ""],
         ["Signature: _______________", "Signature: _______________"],
-        [f"Name: {data.get('landlord_name', '_____________')}", f"Name: {data.get('tenant_name', '_____________')}"],
+        [f"Name: {data.get('landlord_name', BLANK)}", f"Name: {data.get('tenant_name', BLANK)}"],
         ["Date: _______________", "Date: _______________"]
     ]
     
     sig_table = Table(sig_data, colWidths=[250, 250])
-    sig_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-    ]))
+    sig_table.setStyle(SIGNATURE_TABLE_STYLE)
     elements.append(sig_table)
     
     # Witnesses
-    elements.append(Spacer(1, 30))
-    elements.append(Paragraph("WITNESSES:", heading_style))
-    elements.append(Paragraph("1. Name: _______________ Signature: _______________ Address: _______________", body_style))
-    elements.append(Paragraph("2. Name: _______________ Signature: _______________ Address: _______________", body_style))
-    
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
-
-
-def generate_legal_notice_pdf(data: Dict[str, Any]) -> io.BytesIO:
-    """Generate Legal Notice PDF"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*cm, bottomMargin=1*cm)
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle('Title', parent=styles['Heading1'], alignment=TA_CENTER, fontSize=16, spaceAfter=20)
-    heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=11, spaceAfter=8, spaceBefore=12)
-    body_style = ParagraphStyle('Body', parent=styles['Normal'], fontSize=10, alignment=TA_JUSTIFY, spaceAfter=8)
-    
+    elements.append(t.fixed("witnesses"))
+    
+    return elements
+
+
+@document_template(
+    "legal_notice",
+    version="2",
+    styles={
+        "title": dict(parent="Heading1", alignment=TA_CENTER, fontSize=16, spaceAfter=20),
+        "subtitle": dict(alignment=TA_CENTER, fontSize=10),
+        "heading": dict(parent="Heading2", fontSize=11, spaceAfter=8, spaceBefore=12),
+        "body": dict(parent="Normal", fontSize=10, alignment=TA_JUSTIFY, spaceAfter=8),
+    },
+    static={
+        "title": ("title", "LEGAL NOTICE"),
+        "to": ("heading", "TO,"),
+        "subject": ("heading", "SUBJECT:"),
+        "salutation": ("body", "Dear Sir/Madam,"),
+        "facts": ("heading", "FACTS OF THE CASE:"),
+        "grievance": ("heading", "GRIEVANCE:"),
+        "demand": ("heading", "DEMAND:"),
+        "warning": ("heading", "WARNING:"),
+        "closing": ("body", "Yours faithfully,"),
+        "signature_line": ("body", "_______________"),
+    }
+)
+def build_legal_notice(data: Dict[str, Any], t: DocumentTemplate) -> list:
+    body_style = t.styles["body"]
     elements = []
     
-    elements.append(Paragraph("LEGAL NOTICE", title_style))
-    elements.append(Paragraph(f"Under Section {data.get('section', '80 of Civil Procedure Code')}", 
-                              ParagraphStyle('Subtitle', alignment=TA_CENTER, fontSize=10)))
+    elements.append(t.static("title"))
+    elements.append(Paragraph(f"Under Section {data.get('section', '80 of Civil Procedure Code')}", t.styles["subtitle"]))
     elements.append(Spacer(1, 20))
     
     # Date
-    elements.append(Paragraph(f"Date: {data.get('notice_date', datetime.now().strftime('%d/%m/%Y'))}", body_style))
+    elements.append(Paragraph(f"Date: {data.get('notice_date', document_date(data))}", body_style))
     elements.append(Spacer(1, 10))
     
     # To
-    elements.append(Paragraph("TO,", heading_style))
+    elements.append(t.static("to"))
     elements.append(Paragraph(f"""
-    {data.get('recipient_name', '_____________')}<br/>
-    {data.get('recipient_address', '_____________')}
+    {data.get('recipient_name', BLANK)}<br/>
+    {data.get('recipient_address', BLANK)}
     """, body_style))
     
     # Subject
-    elements.append(Paragraph("SUBJECT:", heading_style))
-    elements.append(Paragraph(data.get('subject', 'Legal Notice for _____________'), body_style))
+    elements.append(t.static("subject"))
+    elements.append(Paragraph(data.get('subject', f'Legal Notice for {BLANK}'), body_style))
     
     # Body
-    elements.append(Paragraph("Dear Sir/Madam,", body_style))
+    elements.append(t.static("salutation"))
     elements.append(Spacer(1, 10))
     
     elements.append(Paragraph(f"""
-    Under the instructions from and on behalf of my client, <b>{data.get('sender_name', '_____________')}</b>, 
-    residing at {data.get('sender_address', '_____________')}, I hereby serve upon you this Legal Notice as under:
+    Under the instructions from and on behalf of my client, <b>{data.get('sender_name', BLANK)}</b>, 
+    residing at {data.get('sender_address', BLANK)}, I hereby serve upon you this Legal Notice as under:
     """, body_style))
     
     # Facts
-    elements.append(Paragraph("FACTS OF THE CASE:", heading_style))
-    elements.append(Paragraph(data.get('facts', '_____________'), body_style))
+    elements.append(t.static("facts"))
+    elements.append(Paragraph(data.get('facts', BLANK), body_style))
     
     # Grievance
-    elements.append(Paragraph("GRIEVANCE:", heading_style))
-    elements.append(Paragraph(data.get('grievance', '_____________'), body_style))
+    elements.append(t.static("grievance"))
+    elements.append(Paragraph(data.get('grievance', BLANK), body_style))
     
     # Demand
-    elements.append(Paragraph("DEMAND:", heading_style))
-    elements.append(Paragraph(data.get('demand', '_____________'), body_style))
+    elements.append(t.static("demand"))
+    elements.append(Paragraph(data.get('demand', BLANK), body_style))
     
     # Warning
-    elements.append(Paragraph("WARNING:", heading_style))
+    elements.append(t.static("warning"))
     elements.append(Paragraph(f"""
     You are hereby called upon to comply with the above demand within {data.get('response_days', '15')} days 
     from the receipt of this notice, failing which my client shall be constrained to initiate appropriate 
@@ -1247,93 +3678,127 @@ def generate_legal_notice_pdf(data: Dict[str, Any]) -> io.BytesIO:
     elements.append(Spacer(1, 30))
     
     # Signature
-    elements.append(Paragraph(f"Yours faithfully,", body_style))
+    elements.append(t.static("closing"))
     elements.append(Spacer(1, 20))
-    elements.append(Paragraph(f"_______________", body_style))
+    elements.append(t.static("signature_line"))
     elements.append(Paragraph(f"{data.get('advocate_name', 'Advocate')}", body_style))
-    elements.append(Paragraph(f"On behalf of: {data.get('sender_name', '_____________')}", body_style))
-    
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
-
-
-def generate_affidavit_pdf(data: Dict[str, Any]) -> io.BytesIO:
-    """Generate General Affidavit PDF"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*cm, bottomMargin=1*cm)
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle('Title', parent=styles['Heading1'], alignment=TA_CENTER, fontSize=18, spaceAfter=30)
-    body_style = ParagraphStyle('Body', parent=styles['Normal'], fontSize=11, alignment=TA_JUSTIFY, spaceAfter=12)
-    
+    elements.append(Paragraph(f"On behalf of: {data.get('sender_name', BLANK)}", body_style))
+    
+    return elements
+
+
+@document_template(
+    "affidavit",
+    version="3",
+    styles={
+        "title": dict(parent="Heading1", alignment=TA_CENTER, fontSize=18, spaceAfter=30),
+        "body": dict(parent="Normal", fontSize=11, alignment=TA_JUSTIFY, spaceAfter=12),
+        "heading": dict(fontSize=12, spaceAfter=10),
+    },
+    static={
+        "title": ("title", "AFFIDAVIT"),
+        "declaration": ("body", """
+    I hereby declare that the contents of this affidavit are true and correct to the best of my knowledge 
+    and belief and nothing material has been concealed therefrom.
+    """),
+        "verification": ("heading", "VERIFICATION"),
+        "deponent": ("body", "DEPONENT"),
+        "signature_line": ("body", "_______________"),
+        "before_me": ("body", "Before me,"),
+        "notary": ("body", "Notary Public / Oath Commissioner"),
+    },
+    fixed={
+        "declaration": ["declaration", 30, "verification"],
+        "signature": ["deponent", 30, "signature_line"],
+        "attestation": [30, "before_me", "notary"],
+    }
+)
+def build_affidavit(data: Dict[str, Any], t: DocumentTemplate) -> list:
+    body_style = t.styles["body"]
     elements = []
     
-    elements.append(Paragraph("AFFIDAVIT", title_style))
+    elements.append(t.static("title"))
     elements.append(Spacer(1, 20))
     
     elements.append(Paragraph(f"""
-    I, <b>{data.get('deponent_name', '_____________')}</b>, aged {data.get('deponent_age', '_____________')} years, 
-    {data.get('deponent_occupation', '_____________')}, residing at {data.get('deponent_address', '_____________')}, 
+    I, <b>{data.get('deponent_name', BLANK)}</b>, aged {data.get('deponent_age', BLANK)} years, 
+    {data.get('deponent_occupation', BLANK)}, residing at {data.get('deponent_address', BLANK)}, 
     do hereby solemnly affirm and declare as under:
     """, body_style))
     
     elements.append(Spacer(1, 15))
     
     # Statements
-    statements = data.get('statements', ['_____________'])
+    statements = data.get('statements', [BLANK])
     for i, statement in enumerate(statements, 1):
         elements.append(Paragraph(f"{i}. {statement}", body_style))
     
     elements.append(Spacer(1, 15))
     
-    elements.append(Paragraph("""
-    I hereby declare that the contents of this affidavit are true and correct to the best of my knowledge 
-    and belief and nothing material has been concealed therefrom.
-    """, body_style))
-    
-    elements.append(Spacer(1, 30))
-    
-    # Verification
-    elements.append(Paragraph("VERIFICATION", ParagraphStyle('Heading', fontSize=12, spaceAfter=10)))
+    # Declaration and verification heading
+    elements.append(t.fixed("declaration"))
     elements.append(Paragraph(f"""
-    Verified at {data.get('verification_place', '_____________')} on this {data.get('verification_date', '_____________')} 
+    Verified at {data.get('verification_place', BLANK)} on this {data.get('verification_date', BLANK)} 
     that the contents of this affidavit are true and correct to the best of my knowledge and belief.
     """, body_style))
     
     elements.append(Spacer(1, 40))
     
-    elements.append(Paragraph("DEPONENT", body_style))
-    elements.append(Spacer(1, 30))
-    elements.append(Paragraph("_______________", body_style))
-    elements.append(Paragraph(f"({data.get('deponent_name', '_____________')})", body_style))
-    
-    elements.append(Spacer(1, 30))
-    elements.append(Paragraph("Before me,", body_style))
-    elements.append(Paragraph("Notary Public / Oath Commissioner", body_style))
-    
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
-
-
-def generate_consumer_complaint_pdf(data: Dict[str, Any]) -> io.BytesIO:
-    """Generate Consumer Complaint PDF (under Consumer Protection Act, 2019)"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*cm, bottomMargin=1*cm)
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle('Title', parent=styles['Heading1'], alignment=TA_CENTER, fontSize=16, spaceAfter=15)
-    heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=11, spaceAfter=8, spaceBefore=12)
-    body_style = ParagraphStyle('Body', parent=styles['Normal'], fontSize=10, alignment=TA_JUSTIFY, spaceAfter=8)
-    
+    elements.append(t.fixed("signature"))
+    elements.append(Paragraph(f"({data.get('deponent_name', BLANK)})", body_style))
+    
+    elements.append(t.fixed("attestation"))
+    
+    return elements
+
+
+@document_template(
+    "consumer_complaint",
+    version="3",
+    styles={
+        "title": dict(parent="Heading1", alignment=TA_CENTER, fontSize=16, spaceAfter=15),
+        "subtitle": dict(alignment=TA_CENTER, fontSize=10, spaceAfter=20),
+        "heading": dict(parent="Heading2", fontSize=11, spaceAfter=8, spaceBefore=12),
+        "body": dict(parent="Normal", fontSize=10, alignment=TA_JUSTIFY, spaceAfter=8),
+        "party_label": dict(alignment=TA_LEFT, fontSize=10, spaceAfter=15, spaceBefore=5),
+        "center": dict(alignment=TA_CENTER, fontSize=11, spaceAfter=15),
+    },
+    static={
+        "in_the_matter_of": ("heading", "IN THE MATTER OF:"),
+        "complainant_label": ("party_label", "...COMPLAINANT"),
+        "versus": ("center", "VERSUS"),
+        "opposite_party_label": ("party_label", "...OPPOSITE PARTY"),
+        "subject": ("heading", "SUBJECT:"),
+        "transaction_details": ("heading", "TRANSACTION DETAILS:"),
+        "facts": ("heading", "FACTS OF THE CASE:"),
+        "grievance": ("heading", "GRIEVANCE / CAUSE OF ACTION:"),
+        "relief_sought": ("heading", "RELIEF SOUGHT:"),
+        "declaration_heading": ("heading", "DECLARATION:"),
+        "declaration": ("body", """
+    I, the complainant, do hereby declare that:
+    1. The facts stated above are true and correct to the best of my knowledge and belief.
+    2. I have not filed any other complaint in any other forum regarding this matter.
+    3. The cause of action arose within the territorial jurisdiction of this Hon'ble Forum.
+    """),
+        "documents": ("heading", "LIST OF DOCUMENTS:"),
+        "signature_line": ("body", "_______________"),
+        "signature_caption": ("body", "(Signature of Complainant)"),
+        "verification": ("heading", "VERIFICATION"),
+    },
+    fixed={
+        "declaration": ["declaration_heading", "declaration"],
+        "signature": ["signature_line", "signature_caption"],
+    }
+)
+def build_consumer_complaint(data: Dict[str, Any], t: DocumentTemplate) -> list:
+    """Consumer Complaint (under Consumer Protection Act, 2019)"""
+    body_style = t.styles["body"]
     elements = []
     
     # Header
     forum_level = data.get('forum_level', 'District Consumer Disputes Redressal Forum')
-    elements.append(Paragraph(f"BEFORE THE {forum_level.upper()}", title_style))
-    elements.append(Paragraph(f"At {data.get('forum_city', '_____________')}", 
-                              ParagraphStyle('Subtitle', alignment=TA_CENTER, fontSize=10, spaceAfter=20)))
+    elements.append(Paragraph(f"BEFORE THE {forum_level.upper()}", t.styles["title"]))
+    elements.append(Paragraph(f"At {data.get('forum_city', BLANK)}", t.styles["subtitle"]))
     
     # Case Number (if assigned)
     if data.get('case_number'):
@@ -1342,56 +3807,56 @@ def generate_consumer_complaint_pdf(data: Dict[str, Any]) -> io.BytesIO:
     elements.append(Spacer(1, 15))
     
     # Complainant Details
-    elements.append(Paragraph("IN THE MATTER OF:", heading_style))
+    elements.append(t.static("in_the_matter_of"))
     elements.append(Paragraph(f"""
-    <b>{data.get('complainant_name', '_____________')}</b><br/>
-    S/o, D/o, W/o: {data.get('complainant_parent', '_____________')}<br/>
-    Age: {data.get('complainant_age', '_____________')} years<br/>
-    Occupation: {data.get('complainant_occupation', '_____________')}<br/>
-    Address: {data.get('complainant_address', '_____________')}<br/>
-    Phone: {data.get('complainant_phone', '_____________')}<br/>
-    Email: {data.get('complainant_email', '_____________')}
+    <b>{data.get('complainant_name', BLANK)}</b><br/>
+    S/o, D/o, W/o: {data.get('complainant_parent', BLANK)}<br/>
+    Age: {data.get('complainant_age', BLANK)} years<br/>
+    Occupation: {data.get('complainant_occupation', BLANK)}<br/>
+    Address: {data.get('complainant_address', BLANK)}<br/>
+    Phone: {data.get('complainant_phone', BLANK)}<br/>
+    Email: {data.get('complainant_email', BLANK)}
     """, body_style))
-    elements.append(Paragraph("...COMPLAINANT", ParagraphStyle('Right', alignment=TA_LEFT, fontSize=10, spaceAfter=15, spaceBefore=5)))
+    elements.append(t.static("complainant_label"))
     
-    elements.append(Paragraph("VERSUS", ParagraphStyle('Center', alignment=TA_CENTER, fontSize=11, spaceAfter=15)))
+    elements.append(t.static("versus"))
     
     # Opposite Party Details
     elements.append(Paragraph(f"""
-    <b>{data.get('opposite_party_name', '_____________')}</b><br/>
+    <b>{data.get('opposite_party_name', BLANK)}</b><br/>
     Through: {data.get('opposite_party_representative', 'Its Proprietor/Director/Manager')}<br/>
-    Address: {data.get('opposite_party_address', '_____________')}<br/>
-    Phone: {data.get('opposite_party_phone', '_____________')}<br/>
-    Email: {data.get('opposite_party_email', '_____________')}
+    Address: {data.get('opposite_party_address', BLANK)}<br/>
+    Phone: {data.get('opposite_party_phone', BLANK)}<br/>
+    Email: {data.get('opposite_party_email', BLANK)}
     """, body_style))
-    elements.append(Paragraph("...OPPOSITE PARTY", ParagraphStyle('Right', alignment=TA_LEFT, fontSize=10, spaceAfter=15, spaceBefore=5)))
+    elements.append(t.static("opposite_party_label"))
     
     # Subject
-    elements.append(Paragraph("SUBJECT:", heading_style))
+    elements.append(t.static("subject"))
     elements.append(Paragraph(f"Complaint under Section 35 of Consumer Protection Act, 2019 for {data.get('subject', 'deficiency in service / defect in goods / unfair trade practice')}", body_style))
     
     # Transaction Details
-    elements.append(Paragraph("TRANSACTION DETAILS:", heading_style))
+    elements.append(t.static("transaction_details"))
     elements.append(Paragraph(f"""
     <b>Nature of Transaction:</b> {data.get('transaction_nature', 'Purchase of goods / Availing of service')}<br/>
-    <b>Date of Transaction:</b> {data.get('transaction_date', '_____________')}<br/>
-    <b>Invoice/Receipt No.:</b> {data.get('invoice_number', '_____________')}<br/>
-    <b>Amount Paid:</b> Rs. {data.get('amount_paid', '_____________')}/-<br/>
-    <b>Mode of Payment:</b> {data.get('payment_mode', '_____________')}
+    <b>Date of Transaction:</b> {data.get('transaction_date', BLANK)}<br/>
+    <b>Invoice/Receipt No.:</b> {data.get('invoice_number', BLANK)}<br/>
+    <b>Amount Paid:</b> Rs. {data.get('amount_paid', BLANK)}/-<br/>
+    <b>Mode of Payment:</b> {data.get('payment_mode', BLANK)}
     """, body_style))
     
     # Facts of the Case
-    elements.append(Paragraph("FACTS OF THE CASE:", heading_style))
-    facts = data.get('facts', ['_____________'])
+    elements.append(t.static("facts"))
+    facts = data.get('facts', [BLANK])
     for i, fact in enumerate(facts, 1):
         elements.append(Paragraph(f"{i}. {fact}", body_style))
     
     # Grievance
-    elements.append(Paragraph("GRIEVANCE / CAUSE OF ACTION:", heading_style))
+    elements.append(t.static("grievance"))
     elements.append(Paragraph(data.get('grievance', 'The complainant has suffered due to the deficiency in service / defect in goods / unfair trade practice by the opposite party.'), body_style))
     
     # Relief Sought
-    elements.append(Paragraph("RELIEF SOUGHT:", heading_style))
+    elements.append(t.static("relief_sought"))
     reliefs = data.get('reliefs', [
         'Refund of amount paid with interest',
         'Compensation for mental agony and harassment',
@@ -1401,16 +3866,10 @@ def generate_consumer_complaint_pdf(data: Dict[str, Any]) -> io.BytesIO:
         elements.append(Paragraph(f"{i}. {relief}", body_style))
     
     # Declaration
-    elements.append(Paragraph("DECLARATION:", heading_style))
-    elements.append(Paragraph("""
-    I, the complainant, do hereby declare that:
-    1. The facts stated above are true and correct to the best of my knowledge and belief.
-    2. I have not filed any other complaint in any other forum regarding this matter.
-    3. The cause of action arose within the territorial jurisdiction of this Hon'ble Forum.
-    """, body_style))
+    elements.append(t.fixed("declaration"))
     
     # Documents
-    elements.append(Paragraph("LIST OF DOCUMENTS:", heading_style))
+    elements.append(t.static("documents"))
     documents = data.get('documents', [
         'Copy of Invoice/Receipt',
         'Proof of Payment',
@@ -1424,111 +3883,843 @@ def generate_consumer_complaint_pdf(data: Dict[str, Any]) -> io.BytesIO:
     elements.append(Spacer(1, 30))
     
     # Signature
-    elements.append(Paragraph(f"Place: {data.get('place', '_____________')}", body_style))
-    elements.append(Paragraph(f"Date: {data.get('date', datetime.now().strftime('%d/%m/%Y'))}", body_style))
+    elements.append(Paragraph(f"Place: {data.get('place', BLANK)}", body_style))
+    elements.append(Paragraph(f"Date: {data.get('date', document_date(data))}", body_style))
     elements.append(Spacer(1, 25))
-    elements.append(Paragraph("_______________", body_style))
-    elements.append(Paragraph("(Signature of Complainant)", body_style))
-    elements.append(Paragraph(f"Name: {data.get('complainant_name', '_____________')}", body_style))
+    elements.append(t.fixed("signature"))
+    elements.append(Paragraph(f"Name: {data.get('complainant_name', BLANK)}", body_style))
     
     # Verification
     elements.append(Spacer(1, 20))
-    elements.append(Paragraph("VERIFICATION", heading_style))
+    elements.append(t.static("verification"))
     elements.append(Paragraph(f"""
-    I, {data.get('complainant_name', '_____________')}, the above-named complainant, do hereby verify that the contents 
+    I, {data.get('complainant_name', BLANK)}, the above-named complainant, do hereby verify that the contents 
     of this complaint are true and correct to the best of my knowledge and belief and nothing material has been 
     concealed therefrom.
     
-    Verified at {data.get('verification_place', data.get('place', '_____________'))} on this day of {data.get('date', datetime.now().strftime('%d/%m/%Y'))}.
+    Verified at {data.get('verification_place', data.get('place', BLANK))} on this day of {data.get('date', document_date(data))}.
     """, body_style))
     elements.append(Spacer(1, 20))
-    elements.append(Paragraph("_______________", body_style))
-    elements.append(Paragraph("(Signature of Complainant)", body_style))
+    elements.append(t.fixed("signature"))
+    
+    return elements
+
+
+compile_document_templates()
+
+
+def generate_rent_agreement_pdf(data: Dict[str, Any]) -> io.BytesIO:
+    """Generate Rent Agreement PDF"""
+    return DOCUMENT_TEMPLATES["rent_agreement"].render(data)
+
+
+def generate_legal_notice_pdf(data: Dict[str, Any]) -> io.BytesIO:
+    """Generate Legal Notice PDF"""
+    return DOCUMENT_TEMPLATES["legal_notice"].render(data)
+
+
+def generate_affidavit_pdf(data: Dict[str, Any]) -> io.BytesIO:
+    """Generate General Affidavit PDF"""
+    return DOCUMENT_TEMPLATES["affidavit"].render(data)
+
+
+def generate_consumer_complaint_pdf(data: Dict[str, Any]) -> io.BytesIO:
+    """Generate Consumer Complaint PDF (under Consumer Protection Act, 2019)"""
+    return DOCUMENT_TEMPLATES["consumer_complaint"].render(data)
+
+
+# ============= PDF RENDER POOL =============
+# reportlab rendering is CPU-bound and would block the event loop, so it
+# runs in a bounded pool of warm worker processes. Workers are spawned, not
+# forked: a fork would copy the event loop, locks held by other threads and
+# open client connections; a spawned worker imports this module afresh.
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0 = thread mode
+PDF_RENDER_MAX_PENDING = int(os.getenv("PDF_RENDER_MAX_PENDING", "64"))  # In-flight + queued renders
+
+def render_document_pdf(doc_type: str, data: Dict[str, Any], version: Optional[str] = None) -> bytes:
+    """Render a document to PDF bytes. Runs inside a pool worker."""
+    return get_document_template(doc_type, version).render(data).getvalue()
+
+
+def render_document_file(doc_type: str, data: Dict[str, Any], path: str, version: Optional[str] = None) -> int:
+    """
+    Render a document straight to a file and return its size. Runs inside a
+    pool worker; the PDF never crosses back to the API process as bytes.
+    """
+    template = get_document_template(doc_type, version)
+    with open(path, "wb") as f:
+        template.render(data, f)
+    return os.path.getsize(path)
+
+
+def _warm_pdf_worker():
+    """Pool initializer: render once so reportlab modules, fonts and caches are loaded"""
+    render_document_pdf("affidavit", {})
+    for script in pdf_fonts.fonts:
+        # Exercise the script-font path too (shaping, subsetting)
+        render_document_pdf("affidavit", {"deponent_name": SCRIPT_FONTS[script][2]})
+
+
+class PdfRenderQueueFullError(Exception):
+    """Raised when too many renders are already pending"""
+    pass
+
+
+class PdfRenderPool:
+    """
+    Bounded ProcessPoolExecutor for PDF rendering with queue-depth metrics.
+    With 0 workers, renders run in a thread instead (still off the event loop).
+    """
+    def __init__(self, workers: int = PDF_RENDER_WORKERS, max_pending: int = PDF_RENDER_MAX_PENDING):
+        self._workers = workers
+        self._max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+        self._latencies_ms = deque(maxlen=1000)
+        self.peak_pending = 0
+        self.rendered = 0
+        self.failed = 0
+        self.rejected = 0
+    
+    def start(self):
+        """Create the pool and spawn warm workers"""
+        if self._executor or self._workers <= 0:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_pdf_worker
+        )
+        # Workers spawn on demand; submit no-ops so all of them start warming now
+        for _ in range(self._workers):
+            self._executor.submit(int)
+        print(f"✅ PDF render pool started: {self._workers} worker process(es)")
+    
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    async def render(self, doc_type: str, data: Dict[str, Any], out_path: Optional[str] = None,
+                     version: Optional[str] = None):
+        """
+        Render off the event loop; raises PdfRenderQueueFullError when saturated.
+        Returns the PDF bytes, or with out_path the size of the file written there.
+        version selects a registered template version (default: current).
+        """
+        if self._pending >= self._max_pending:
+            self.rejected += 1
+            raise PdfRenderQueueFullError("PDF renderer is busy, please retry shortly")
+        
+        self.start()
+        self._pending += 1
+        self.peak_pending = max(self.peak_pending, self._pending)
+        started = time.perf_counter()
+        if out_path:
+            render_fn, args = render_document_file, (doc_type, data, out_path, version)
+        else:
+            render_fn, args = render_document_pdf, (doc_type, data, version)
+        try:
+            if self._executor:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._executor, render_fn, *args)
+            else:
+                result = await asyncio.to_thread(render_fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._pending -= 1
+        
+        self.rendered += 1
+        self._latencies_ms.append((time.perf_counter() - started) * 1000)
+        return result
+    
+    def stats(self) -> dict:
+        """Queue depth and render latency metrics"""
+        latencies = sorted(self._latencies_ms)
+        
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2)
+        
+        workers = max(self._workers, 1)
+        return {
+            "mode": "process_pool" if self._workers > 0 else "thread",
+            "workers": self._workers,
+            "pending": self._pending,
+            "queued": max(0, self._pending - workers),
+            "peak_pending": self.peak_pending,
+            "max_pending": self._max_pending,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "render_ms_p50": percentile(0.50),
+            "render_ms_p99": percentile(0.99),
+        }
+
+
+pdf_render_pool = PdfRenderPool()
+
+
+@app.on_event("startup")
+async def start_pdf_render_pool():
+    pdf_render_pool.start()
+
+
+@app.on_event("shutdown")
+async def stop_pdf_render_pool():
+    pdf_render_pool.shutdown()
+
+
+# ============= LAZY DOCUMENT STORAGE =============
+# DOCUMENT_STORAGE_MODE=lazy keeps only the input data and template version.
+# The PDF is rendered on first download and held in a bounded LRU instead
+# of storage, since most generated documents are never fetched again.
+DOCUMENT_STORAGE_MODE = os.getenv("DOCUMENT_STORAGE_MODE", "eager").strip().lower()
+DOCUMENT_LAZY_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_LAZY_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))  # 16 MB
+
+if DOCUMENT_STORAGE_MODE not in ("eager", "lazy"):
+    raise RuntimeError(f"Invalid DOCUMENT_STORAGE_MODE: {DOCUMENT_STORAGE_MODE!r}")
+
+lazy_document_cache = LRUCache(max_bytes=DOCUMENT_LAZY_CACHE_MAX_BYTES)
+
+
+def is_lazy_document(record: dict) -> bool:
+    return record.get("storage_mode") == "lazy"
+
+
+async def render_lazy_document(record: dict, promote: bool = True) -> bytes:
+    """
+    Render a lazily stored document with the template version it was created
+    with, reusing recently rendered output. Raises DocumentTemplateRetiredError
+    if that version is no longer registered rather than changing the wording.
+    """
+    template = get_document_template(record["type"], record["template_version"])
+    
+    cache_key = f"{record['id']}:{template.version}"
+    pdf_bytes = lazy_document_cache.get(cache_key)
+    if pdf_bytes is None:
+        data = {**record["data"], DOCUMENT_DATE_FIELD: record["document_date"]}
+        pdf_bytes = await pdf_render_pool.render(record["type"], data, version=template.version)
+        if promote:
+            lazy_document_cache.put(cache_key, pdf_bytes)
+    return pdf_bytes
+
+
+async def read_document_pdf(record: dict, promote: bool = True) -> Optional[bytes]:
+    """
+    PDF bytes for a document record, whichever way it was stored.
+    promote=False keeps bulk reads (batches) out of the interactive caches.
+    """
+    if is_lazy_document(record):
+        return await render_lazy_document(record, promote)
+    return storage.read_file(record["storage_path"], promote)
+
+
+def document_download_url(record: dict, user_id: str) -> str:
+    """
+    Fresh signed URL (15 minutes) for a document.
+    SECURITY: Only the document owner can get one.
+    """
+    if is_lazy_document(record):
+        # No blob exists yet, so ownership is checked against the record
+        if record.get("user_id") != user_id:
+            raise PermissionError("Access denied: You can only access your own files")
+        return storage.sign_path(record["storage_path"], expires_in_minutes=15)
+    
+    return storage.generate_signed_url(
+        path=record["storage_path"],
+        requester_uid=user_id,
+        expires_in_minutes=15
+    )
+
+
+def lazy_document_for_path(path: str) -> Optional[dict]:
+    """The lazily stored document behind a signed documents/{uid}/{doc_id}.pdf path"""
+    parts = path.split("/")
+    if len(parts) != 3 or parts[0] != "documents" or not parts[2].endswith(".pdf"):
+        return None
+    
+    doc = db.collection("documents").document(parts[2][:-len(".pdf")]).get()
+    record = doc.to_dict() if doc.exists else None
+    if not record or not is_lazy_document(record) or record.get("storage_path") != path:
+        return None
+    return record
+
+
+# ============= DOCUMENT RESULT CACHE =============
+# Double-clicks and retries resubmit identical documents; serve those from
+# the already-stored PDF instead of re-rendering. A resubmission that
+# arrives while the first is still rendering waits for that render.
+DOCUMENT_RESULT_CACHE_SIZE = int(os.getenv("DOCUMENT_RESULT_CACHE_SIZE", "1024"))
+
+document_result_cache = LRUCache(max_entries=DOCUMENT_RESULT_CACHE_SIZE)
+document_flights: Dict[str, asyncio.Future] = {}  # cache_key -> record of the render in progress
+
+
+def document_cache_key(user_id: str, doc_type: str, data: Dict[str, Any]) -> str:
+    """
+    Canonical hash of (template version, doc type, data).
+    Scoped per user because stored PDFs are owner-private, and per day
+    because templates fill in today's date when none is given.
+    """
+    canonical = json.dumps({
+        "user_id": user_id,
+        "template_version": DOCUMENT_TEMPLATES[doc_type].version,
+        "document_type": doc_type,
+        "data": data,
+        "rendered_on": datetime.now().date().isoformat(),
+    }, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_cached_document(cache_key: str, user_id: str) -> Optional[dict]:
+    """Return the stored document record for a cache hit, if it is still valid"""
+    doc_id = document_result_cache.get(cache_key)
+    if not doc_id:
+        return None
+    
+    doc = db.collection("documents").document(doc_id).get()
+    record = doc.to_dict() if doc.exists else None
+    if not record or record.get("user_id") != user_id:
+        document_result_cache.pop(cache_key)
+        return None
+    if not is_lazy_document(record) and not storage.get_file_info(record["storage_path"]):
+        document_result_cache.pop(cache_key)
+        return None
+    return record
+
+
+def document_reusable(user_id: str, doc_type: str, data: Dict[str, Any]) -> bool:
+    """Whether create_document would reuse a stored or in-progress render"""
+    cache_key = document_cache_key(user_id, doc_type, data)
+    return cache_key in document_flights or get_cached_document(cache_key, user_id) is not None
+
+
+async def create_document(user_id: str, doc_type: str, data: Dict[str, Any], charge=None) -> dict:
+    """
+    Render (or reuse) a document and store it privately.
+    In lazy storage mode only the record is written; rendering waits for
+    the first download.
+    charge() is called only when a new render starts, never for reuse,
+    and may raise to refuse it.
+    Returns the document record plus whether it came from the result cache.
+    """
+    cache_key = document_cache_key(user_id, doc_type, data)
+    cached = get_cached_document(cache_key, user_id)
+    if cached:
+        return {**cached, "cached": True}
+    
+    flight = document_flights.get(cache_key)
+    if flight is not None:
+        # Identical request already rendering (double-click): share its result
+        return {**await asyncio.shield(flight), "cached": True}
+    
+    if charge:
+        charge()
+    flight = document_flights[cache_key] = asyncio.get_running_loop().create_future()
+    try:
+        document_record = await store_new_document(user_id, doc_type, data)
+    except BaseException as e:
+        flight.set_exception(e if isinstance(e, Exception) else RuntimeError("Document generation was interrupted"))
+        flight.exception()  # Followers re-raise it; don't log it as unretrieved
+        raise
+    else:
+        document_result_cache.put(cache_key, document_record["id"])
+        flight.set_result(document_record)
+    finally:
+        del document_flights[cache_key]
+    
+    return {**document_record, "cached": False}
+
+
+async def store_new_document(user_id: str, doc_type: str, data: Dict[str, Any]) -> dict:
+    """Render and store a new document (or only its record in lazy mode)"""
+    # Generate document ID
+    doc_id = str(uuid.uuid4())[:8]
+    
+    # SECURITY: Store PDF in PRIVATE storage at documents/{userId}/{docId}.pdf
+    storage_path = f"documents/{user_id}/{doc_id}.pdf"
+    if DOCUMENT_STORAGE_MODE == "eager":
+        # Rendered in the worker pool so the event loop stays responsive.
+        # The worker writes to a spool file that is renamed into storage, so
+        # long documents are never held in this process.
+        spool_path = storage.spool_path()
+        try:
+            await pdf_render_pool.render(doc_type, data, out_path=spool_path)
+            storage.upload_from_path(
+                path=storage_path,
+                src_path=spool_path,
+                owner_uid=user_id,
+                metadata={
+                    "type": doc_type,
+                    "content_type": "application/pdf"
+                }
+            )
+        finally:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+    
+    # Store document metadata in Firestore (NOT the PDF itself)
+    document_record = {
+        "id": doc_id,
+        "user_id": user_id,
+        "type": doc_type,
+        "storage_path": storage_path,  # Reference to private storage
+        "data": data,
+        "template_version": DOCUMENT_TEMPLATES[doc_type].version,
+        "storage_mode": DOCUMENT_STORAGE_MODE,
+        "document_date": datetime.now().strftime('%d/%m/%Y'),
+        "created_at": datetime.now().isoformat(),
+        "status": "generated"
+    }
+    
+    db.collection("documents").document(doc_id).set(document_record)
+    return document_record
+
+
+# ============= DOCUMENT GENERATION JOBS =============
+# Opt-in async mode: POST enqueues a job and returns immediately; a bounded
+# set of workers renders it while the client polls or listens via SSE.
+DOCUMENT_JOB_WORKERS = int(os.getenv("DOCUMENT_JOB_WORKERS", "2"))
+DOCUMENT_JOB_QUEUE_SIZE = int(os.getenv("DOCUMENT_JOB_QUEUE_SIZE", "100"))
+# Finished jobs (form data already dropped) stay pollable this long, up to a count
+DOCUMENT_JOB_RETENTION_SECONDS = int(os.getenv("DOCUMENT_JOB_RETENTION_SECONDS", "3600"))
+DOCUMENT_JOB_MAX_FINISHED = int(os.getenv("DOCUMENT_JOB_MAX_FINISHED", "1000"))
+
+
+class DocumentJobQueueFullError(Exception):
+    """Raised when the job queue cannot accept more work"""
+    pass
+
+
+class DocumentJobQueue:
+    """
+    Bounded asyncio queue of document-generation jobs.
+    Job state lives in the document_jobs collection; completion is signalled
+    to SSE subscribers through a per-job asyncio.Event. Finished jobs lose
+    their form data and are deleted after DOCUMENT_JOB_RETENTION_SECONDS.
+    """
+    def __init__(self, workers: int = DOCUMENT_JOB_WORKERS, max_size: int = DOCUMENT_JOB_QUEUE_SIZE):
+        self._workers = workers
+        self._max_size = max_size
+        self._queue = None
+        self._tasks = []
+        self._events = {}  # job_id -> asyncio.Event, set when the job finishes
+        self._finished = OrderedDict()  # job_id -> monotonic finish time, oldest first
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+    
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self._max_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+    
+    async def shutdown(self):
+        """Stop the workers; running and queued jobs end as failed so pollers stop"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._queue and not self._queue.empty():
+            self._finish(self._queue.get_nowait(), {
+                "status": "failed", "error": "Server restarted before the job ran; please resubmit"
+            })
+            self.failed += 1
+    
+    def submit(self, user_id: str, doc_type: str, data: Dict[str, Any]) -> dict:
+        """Enqueue a job; raises DocumentJobQueueFullError when the queue is full"""
+        self.start()
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "id": job_id,
+            "user_id": user_id,
+            "document_type": doc_type,
+            "data": data,
+            "status": "queued",
+            "document_id": None,
+            "error": None,
+            "created_at": datetime.now().isoformat()
+        }
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise DocumentJobQueueFullError("Document queue is full, please retry shortly")
+        
+        db.collection("document_jobs").document(job_id).set(job)
+        self._events[job_id] = asyncio.Event()
+        self._expire_finished()
+        return job
+    
+    def retry_after_seconds(self) -> int:
+        """Rough time for the current backlog to drain"""
+        render_ms = pdf_render_pool.stats()["render_ms_p50"] or 1000
+        backlog = self._queue.qsize() if self._queue else 0
+        return max(1, int(backlog * render_ms / 1000 / max(self._workers, 1)))
+    
+    async def wait(self, job_id: str, timeout: float):
+        """Wait until the job finishes; raises asyncio.TimeoutError after `timeout`"""
+        event = self._events.get(job_id)
+        if event:
+            await asyncio.wait_for(event.wait(), timeout)
+        else:
+            await asyncio.sleep(min(timeout, 1))  # Finished already, or unknown to this process
+    
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+    
+    async def _run(self, job_id: str):
+        job_ref = db.collection("document_jobs").document(job_id)
+        job = job_ref.get().to_dict()
+        job_ref.update({"status": "running", "started_at": datetime.now().isoformat()})
+        try:
+            document = await create_document(job["user_id"], job["document_type"], job["data"])
+            self._finish(job_id, {"status": "completed", "document_id": document["id"], "cached": document["cached"]})
+            self.completed += 1
+        except asyncio.CancelledError:
+            self._finish(job_id, {"status": "failed", "error": "Server restarted while rendering; please resubmit"})
+            self.failed += 1
+            raise
+        except Exception as e:
+            self._finish(job_id, {"status": "failed", "error": str(e)})
+            self.failed += 1
+    
+    def _finish(self, job_id: str, fields: dict):
+        """Record the final status, drop the form data and wake SSE subscribers"""
+        db.collection("document_jobs").document(job_id).update({
+            **fields, "data": None, "completed_at": datetime.now().isoformat()
+        })
+        event = self._events.pop(job_id, None)
+        if event:
+            event.set()
+        self._finished[job_id] = time.monotonic()
+        self._expire_finished()
+    
+    def _expire_finished(self):
+        """Delete finished jobs past their retention time or over the count bound"""
+        cutoff = time.monotonic() - DOCUMENT_JOB_RETENTION_SECONDS
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > cutoff and len(self._finished) <= DOCUMENT_JOB_MAX_FINISHED:
+                break
+            del self._finished[job_id]
+            db.collection("document_jobs").document(job_id).delete()
+    
+    def stats(self) -> dict:
+        return {
+            "workers": self._workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_size": self._max_size,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "retained_finished": len(self._finished),
+        }
+
+
+document_job_queue = DocumentJobQueue()
+
+
+@app.on_event("startup")
+async def start_document_job_queue():
+    document_job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_document_job_queue():
+    await document_job_queue.shutdown()
+
+
+# ============= DOCUMENT BATCHES =============
+# Bulk generation streams a ZIP back as each PDF finishes. Only a small
+# window of renders is in flight at once, so memory stays bounded however
+# large the batch is.
+DOCUMENT_BATCH_MAX_SIZE = int(os.getenv("DOCUMENT_BATCH_MAX_SIZE", "25"))  # At most the DOCUMENT_BATCH_RATE_LIMIT amount
+DOCUMENT_BATCH_CONCURRENCY = int(os.getenv("DOCUMENT_BATCH_CONCURRENCY", str(max(PDF_RENDER_WORKERS, 1) * 2)))
+
+
+class ZipChunkBuffer:
+    """Write-only, non-seekable sink for ZipFile; drained after every entry"""
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def stream_document_batch(user_id: str, batch_id: str, documents: List[DocumentData]):
+    """
+    Render and store every document in the batch, yielding ZIP bytes as each
+    PDF completes. Entries arrive in completion order; manifest.json at the
+    end maps each request index to its file (or error).
+    """
+    buffer = ZipChunkBuffer()
+    manifest = []
+    pending = set()
+    queue = iter(enumerate(documents))
+    
+    async def build(index: int, item: DocumentData):
+        entry = {"index": index, "type": item.document_type}
+        try:
+            document = await create_document(user_id, item.document_type, item.data)
+            pdf_bytes = await read_document_pdf(document, promote=False)
+        except Exception as e:
+            entry["error"] = str(e)
+            return entry, None
+        entry.update({"document_id": document["id"], "cached": document["cached"]})
+        return entry, pdf_bytes
+    
+    def refill():
+        for index, item in queue:
+            pending.add(asyncio.ensure_future(build(index, item)))
+            if len(pending) >= DOCUMENT_BATCH_CONCURRENCY:
+                return
+    
+    # PDF page streams are already compressed, so entries are stored as-is
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        try:
+            refill()
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    entry, pdf_bytes = task.result()
+                    if pdf_bytes is not None:
+                        entry["file"] = f"{entry['index'] + 1:03d}_{entry['type']}_{entry['document_id']}.pdf"
+                        archive.writestr(entry["file"], pdf_bytes)
+                    manifest.append(entry)
+                    yield buffer.drain()
+                refill()
+            
+            manifest.sort(key=lambda entry: entry["index"])
+            archive.writestr("manifest.json", json.dumps({"batch_id": batch_id, "documents": manifest}, indent=2))
+        finally:
+            # Client went away mid-stream: stop rendering the rest of the batch
+            for task in pending:
+                task.cancel()
+    yield buffer.drain()
+
+
+def get_owned_job(job_id: str, user_id: str) -> dict:
+    """Fetch a job, enforcing that the requester owns it"""
+    doc = db.collection("document_jobs").document(job_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Job not found")
     
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+    job = doc.to_dict()
+    if job.get("user_id") != user_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return job
+
+
+def job_status_payload(job: dict) -> dict:
+    """Public view of a job; completed jobs include a fresh signed URL"""
+    payload = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "type": job["document_type"],
+        "document_id": job.get("document_id"),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "completed_at": job.get("completed_at")
+    }
+    if job["status"] == "completed":
+        document = db.collection("documents").document(job["document_id"]).get().to_dict()
+        payload["download_url"] = document_download_url(document, job["user_id"])
+        payload["expires_in"] = "15 minutes"
+    return payload
+
+# ============= DOCUMENT GENERATOR ENDPOINTS =============
+# Per-user document budgets, charged per document. Single and async
+# generation share DOCUMENT_RATE_LIMIT; batches draw on their own, larger
+# DOCUMENT_BATCH_RATE_LIMIT so one batch can't starve interactive use.
+DOCUMENT_RATE_LIMIT = os.getenv("DOCUMENT_RATE_LIMIT", "10/minute")
+DOCUMENT_BATCH_RATE_LIMIT = os.getenv("DOCUMENT_BATCH_RATE_LIMIT", "100/hour")
+DOCUMENT_BUDGETS = {
+    "documents": (DOCUMENT_RATE_LIMIT, parse_rate_limit(DOCUMENT_RATE_LIMIT)),
+    "batch_documents": (DOCUMENT_BATCH_RATE_LIMIT, parse_rate_limit(DOCUMENT_BATCH_RATE_LIMIT)),
+}
+
+if DOCUMENT_BATCH_MAX_SIZE > DOCUMENT_BUDGETS["batch_documents"][1].amount:
+    raise RuntimeError(f"DOCUMENT_BATCH_MAX_SIZE ({DOCUMENT_BATCH_MAX_SIZE}) exceeds DOCUMENT_BATCH_RATE_LIMIT ({DOCUMENT_BATCH_RATE_LIMIT})")
+
+
+def charge_documents(request: Request, count: int, budget: str = "documents"):
+    """Take `count` documents from the caller's `budget`, or 429"""
+    setting, limit = DOCUMENT_BUDGETS[budget]
+    if not limiter.limiter.hit(limit, budget, get_rate_limit_key(request), cost=count):
+        raise HTTPException(
+            status_code=429,
+            detail=f"Document limit reached ({setting}); please retry shortly",
+            headers={"Retry-After": str(limit.get_expiry())}
+        )
 
 
 @app.post("/api/documents/generate")
-@limiter.limit("10/minute")  # Rate limit: 10 documents per minute
 async def generate_document(
     request: Request,
     doc_data: DocumentData,
+    async_mode: bool = False,
     user = Depends(require_auth)  # SECURITY: Require authentication
 ):
     """
     Generate legal document PDF.
     SECURITY: PDFs are stored privately at documents/{userId}/{docId}.pdf
     Access only via authenticated signed URLs.
+    Identical resubmissions return the already-stored PDF (cached: true)
+    and don't count against DOCUMENT_RATE_LIMIT.
+    
+    With ?async_mode=true the request is queued and answered with 202 and a
+    job id; poll /api/documents/jobs/{job_id} or subscribe to its /events.
+    A full queue answers 429 with Retry-After.
     """
     user_id = user["uid"]
     doc_type = doc_data.document_type
     data = doc_data.data
     
     # Generate PDF based on document type
-    generators = {
-        "rent_agreement": generate_rent_agreement_pdf,
-        "legal_notice": generate_legal_notice_pdf,
-        "affidavit": generate_affidavit_pdf,
-        "consumer_complaint": generate_consumer_complaint_pdf,
-    }
-    
-    generator = generators.get(doc_type)
-    if not generator:
+    if doc_type not in DOCUMENT_TEMPLATES:
         raise HTTPException(status_code=400, detail=f"Unknown document type: {doc_type}")
     
-    try:
-        pdf_buffer = generator(data)
-        pdf_bytes = pdf_buffer.read()
-        
-        # Generate document ID
-        doc_id = str(uuid.uuid4())[:8]
-        
-        # SECURITY: Store PDF in PRIVATE storage at documents/{userId}/{docId}.pdf
-        storage_path = f"documents/{user_id}/{doc_id}.pdf"
-        storage.upload_file(
-            path=storage_path,
-            data=pdf_bytes,
-            owner_uid=user_id,
-            metadata={
-                "type": doc_type,
-                "content_type": "application/pdf"
-            }
-        )
-        
-        # Store document metadata in Firestore (NOT the PDF itself)
-        document_record = {
-            "id": doc_id,
-            "user_id": user_id,
-            "type": doc_type,
-            "storage_path": storage_path,  # Reference to private storage
-            "data": data,
-            "created_at": datetime.now().isoformat(),
-            "status": "generated"
-        }
+    if async_mode:
+        if not document_reusable(user_id, doc_type, data):
+            charge_documents(request, 1)
+        try:
+            job = document_job_queue.submit(user_id, doc_type, data)
+        except DocumentJobQueueFullError as e:
+            raise HTTPException(
+                status_code=429,
+                detail=str(e),
+                headers={"Retry-After": str(document_job_queue.retry_after_seconds())}
+            )
         
-        db.collection("documents").document(doc_id).set(document_record)
+        return JSONResponse(status_code=202, content={
+            "success": True,
+            "job_id": job["id"],
+            "status": job["status"],
+            "status_url": f"/api/documents/jobs/{job['id']}",
+            "events_url": f"/api/documents/jobs/{job['id']}/events",
+            "message": "Document queued for generation."
+        })
+    
+    try:
+        document = await create_document(user_id, doc_type, data, charge=lambda: charge_documents(request, 1))
         
         # Generate signed URL for authenticated download (expires in 15 minutes)
-        signed_url = storage.generate_signed_url(
-            path=storage_path,
-            requester_uid=user_id,
-            expires_in_minutes=15
-        )
+        signed_url = document_download_url(document, user_id)
         
         return {
             "success": True,
-            "document_id": doc_id,
+            "document_id": document["id"],
             "type": doc_type,
             "download_url": signed_url,  # Time-limited authenticated URL
             "expires_in": "15 minutes",
+            "cached": document["cached"],
             "message": "Document generated. Download URL is private and time-limited."
         }
+    except HTTPException:
+        raise
+    except PdfRenderQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except StorageQuotaExceededError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
 
 
+@app.post("/api/documents/generate-batch")
+@limiter.limit("5/minute")
+async def generate_document_batch(
+    request: Request,
+    batch: DocumentBatch,
+    user = Depends(require_auth)  # SECURITY: Require authentication
+):
+    """
+    Generate up to DOCUMENT_BATCH_MAX_SIZE documents in one request.
+    Each PDF is stored privately like /api/documents/generate, and the
+    response is a ZIP streamed as documents finish. Every document not
+    already stored counts against the caller's DOCUMENT_BATCH_RATE_LIMIT.
+    """
+    user_id = user["uid"]
+    documents = batch.documents
+    
+    if not documents:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(documents) > DOCUMENT_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many documents in batch (max {DOCUMENT_BATCH_MAX_SIZE})"
+        )
+    
+    # Validate up front; once streaming starts the status code is committed
+    for item in documents:
+        if item.document_type not in DOCUMENT_TEMPLATES:
+            raise HTTPException(status_code=400, detail=f"Unknown document type: {item.document_type}")
+    new = sum(not document_reusable(user_id, item.document_type, item.data) for item in documents)
+    if new:
+        charge_documents(request, new, budget="batch_documents")
+    
+    batch_id = str(uuid.uuid4())[:8]
+    return StreamingResponse(
+        stream_document_batch(user_id, batch_id, documents),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=documents_{batch_id}.zip"}
+    )
+
+
+@app.get("/api/documents/jobs/{job_id}")
+async def get_document_job(job_id: str, user = Depends(require_auth)):
+    """Poll an async document-generation job"""
+    job = get_owned_job(job_id, user["uid"])
+    return {"success": True, **job_status_payload(job)}
+
+
+@app.get("/api/documents/jobs/{job_id}/events")
+async def document_job_events(job_id: str, user = Depends(require_auth)):
+    """
+    Server-sent events for an async job: a `status` event now, repeated
+    every 15s as a heartbeat, and a final one when the job completes or fails.
+    """
+    user_id = user["uid"]
+    get_owned_job(job_id, user_id)
+    
+    async def event_stream():
+        while True:
+            job = get_owned_job(job_id, user_id)
+            yield f"event: status\ndata: {json.dumps(job_status_payload(job))}\n\n"
+            if job["status"] in ("completed", "failed"):
+                return
+            try:
+                await document_job_queue.wait(job_id, timeout=15)
+            except asyncio.TimeoutError:
+                pass  # Re-send the current status as a heartbeat
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/documents/{doc_id}/download")
 async def download_document(
     doc_id: str,
@@ -1556,11 +4747,7 @@ async def download_document(
         raise HTTPException(status_code=404, detail="Document file not found")
     
     # Generate fresh signed URL
-    signed_url = storage.generate_signed_url(
-        path=storage_path,
-        requester_uid=user_id,
-        expires_in_minutes=15
-    )
+    signed_url = document_download_url(doc_data, user_id)
     
     return {
         "success": True,
@@ -1569,11 +4756,29 @@ async def download_document(
     }
 
 
+@app.get("/api/storage/usage")
+async def storage_usage(user = Depends(require_auth)):
+    """Bytes stored and remaining quota for the current user"""
+    return {"success": True, **storage.get_usage(user["uid"])}
+
+
+def iter_file(f, chunk_size: int = 64 * 1024):
+    """Chunks of an open file, closed once exhausted"""
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
 @app.get("/api/storage/download")
 async def storage_download(token: str):
     """
     Download file using signed URL token.
     SECURITY: Token-based access with expiration.
+    With STORAGE_DOWNLOAD_OFFLOAD set, the bytes are handed off to the
+    reverse proxy (or streamed from disk) once the token is validated.
     """
     # Validate token
     file_path = storage.validate_signed_url(token)
@@ -1583,20 +4788,63 @@ async def storage_download(token: str):
     # Get file data
     try:
         # For signed URL downloads, we bypass the ownership check since token was already validated
-        file_info = storage._files.get(file_path)
+        file_info = storage.get_file_info(file_path)
+        filename = file_path.split("/")[-1]
+        headers = {
+            "Content-Disposition": f"attachment; filename={filename}",
+        }
+        
         if not file_info:
+            # Lazily stored document: render on demand (never offloaded, nothing on disk)
+            record = lazy_document_for_path(file_path)
+            if not record:
+                raise HTTPException(status_code=404, detail="File not found")
+            pdf_bytes = await render_lazy_document(record)
+            return StreamingResponse(io.BytesIO(pdf_bytes), media_type="application/pdf", headers=headers)
+        
+        media_type = file_info["metadata"].get("content_type", "application/pdf")
+        
+        if STORAGE_DOWNLOAD_OFFLOAD == "x-accel-redirect":
+            # nginx serves the file from an internal location; no body from us
+            disk_name = os.path.basename(file_info["disk_path"])
+            headers["X-Accel-Redirect"] = f"{STORAGE_ACCEL_REDIRECT_PREFIX}/{disk_name}"
+            return Response(media_type=media_type, headers=headers)
+        
+        if STORAGE_DOWNLOAD_OFFLOAD == "x-sendfile":
+            headers["X-Sendfile"] = os.path.abspath(file_info["disk_path"])
+            return Response(media_type=media_type, headers=headers)
+        
+        if STORAGE_DOWNLOAD_OFFLOAD == "sendfile" or file_info["size"] >= STORAGE_STREAM_MIN_BYTES:
+            # Streamed from disk in chunks. Opened before the response starts,
+            # so a file deleted since the lookup is a 404, not a failed response
+            f = storage.open_file(file_path)
+            if f is None:
+                raise HTTPException(status_code=404, detail="File not found")
+            headers["Content-Length"] = str(os.fstat(f.fileno()).st_size)
+            return StreamingResponse(
+                iter_file(f),
+                media_type=media_type,
+                headers=headers,
+                background=BackgroundTask(f.close)  # In case the body never started
+            )
+        
+        file_data = storage.read_file(file_path)
+        if file_data is None:
             raise HTTPException(status_code=404, detail="File not found")
         
-        pdf_buffer = io.BytesIO(file_info["data"])
-        filename = file_path.split("/")[-1]
+        pdf_buffer = io.BytesIO(file_data)
         
         return StreamingResponse(
             pdf_buffer,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-            }
+            media_type=media_type,
+            headers=headers
         )
+    except HTTPException:
+        raise
+    except PdfRenderQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except DocumentTemplateRetiredError as e:
+        raise HTTPException(status_code=410, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
@@ -1749,17 +4997,171 @@ async def apply_as_lawyer(
     }
 
 
+# Verification document upload limits
+LAWYER_DOC_MAX_BYTES = int(os.getenv("LAWYER_DOC_MAX_BYTES", str(10 * 1024 * 1024)))  # 10 MB per file
+LAWYER_DOC_MAX_FILES = int(os.getenv("LAWYER_DOC_MAX_FILES", "5"))
+
+# Magic-number signatures of accepted verification document types
+VERIFICATION_DOC_SIGNATURES = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+]
+SNIFF_BYTES = max(len(signature) for signature, _ in VERIFICATION_DOC_SIGNATURES)
+
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    """Detect content type from the leading bytes of a file"""
+    for signature, content_type in VERIFICATION_DOC_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+class VerificationDocStream:
+    """
+    Streaming multipart/form-data handler for lawyer verification documents.
+    Each file part is size-checked, sniffed, hashed and written to storage
+    chunk by chunk as the request body arrives - never buffered whole.
+    """
+    def __init__(self, user_id: str, app_id: str, boundary: bytes):
+        self.user_id = user_id
+        self.app_id = app_id
+        self.uploaded = []
+        self._upload = None
+        self._content_type = None
+        self._head = b""
+        self._filename = None
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+    
+    async def consume(self, request: Request) -> List[dict]:
+        """Feed the request body through the parser; returns uploaded doc records"""
+        try:
+            async for chunk in request.stream():
+                self._parser.write(chunk)
+            self._parser.finalize()
+        except Exception:
+            self.abort()
+            raise
+        return self.uploaded
+    
+    def abort(self):
+        """Discard the in-progress part and any parts already committed"""
+        if self._upload:
+            self._upload.abort()
+            self._upload = None
+        for doc in self.uploaded:
+            storage.delete_file(doc["path"], requester_uid=self.user_id)
+        self.uploaded = []
+    
+    def _on_part_begin(self):
+        self._headers = {}
+        self._filename = None
+        self._content_type = None
+        self._head = b""
+    
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+    
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+    
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+    
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = params.get(b"filename")
+        if not filename:
+            return  # Plain form field - ignored
+        
+        if len(self.uploaded) >= LAWYER_DOC_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {LAWYER_DOC_MAX_FILES} files per upload")
+        
+        self._filename = os.path.basename(filename.decode("utf-8", "replace"))
+        safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", self._filename)[:100] or "document"
+        self._upload = storage.begin_upload(
+            path=f"lawyer_docs/{self.user_id}/{self.app_id}/{uuid.uuid4().hex[:8]}_{safe_name}",
+            owner_uid=self.user_id,
+            metadata={"type": "lawyer_verification", "application_id": self.app_id},
+            max_bytes=LAWYER_DOC_MAX_BYTES
+        )
+    
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if not self._upload:
+            return
+        chunk = data[start:end]
+        
+        # Hold back the first few bytes until the content type is known
+        if self._content_type is None:
+            self._head += chunk
+            if len(self._head) < SNIFF_BYTES:
+                return
+            self._detect_content_type()
+            chunk, self._head = self._head, b""
+        
+        self._write(chunk)
+    
+    def _on_part_end(self):
+        if not self._upload:
+            return
+        if self._content_type is None:
+            self._detect_content_type()
+            self._write(self._head)
+        
+        self._upload.metadata["content_type"] = self._content_type
+        self._upload.metadata["filename"] = self._filename
+        result = self._upload.commit()
+        self._upload = None
+        
+        self.uploaded.append({
+            "path": result["path"],
+            "filename": self._filename,
+            "content_type": self._content_type,
+            "size": result["size"],
+            "sha256": result["sha256"],
+            "uploaded_at": result["created_at"]
+        })
+    
+    def _detect_content_type(self):
+        self._content_type = sniff_content_type(self._head)
+        if not self._content_type:
+            raise HTTPException(status_code=415, detail="Unsupported file type. Upload PDF, PNG or JPEG documents.")
+    
+    def _write(self, chunk: bytes):
+        try:
+            self._upload.write(chunk)
+        except (UploadTooLargeError, StorageQuotaExceededError) as e:
+            raise HTTPException(status_code=413, detail=str(e))
+
+
 @app.post("/api/lawyers/applications/{app_id}/upload-docs")
 async def upload_verification_docs(
     app_id: str,
+    request: Request,
     user = Depends(require_auth)
 ):
     """
     Upload verification documents for lawyer application.
+    Expects multipart/form-data with one or more file parts (PDF, PNG or JPEG).
     SECURITY:
     - Only application owner can upload
     - Docs stored at lawyer_docs/{userId}/{appId}/{filename}
     - No cross-user access
+    - Size and type enforced while streaming, before anything is stored
     """
     user_id = user["uid"]
     
@@ -1777,16 +5179,24 @@ async def upload_verification_docs(
             detail="Access denied: You can only upload documents for your own application"
         )
     
-    # In a real implementation, this would handle file upload
-    # For mock, we simulate storing document reference
-    doc_path = f"lawyer_docs/{user_id}/{app_id}/verification_document.pdf"
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data upload")
+    
+    # Reject obviously oversized bodies before reading a single byte
+    content_length = request.headers.get("content-length")
+    max_body = LAWYER_DOC_MAX_FILES * (LAWYER_DOC_MAX_BYTES + 64 * 1024)
+    if content_length and content_length.isdigit() and int(content_length) > max_body:
+        raise HTTPException(status_code=413, detail="Upload too large")
+    
+    uploaded = await VerificationDocStream(user_id, app_id, boundary).consume(request)
+    if not uploaded:
+        raise HTTPException(status_code=400, detail="No files uploaded")
     
-    # Update application with doc reference
+    # Update application with doc references
     db.collection("lawyer_applications").document(app_id).update({
-        "verification_docs": ArrayUnion([{
-            "path": doc_path,
-            "uploaded_at": datetime.now().isoformat()
-        }]),
+        "verification_docs": ArrayUnion(uploaded),
         "verification_status": "documents_uploaded",
         "updated_at": datetime.now().isoformat()
     })
@@ -1794,7 +5204,8 @@ async def upload_verification_docs(
     return {
         "success": True,
         "message": "Documents uploaded successfully. Your application is under review.",
-        "storage_path": doc_path
+        "storage_path": uploaded[0]["path"],
+        "documents": uploaded
     }
 
 
@@ -0,0 +1,251 @@
+"""
+Backend API Tests for SunoLegal NyayAI Chat
+Tests: POST /api/chat/nyayai, POST /api/chat/nyayai/stream, GET /api/chat/user-chats
+Run against a server started with LLM_BACKEND=mock.
+"""
+import pytest
+import requests
+import os
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+ADMIN_SECRET = os.environ.get('ADMIN_SECRET', 'demo_admin_secret_change_in_production')
+
+
+def auth_headers():
+    """Fresh mock user per test so rate limits don't collide"""
+    return {
+        "Authorization": f"Bearer mock_chat_{uuid.uuid4().hex[:8]}",
+        "Content-Type": "application/json"
+    }
+
+
+def metrics():
+    return requests.get(f"{BASE_URL}/api/admin/metrics", headers={"X-Admin-Secret": ADMIN_SECRET}).json()
+
+
+def read_events(response):
+    """Parse a server-sent events body into (event, data) pairs"""
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestNyayAIChat:
+    """NyayAI chat tests"""
+
+    def test_chat_returns_response(self):
+        """Test that a chat message gets a response and a session"""
+        response = requests.post(
+            f"{BASE_URL}/api/chat/nyayai",
+            json={"message": "How do I file an RTI application?"},
+            headers=auth_headers()
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] == True
+        assert data["response"]
+        assert data["session_id"]
+        print(f"Chat session: {data['session_id']}")
+
+    def test_stream_sends_tokens_then_done(self):
+        """Test that the streaming endpoint emits token events and one final done event"""
+        session_id = f"stream_{uuid.uuid4().hex[:8]}"
+        response = requests.post(
+            f"{BASE_URL}/api/chat/nyayai/stream",
+            json={"message": "What are my rights as a tenant?", "session_id": session_id},
+            headers=auth_headers()
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = read_events(response)
+        assert events[-1][0] == "done"
+        assert events[-1][1]["session_id"] == session_id
+        assert all(event == "token" for event, _ in events[:-1])
+        assert "".join(data["text"] for _, data in events[:-1])
+        print(f"Streamed {len(events) - 1} token event(s)")
+
+    def test_concurrent_guests_get_separate_sessions(self):
+        """Test that guests posting in the same second never share a session"""
+        questions = ["Is stridhan the wife's property?", "Can a tenant be evicted without notice?"]
+
+        def ask(question):
+            return requests.post(f"{BASE_URL}/api/chat/nyayai", json={"message": question}).json()
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(ask, questions))
+
+        assert results[0]["session_id"] != results[1]["session_id"]
+        print(f"Guest sessions: {[result['session_id'] for result in results]}")
+
+    def test_catalogue_question_answered_from_laws(self):
+        """Test that a direct laws-catalogue lookup is answered from the seeded entry"""
+        response = requests.post(
+            f"{BASE_URL}/api/chat/nyayai",
+            json={"message": "How do I apply for RTI?"},
+            headers=auth_headers()
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["law_id"]
+        assert "Public Information Officer" in data["response"]
+        print(f"Answered from catalogue entry {data['law_id']}")
+
+    def test_detailed_questions_not_answered_from_laws(self):
+        """Test that questions with conditions or details the catalogue doesn't cover go to the model"""
+        for question in (
+            "Can I file RTI against a private company, and what is the process?",
+            "Who can apply for PM Awas Yojana if I already own a house in my village?",
+        ):
+            response = requests.post(
+                f"{BASE_URL}/api/chat/nyayai",
+                json={"message": question},
+                headers=auth_headers()
+            )
+
+            assert response.status_code == 200
+            assert "law_id" not in response.json()
+            print(f"Sent to the model: {question}")
+
+    def test_follow_up_not_answered_from_laws(self):
+        """Test that a catalogue question inside a conversation is answered with its context"""
+        headers = auth_headers()
+        session_id = requests.post(
+            f"{BASE_URL}/api/chat/nyayai",
+            json={"message": "I asked my municipality for road repair records."},
+            headers=headers
+        ).json()["session_id"]
+
+        response = requests.post(
+            f"{BASE_URL}/api/chat/nyayai",
+            json={"message": "How do I apply for RTI?", "session_id": session_id},
+            headers=headers
+        )
+
+        assert "law_id" not in response.json()
+        print("Follow-up sent to the model")
+
+
+class TestChatFaqCache:
+    """Shared first-turn answer tests - chat_faq_cache"""
+
+    def test_repeated_question_served_from_cache(self):
+        """Test that another user's rephrasing of a first-turn question reuses the stored answer"""
+        topic = uuid.uuid4().hex[:8]
+        before = metrics()["chat_faq_cache"]["hits"]
+
+        first = requests.post(
+            f"{BASE_URL}/api/chat/nyayai",
+            json={"message": f"Can my landlord keep the deposit for repainting {topic}?"},
+            headers=auth_headers()
+        ).json()
+        second = requests.post(
+            f"{BASE_URL}/api/chat/nyayai",
+            json={"message": f"can my landlord keep the deposit,  for repainting {topic}"},
+            headers=auth_headers()
+        ).json()
+
+        assert first["cached"] == False
+        assert second["cached"] == True
+        assert second["response"] == first["response"]
+        assert second["session_id"] != first["session_id"]
+        assert metrics()["chat_faq_cache"]["hits"] == before + 1
+        print(f"Served from cache: {second['response'][:60]}")
+
+    def test_follow_up_turn_not_cached(self):
+        """Test that a question asked inside an existing conversation is never answered from the cache"""
+        question = f"Can my landlord keep the deposit for repainting {uuid.uuid4().hex[:8]}?"
+        requests.post(f"{BASE_URL}/api/chat/nyayai", json={"message": question}, headers=auth_headers())
+
+        headers = auth_headers()
+        session_id = requests.post(
+            f"{BASE_URL}/api/chat/nyayai", json={"message": "I rent a flat in Pune."}, headers=headers
+        ).json()["session_id"]
+        follow_up = requests.post(
+            f"{BASE_URL}/api/chat/nyayai",
+            json={"message": question, "session_id": session_id},
+            headers=headers
+        ).json()
+
+        assert follow_up["cached"] == False
+        print("Follow-up turn went to the model")
+
+
+class TestChatIndex:
+    """Sidebar summary tests - chat_index, GET /api/chat/user-chats"""
+
+    def test_sidebar_tracks_each_turn(self):
+        """Test that the sidebar entry follows the latest turn without carrying the messages"""
+        headers = auth_headers()
+        first = requests.post(
+            f"{BASE_URL}/api/chat/nyayai",
+            json={"message": f"My employer withheld my salary {uuid.uuid4().hex[:8]}"},
+            headers=headers
+        ).json()
+        second = requests.post(
+            f"{BASE_URL}/api/chat/nyayai",
+            json={"message": "It has been three months now.", "session_id": first["session_id"]},
+            headers=headers
+        ).json()
+
+        items = requests.get(f"{BASE_URL}/api/chat/user-chats", headers=headers).json()["items"]
+
+        assert [item["session_id"] for item in items] == [first["session_id"]]
+        assert items[0]["message_count"] == 4
+        assert second["response"].startswith(items[0]["last_message"])
+        assert "messages" not in items[0]
+        print(f"Sidebar entry: {items[0]}")
+
+    def test_sidebar_newest_first_and_per_user(self):
+        """Test that sessions are listed most recent first and only to their owner"""
+        headers = auth_headers()
+        sessions = [f"index_{uuid.uuid4().hex[:8]}" for _ in range(2)]
+        for session_id, question in zip(sessions, ("Is a verbal rent agreement valid?", "Can I break a lease early?")):
+            requests.post(
+                f"{BASE_URL}/api/chat/nyayai",
+                json={"message": f"{question} {uuid.uuid4().hex[:8]}", "session_id": session_id},
+                headers=headers
+            )
+
+        items = requests.get(f"{BASE_URL}/api/chat/user-chats", headers=headers).json()["items"]
+        other = requests.get(f"{BASE_URL}/api/chat/user-chats", headers=auth_headers()).json()["items"]
+
+        assert [item["session_id"] for item in items] == sessions[::-1]
+        assert other == []
+        print(f"Listed: {[item['session_id'] for item in items]}")
+
+
+class TestChatRouting:
+    """Model routing tests - chat_routing metrics"""
+
+    def test_turns_routed_by_complexity(self):
+        """Test that a lookup and a dispute question are sent to the fast and strong routes"""
+        headers = auth_headers()
+        topic = uuid.uuid4().hex[:8]
+        before = metrics()["chat_routing"]["routes"]
+
+        requests.post(f"{BASE_URL}/api/chat/nyayai", json={"message": f"What is a caveat {topic}?"}, headers=headers)
+        requests.post(
+            f"{BASE_URL}/api/chat/nyayai",
+            json={"message": f"My brother and I dispute the partition of ancestral land {topic}. "
+                             "Can I get an injunction?"},
+            headers=headers
+        )
+
+        after = metrics()["chat_routing"]["routes"]
+        assert after["fast"]["decisions"] == before["fast"]["decisions"] + 1
+        assert after["strong"]["decisions"] == before["strong"]["decisions"] + 1
+        assert after["strong"]["calls"] == before["strong"]["calls"] + 1
+        assert after["strong"]["output_tokens"] > before["strong"]["output_tokens"]
+        print(f"Strong route: {after['strong']['model']}, {after['strong']['calls']} call(s)")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,548 @@
+"""
+In-process Tests for SunoLegal NyayAI Chat Internals
+Tests: chat_faq_cache (TTL), build_chat_prompt (token window, rolling summary),
+ChatFlights (single-flight), ChatModelRoutes (fast/strong routing), session history
+ownership, ChatWriteBehind (read-your-writes, flush, chat_index)
+Runs against the offline mock LLM backend and the mock database.
+"""
+import pytest
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+
+os.environ.setdefault("LLM_BACKEND", "mock")
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp())
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+
+def mock_user():
+    uid = f"mock_internals_{uuid.uuid4().hex[:8]}"
+    return {"uid": uid, "is_guest": False}
+
+
+def chat_request(ip="203.0.113.9"):
+    """Minimal request the chat endpoints and their rate limiter accept"""
+    return Request({"type": "http", "method": "POST", "path": "/api/chat/nyayai", "query_string": b"",
+                    "headers": [], "client": (ip, 1234), "app": server.app})
+
+
+def ask(user, question, session_id=None, ip="203.0.113.9"):
+    return server.chat_with_nyayai(
+        request=chat_request(ip),
+        message=server.ChatMessage(message=question, session_id=session_id),
+        user=user
+    )
+
+
+GUEST = {"uid": "guest_user", "email": None, "is_guest": True}
+
+
+def exchange(question, answer="An answer."):
+    return [
+        {"role": "user", "content": question, "timestamp": f"{uuid.uuid4()}"},
+        {"role": "assistant", "content": answer, "timestamp": f"{uuid.uuid4()}"}
+    ]
+
+
+class RecordingLlm:
+    """Stand-in llm_backend that answers at once and records every call"""
+    name = "recording"
+
+    def __init__(self, reply="A recorded answer."):
+        self.reply = reply
+        self.calls = []
+
+    async def stream(self, session_id, messages, model=server.LLM_MODEL):
+        self.calls.append({"session_id": session_id, "messages": messages, "model": model})
+        yield self.reply
+
+
+def long_history(turns, words=40):
+    """Alternating user/assistant messages of about `words` words each"""
+    return [
+        {"role": role, "content": f"Turn {i} {role}: " + " ".join(["tenancy"] * words)}
+        for i in range(turns) for role in ("user", "assistant")
+    ]
+
+
+def verbatim_tokens(messages):
+    return sum(server.count_tokens(m["content"]) + 4 for m in messages)
+
+
+class TestChatFaqCache:
+    """Shared first-turn answer tests - chat_faq_cache, shared_answer_key"""
+
+    def test_cached_answer_expires(self, monkeypatch):
+        """Test that a cached answer is dropped after CHAT_FAQ_CACHE_TTL_SECONDS"""
+        now = [1000.0]
+        monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+        cache = server.LRUCache(max_entries=10, ttl=server.CHAT_FAQ_CACHE_TTL_SECONDS)
+        key = server.shared_answer_key(None, "What is RTI?", server.LLM_MODEL)
+        cache.put(key, "Cached answer")
+
+        now[0] += server.CHAT_FAQ_CACHE_TTL_SECONDS - 1
+        assert cache.get(server.shared_answer_key(None, "  what is RTI ", server.LLM_MODEL)) == "Cached answer"
+        now[0] += 2
+        assert cache.get(key) is None
+        assert cache.stats()["expirations"] == 1
+        print(f"Cache stats: {cache.stats()}")
+
+    def test_key_depends_on_model_and_turn(self):
+        """Test that answers aren't shared across models or into follow-up turns"""
+        key = server.shared_answer_key(None, "What is RTI?", "model-a")
+
+        assert server.shared_answer_key(None, "What is RTI?", "model-b") != key
+        assert server.shared_answer_key({"messages": exchange("Hi")}, "What is RTI?", "model-a") is None
+        assert server.shared_answer_key(None, "x" * (server.CHAT_FAQ_MAX_QUESTION_CHARS + 1), "model-a") is None
+        print(f"Shared key: {key}")
+
+    def test_key_depends_on_laws_context(self):
+        """Test that answers aren't shared across different catalogue entries quoted in the prompt"""
+        rti = {"title": "Right to Information Act", "type": "act", "description": "Access to public records."}
+        key = server.shared_answer_key(None, "What is RTI?", "model-a", [rti])
+
+        assert server.shared_answer_key(None, "What is RTI?", "model-a", [rti]) == key
+        assert server.shared_answer_key(None, "What is RTI?", "model-a") != key
+        assert server.shared_answer_key(None, "What is RTI?", "model-a", [dict(rti, description="Edited.")]) != key
+        print(f"Key with laws context: {key}")
+
+
+class TestChatWindow:
+    """Token window tests - build_chat_prompt, window_start, summarize_history"""
+
+    @pytest.fixture(autouse=True)
+    def small_budget(self, monkeypatch):
+        monkeypatch.setattr(server, "CHAT_CONTEXT_TOKEN_BUDGET", 400)
+        self.llm = RecordingLlm("Tenant in Pune; deposit dispute.")
+        monkeypatch.setattr(server, "llm_backend", self.llm)
+
+    def test_history_within_budget_sent_verbatim(self):
+        """Test that a short conversation goes to the model whole, with no summary call"""
+        chat = {"messages": long_history(2, words=10)}
+
+        messages, summary_update = asyncio.run(server.build_chat_prompt("s_short", chat, "And the notice?"))
+
+        assert summary_update is None
+        assert self.llm.calls == []
+        assert messages[1:-1] == [{"role": m["role"], "content": m["content"]} for m in chat["messages"]]
+        print(f"Sent {len(messages)} message(s) verbatim")
+
+    def test_overflow_rolls_older_turns_into_summary(self):
+        """Test that overflowing the budget folds older turns into a summary and keeps recent ones"""
+        history = long_history(12)
+
+        messages, summary_update = asyncio.run(
+            server.build_chat_prompt("s_long", {"messages": history}, "What should I do next?")
+        )
+        start = summary_update["summary_upto"]
+        kept = messages[1:-1]
+
+        assert summary_update["summary"] == "Tenant in Pune; deposit dispute."
+        assert verbatim_tokens(kept) <= server.CHAT_CONTEXT_TOKEN_BUDGET // 2
+        assert kept[0]["role"] == "user"
+        assert kept == [{"role": m["role"], "content": m["content"]} for m in history[start:]]
+        assert "Tenant in Pune; deposit dispute." in messages[0]["content"]
+        # One summary call, on the fast model, over exactly the turns that left the window
+        [call] = self.llm.calls
+        assert call["model"] == server.chat_routes.model("fast")
+        assert "Turn 0 user" in call["messages"][-1]["content"]
+        assert f"Turn {start // 2} user" not in call["messages"][-1]["content"]
+        print(f"Summarised {start} message(s), kept {len(kept)}")
+
+    def test_summary_reused_until_window_overflows_again(self):
+        """Test that a stored summary is reused without a call, then merged on the next overflow"""
+        history = long_history(12)
+        chat = {"messages": history[:20], "summary": "Stored summary.", "summary_upto": 16}
+
+        messages, summary_update = asyncio.run(server.build_chat_prompt("s_reuse", chat, "Next?"))
+        assert summary_update is None
+        assert self.llm.calls == []
+        assert "Stored summary." in messages[0]["content"]
+        assert len(messages) == 2 + 4
+
+        chat = {"messages": history + long_history(6), "summary": "Stored summary.", "summary_upto": 16}
+        _, summary_update = asyncio.run(server.build_chat_prompt("s_reuse", chat, "Next?"))
+        assert summary_update["summary_upto"] > 16
+        assert "EARLIER SUMMARY:\nStored summary." in self.llm.calls[0]["messages"][-1]["content"]
+        print(f"Summary advanced to {summary_update['summary_upto']}")
+
+
+class GatedSource:
+    """Completion that yields `first`, waits for release(), then yields `rest`"""
+
+    def __init__(self, first="Deposit ", rest="rules.", error=None):
+        self.first, self.rest, self.error = first, rest, error
+        self.started = 0
+        self.closed = False
+        self.gate = asyncio.Event()
+
+    def release(self):
+        self.gate.set()
+
+    async def __call__(self):
+        self.started += 1
+        try:
+            yield self.first
+            await self.gate.wait()
+            if self.error:
+                raise self.error
+            yield self.rest
+        finally:
+            self.closed = True
+
+
+async def collect(flight):
+    return "".join([text async for text in flight.follow()])
+
+
+class TestChatFlights:
+    """Single-flight tests - ChatFlights, ChatFlight"""
+
+    def test_identical_questions_share_one_call(self):
+        """Test that a caller joining mid-stream gets the whole answer from the one upstream call"""
+        source = GatedSource()
+
+        async def scenario():
+            flights = server.ChatFlights()
+            leader = flights.join("key", source)
+            first = asyncio.create_task(collect(leader))
+            await asyncio.sleep(0.01)  # Leader has its first chunk
+            follower = flights.join("key", source)
+            second = asyncio.create_task(collect(follower))
+            await asyncio.sleep(0)
+            source.release()
+            answers = await asyncio.gather(first, second)
+            await asyncio.sleep(0)
+            return flights, leader is follower, answers
+
+        flights, same_flight, answers = asyncio.run(scenario())
+
+        assert same_flight
+        assert source.started == 1
+        assert answers == ["Deposit rules.", "Deposit rules."]
+        assert flights.stats() == {"in_flight": 0, "started": 1, "joined": 1}
+        print(f"Flight stats: {flights.stats()}")
+
+    def test_failure_reaches_every_caller(self):
+        """Test that an upstream error is raised to the leader and every joined caller"""
+        source = GatedSource(error=RuntimeError("upstream down"))
+
+        async def scenario():
+            flights = server.ChatFlights()
+            callers = [asyncio.create_task(collect(flights.join("key", source))) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            source.release()
+            return await asyncio.gather(*callers, return_exceptions=True)
+
+        results = asyncio.run(scenario())
+
+        assert source.started == 1
+        assert all(isinstance(result, RuntimeError) for result in results)
+        print(f"Every caller saw: {results[0]}")
+
+    def test_last_caller_leaving_cancels_upstream(self):
+        """Test that the upstream call is cancelled once nobody is following it"""
+        source = GatedSource()
+
+        async def scenario():
+            flights = server.ChatFlights()
+            caller = asyncio.create_task(collect(flights.join("key", source)))
+            await asyncio.sleep(0.01)
+            caller.cancel()
+            await asyncio.gather(caller, return_exceptions=True)
+            await asyncio.sleep(0.01)
+            return flights
+
+        flights = asyncio.run(scenario())
+
+        assert source.closed
+        assert flights.active("key") is None
+        print("Abandoned flight cancelled")
+
+    def test_private_turns_never_joined(self):
+        """Test that a turn without a shared key always gets its own call"""
+        source = GatedSource()
+
+        async def scenario():
+            flights = server.ChatFlights()
+            first, second = flights.join(None, source), flights.join(None, source)
+            source.release()
+            await asyncio.gather(collect(first), collect(second))
+            return flights, first is second
+
+        flights, same_flight = asyncio.run(scenario())
+
+        assert not same_flight
+        assert source.started == 2
+        assert flights.stats()["joined"] == 0
+        print(f"Flight stats: {flights.stats()}")
+
+    def test_flight_started_while_queued_is_joined(self, monkeypatch):
+        """Test that a caller whose key got a flight while it queued for admission joins it and frees the slot"""
+        monkeypatch.setattr(server, "LLM_MAX_CONCURRENCY", 1)
+        monkeypatch.setattr(server, "llm_admission", server.LlmAdmission())
+        monkeypatch.setattr(server, "chat_flights", server.ChatFlights())
+        running, queued = GatedSource(), GatedSource()
+
+        async def scenario():
+            hold = await server.llm_admission.acquire("holder", False)
+            caller = asyncio.create_task(server.start_chat_flight(chat_request(), mock_user(), "key", queued))
+            await asyncio.sleep(0)
+            started = server.chat_flights.join("key", running)
+            hold()
+            flight, release = await caller
+            running.release()
+            return started, flight, release, await collect(flight)
+
+        started, flight, release, answer = asyncio.run(scenario())
+
+        assert flight is started and release is None
+        assert (running.started, queued.started) == (1, 0)
+        assert answer == "Deposit rules."
+        assert server.llm_admission.stats()["running"] == 0
+        print(f"Joined after queueing: {answer}")
+
+    def test_stream_joins_flight_before_responding(self, monkeypatch):
+        """Test that a stream joining a flight still replays it when the flight ends before the body starts"""
+        monkeypatch.setattr(server, "chat_flights", server.ChatFlights())
+        monkeypatch.setattr(server, "llm_admission", server.LlmAdmission())
+        llm = RecordingLlm()
+        monkeypatch.setattr(server, "llm_backend", llm)
+        question = f"Unlisted question {uuid.uuid4().hex[:8]}: how should I proceed now?"
+        route = server.chat_routes.pick(None, question)
+        _, laws = server.law_index.lookup(question)
+        key = server.shared_answer_key(None, question, server.chat_routes.model(route), laws)
+        source = GatedSource()
+
+        async def scenario():
+            leader = server.chat_flights.join(key, source)
+            first = asyncio.create_task(collect(leader))
+            await asyncio.sleep(0.01)
+            response = await server.stream_chat_with_nyayai(
+                request=chat_request(), message=server.ChatMessage(message=question), user=mock_user()
+            )
+            source.release()
+            await first  # The flight is over before this caller's body starts
+            return "".join([event async for event in response.body_iterator])
+
+        body = asyncio.run(scenario())
+
+        assert "Deposit " in body and "rules." in body
+        assert source.started == 1
+        assert llm.calls == []
+        assert server.llm_admission.stats()["admitted"] == 0
+        print("Stream replayed the flight it joined")
+
+
+class TestChatRouting:
+    """Model routing tests - HeuristicChatRouter, ChatModelRoutes"""
+
+    def test_lookup_question_goes_fast(self):
+        """Test that a short definition question is routed to the fast model"""
+        route, reason = server.HeuristicChatRouter().route(None, "What is an FIR?")
+
+        assert route == "fast"
+        assert "lookup" in reason
+        print(f"Routed {route} ({reason})")
+
+    def test_complex_question_goes_strong(self):
+        """Test that a situation-specific dispute question is routed to the strong model"""
+        question = "My brother and I dispute the partition of ancestral property. Can I get an injunction?"
+        route, reason = server.HeuristicChatRouter().route(None, question)
+
+        assert route == "strong"
+        assert "terms=" in reason
+        print(f"Routed {route} ({reason})")
+
+    def test_deep_conversation_raises_score(self, monkeypatch):
+        """Test that a long conversation tips a borderline question over to the strong model"""
+        monkeypatch.setattr(server, "CHAT_ROUTE_DEEP_TURNS", 3)
+        router = server.HeuristicChatRouter()
+        question = "Does the notice need to mention the section?"
+
+        assert router.route(None, question)[0] == "fast"
+        assert router.route({"messages": long_history(3, words=5)}, question)[0] == "strong"
+        print("Depth moved the turn to strong")
+
+    def test_fixed_router_sends_every_turn_to_its_route(self):
+        """Test that CHAT_ROUTER=strong routes even a lookup question to the strong model"""
+        routes = server.ChatModelRoutes(server.FixedChatRouter("strong"))
+
+        route = routes.pick(None, "What is an FIR?")
+
+        assert route == "strong"
+        assert routes.model(route) == server.LLM_MODEL_STRONG
+        assert routes.stats()["router"] == "strong"
+        print(f"Fixed router: {routes.stats()['router']}")
+
+    def test_route_calls_its_model_and_accounts_cost(self, monkeypatch):
+        """Test that each route calls its own model and bills tokens at that model's price"""
+        llm = RecordingLlm("Injunction answer.")
+        monkeypatch.setattr(server, "llm_backend", llm)
+        routes = server.ChatModelRoutes(server.HeuristicChatRouter())
+        messages = [{"role": "user", "content": "Can I get an injunction?"}]
+
+        answer = asyncio.run(routes.complete("strong", "s_route", messages))
+
+        stats = routes.stats()["routes"]
+        input_tokens = server.count_tokens(messages[0]["content"]) + 4
+        output_tokens = server.count_tokens("Injunction answer.")
+        assert answer == "Injunction answer."
+        assert [call["model"] for call in llm.calls] == [server.LLM_MODEL_STRONG]
+        assert (stats["strong"]["calls"], stats["fast"]["calls"]) == (1, 0)
+        assert stats["strong"]["input_tokens"] == input_tokens
+        assert stats["strong"]["output_tokens"] == output_tokens
+        assert stats["strong"]["cost_usd"] == round(
+            (input_tokens * server.LLM_MODEL_STRONG_PRICE_IN + output_tokens * server.LLM_MODEL_STRONG_PRICE_OUT) / 1_000_000, 6
+        )
+        print(f"Strong route stats: {stats['strong']}")
+
+
+class TestChatSessionHistory:
+    """Prompt history ownership tests - new_chat_session_id, prompt_history"""
+
+    @pytest.fixture(autouse=True)
+    def recording_llm(self, monkeypatch):
+        monkeypatch.setattr(server, "CHAT_WRITE_FLUSH_INTERVAL_MS", 60_000)
+        monkeypatch.setattr(server, "chat_writes", server.ChatWriteBehind())
+        self.llm = RecordingLlm()
+        monkeypatch.setattr(server, "llm_backend", self.llm)
+
+    def prompts(self):
+        return [" ".join(m["content"] for m in call["messages"][1:]) for call in self.llm.calls]
+
+    def test_concurrent_guests_get_separate_sessions(self):
+        """Test that two guests posting at once get their own sessions and only their own question"""
+        stridhan = f"Is my stridhan mine after separation {uuid.uuid4().hex[:8]}?"
+        tenancy = f"Can my landlord evict me without notice {uuid.uuid4().hex[:8]}?"
+
+        async def scenario():
+            return await asyncio.gather(ask(GUEST, stridhan, ip="203.0.113.10"), ask(GUEST, tenancy, ip="203.0.113.11"))
+
+        first, second = asyncio.run(scenario())
+
+        assert first["session_id"] != second["session_id"]
+        assert sorted(self.prompts()) == sorted([stridhan, tenancy])
+        print(f"Guest sessions: {first['session_id']}, {second['session_id']}")
+
+    def test_guest_never_continues_stored_session(self):
+        """Test that a guest naming another guest's session gets none of its history in the prompt"""
+        private = f"My husband took my jewellery {uuid.uuid4().hex[:8]}"
+
+        async def scenario():
+            first = await ask(GUEST, private, ip="203.0.113.12")
+            return await ask(GUEST, "What should I do next?", session_id=first["session_id"], ip="203.0.113.13")
+
+        asyncio.run(scenario())
+
+        assert private not in self.prompts()[-1]
+        print(f"Guest prompt: {self.prompts()[-1]}")
+
+    def test_user_continues_own_session(self):
+        """Test that a signed-in user's follow-up carries their earlier turn"""
+        user = mock_user()
+        question = f"My employer withheld my salary {uuid.uuid4().hex[:8]}"
+
+        async def scenario():
+            first = await ask(user, question)
+            return await ask(user, "It has been three months.", session_id=first["session_id"])
+
+        asyncio.run(scenario())
+
+        assert question in self.prompts()[-1]
+        assert server.prompt_history({"user_id": user["uid"]}, {"uid": "mock_other", "is_guest": False}) is None
+        print(f"Follow-up prompt: {self.prompts()[-1]}")
+
+
+class TestChatWriteBehind:
+    """Write-behind tests - ChatWriteBehind, GET /api/chat/user-chats"""
+
+    @pytest.fixture(autouse=True)
+    def manual_flush(self, monkeypatch):
+        """A started write-behind whose timer never fires during a test"""
+        monkeypatch.setattr(server, "CHAT_WRITE_FLUSH_INTERVAL_MS", 60_000)
+        monkeypatch.setattr(server, "chat_writes", server.ChatWriteBehind())
+
+    def test_new_chat_listed_before_flush(self):
+        """Test that the sidebar and history show a chat whose turns are still queued"""
+        user = mock_user()
+        session_id = f"{user['uid']}_rw"
+
+        async def scenario():
+            server.chat_writes.start()
+            try:
+                await server.chat_writes.enqueue(user["uid"], session_id, exchange("What is RTI?"), {})
+                listing = await server.get_user_chats(limit=30, cursor=None, user=user)
+                history = server.load_chat_session(session_id, user)
+                assert not server.db.collection("chat_index").document(session_id).get().exists
+                return listing, history
+            finally:
+                await server.chat_writes.shutdown()
+
+        listing, history = asyncio.run(scenario())
+
+        assert [item["session_id"] for item in listing["items"]] == [session_id]
+        assert listing["items"][0]["message_count"] == 2
+        assert len(history["messages"]) == 2
+        print(f"Listed before flush: {listing['items'][0]}")
+
+    def test_flush_persists_chat_and_index(self):
+        """Test that a flush writes the session and its chat_index record exactly once"""
+        user = mock_user()
+        session_id = f"{user['uid']}_flush"
+
+        async def scenario():
+            server.chat_writes.start()
+            try:
+                await server.chat_writes.enqueue(user["uid"], session_id, exchange("First?"), {})
+                assert not server.db.collection("chats").document(session_id).get().exists
+                await server.chat_writes.flush()
+                await server.chat_writes.enqueue(user["uid"], session_id, exchange("Second?", "Last answer"), {})
+                before_flush = await server.get_user_chats(limit=30, cursor=None, user=user)
+                await server.chat_writes.flush()
+                after_flush = await server.get_user_chats(limit=30, cursor=None, user=user)
+                return before_flush, after_flush
+            finally:
+                await server.chat_writes.shutdown()
+
+        before_flush, after_flush = asyncio.run(scenario())
+
+        chat = server.db.collection("chats").document(session_id).get().to_dict()
+        index = server.db.collection("chat_index").document(session_id).get().to_dict()
+        assert len(chat["messages"]) == 4
+        assert index["message_count"] == 4
+        assert index["last_message"] == "Last answer"
+        assert before_flush["items"][0]["message_count"] == 4
+        assert after_flush["items"] == before_flush["items"]
+        assert server.chat_writes.stats()["pending_turns"] == 0
+        print(f"Persisted index record: {index}")
+
+    def test_backfill_indexes_legacy_chats(self):
+        """Test that sessions stored before chat_index existed get a summary record at startup"""
+        user = mock_user()
+        session_id = f"{user['uid']}_legacy"
+        server.db.collection("chats").document(session_id).set({
+            "user_id": user["uid"],
+            "session_id": session_id,
+            "messages": exchange("Old question?", "Old answer"),
+            "updated_at": "2024-01-01T00:00:00"
+        })
+        server.db.collection("_migrations").document("chat_index").delete()
+
+        server.backfill_chat_index()
+
+        index = server.db.collection("chat_index").document(session_id).get().to_dict()
+        assert index["user_id"] == user["uid"]
+        assert index["last_message"] == "Old answer"
+        assert index["message_count"] == 2
+        assert index["updated_at"] == "2024-01-01T00:00:00"
+        print(f"Backfilled: {index}")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,83 @@
+"""
+In-process Tests for SunoLegal Async Document Jobs
+Tests: DocumentJobQueue (data dropped when done, retention, shutdown)
+Uses the mock database and thread-mode rendering; no server needed.
+"""
+import pytest
+import asyncio
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("LLM_BACKEND", "mock")
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp())
+os.environ.setdefault("PDF_RENDER_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+def stored_job(job_id):
+    doc = server.db.collection("document_jobs").document(job_id).get()
+    return doc.to_dict() if doc.exists else None
+
+
+class TestDocumentJobQueue:
+    """Async job lifecycle tests - DocumentJobQueue"""
+
+    def test_finished_job_drops_form_data(self):
+        """Test that a completed job keeps its status but not the submitted data"""
+        async def scenario():
+            queue = server.DocumentJobQueue(workers=1)
+            job = queue.submit("mock_jobs_data", "affidavit", {"deponent_name": "Private Name"})
+            await queue.wait(job["id"], timeout=30)
+            await queue.shutdown()
+            return job["id"]
+
+        job = stored_job(asyncio.run(scenario()))
+
+        assert job["status"] == "completed"
+        assert job["document_id"]
+        assert job["data"] is None
+        print(f"Completed job {job['id']} without form data")
+
+    def test_finished_jobs_expire(self, monkeypatch):
+        """Test that finished jobs beyond DOCUMENT_JOB_MAX_FINISHED are deleted, oldest first"""
+        monkeypatch.setattr(server, "DOCUMENT_JOB_MAX_FINISHED", 2)
+
+        async def scenario():
+            queue = server.DocumentJobQueue(workers=1)
+            job_ids = []
+            for i in range(3):
+                job = queue.submit("mock_jobs_expiry", "legal_notice", {"sender_name": f"Sender {i}"})
+                await queue.wait(job["id"], timeout=30)
+                job_ids.append(job["id"])
+            await queue.shutdown()
+            return job_ids
+
+        job_ids = asyncio.run(scenario())
+
+        assert stored_job(job_ids[0]) is None
+        assert stored_job(job_ids[1])["status"] == "completed"
+        assert stored_job(job_ids[2])["status"] == "completed"
+        print(f"Expired oldest job {job_ids[0]}")
+
+    def test_shutdown_fails_pending_jobs(self):
+        """Test that jobs still queued at shutdown end as failed instead of polling forever"""
+        async def scenario():
+            queue = server.DocumentJobQueue(workers=1)
+            jobs = [queue.submit("mock_jobs_shutdown", "affidavit", {"statements": [f"Statement {i}"] * 200})
+                    for i in range(3)]
+            await asyncio.sleep(0)
+            await queue.shutdown()
+            return [job["id"] for job in jobs]
+
+        statuses = [stored_job(job_id)["status"] for job_id in asyncio.run(scenario())]
+
+        assert "queued" not in statuses and "running" not in statuses
+        assert "failed" in statuses
+        print(f"Statuses after shutdown: {statuses}")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
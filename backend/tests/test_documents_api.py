@@ -0,0 +1,310 @@
+"""
+Backend API Tests for SunoLegal Document Generator
+Tests: POST /api/documents/generate, POST /api/documents/generate-batch,
+GET /api/documents/{doc_id}/download
+"""
+import pytest
+import requests
+import os
+import io
+import json
+import time
+import zipfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+ADMIN_SECRET = os.environ.get('ADMIN_SECRET', 'demo_admin_secret_change_in_production')
+
+
+def auth_headers():
+    """Fresh mock user per test so rate limits and caches don't collide"""
+    return {
+        "Authorization": f"Bearer mock_docs_{uuid.uuid4().hex[:8]}",
+        "Content-Type": "application/json"
+    }
+
+
+class TestGenerateDocument:
+    """Document generation tests - POST /api/documents/generate"""
+
+    def test_generate_each_document_type(self):
+        """Test that every document type renders and downloads"""
+        headers = auth_headers()
+        for doc_type in ("rent_agreement", "legal_notice", "affidavit", "consumer_complaint"):
+            response = requests.post(
+                f"{BASE_URL}/api/documents/generate",
+                json={"document_type": doc_type, "data": {}},
+                headers=headers
+            )
+            assert response.status_code == 200
+            data = response.json()
+            assert data["success"] == True
+            assert data["type"] == doc_type
+
+            pdf = requests.get(f"{BASE_URL}{data['download_url']}")
+            assert pdf.status_code == 200
+            assert pdf.content.startswith(b"%PDF")
+            print(f"Generated {doc_type}: {data['document_id']}")
+
+    def test_generate_hindi_document(self):
+        """Test that Devanagari user fields render in the embedded Noto font"""
+        response = requests.post(
+            f"{BASE_URL}/api/documents/generate",
+            json={"document_type": "affidavit", "data": {
+                "deponent_name": "रमेश कुमार",
+                "statements": ["मैं उपर्युक्त पते का निवासी हूँ।"]
+            }},
+            headers=auth_headers()
+        )
+
+        assert response.status_code == 200
+        pdf = requests.get(f"{BASE_URL}{response.json()['download_url']}")
+        assert pdf.content.startswith(b"%PDF")
+        assert b"+NotoSansDevanagari" in pdf.content  # Subset font embedded, not Helvetica
+        print(f"Generated Hindi affidavit: {len(pdf.content)} bytes")
+
+    def test_generate_long_affidavit(self):
+        """Test that a many-page document renders and downloads in full"""
+        headers = auth_headers()
+        statements = [f"Statement number {i} made on solemn affirmation." for i in range(500)]
+        response = requests.post(
+            f"{BASE_URL}/api/documents/generate",
+            json={"document_type": "affidavit", "data": {"statements": statements}},
+            headers=headers
+        )
+
+        assert response.status_code == 200
+        pdf = requests.get(f"{BASE_URL}{response.json()['download_url']}")
+        assert pdf.status_code == 200
+        assert pdf.content.startswith(b"%PDF")
+        assert pdf.content.rstrip().endswith(b"%%EOF")
+        print(f"Long affidavit: {len(pdf.content)} bytes")
+
+    def test_unknown_document_type(self):
+        """Test that an unknown document type is rejected"""
+        response = requests.post(
+            f"{BASE_URL}/api/documents/generate",
+            json={"document_type": "not_a_template", "data": {}},
+            headers=auth_headers()
+        )
+
+        assert response.status_code == 400
+        print("Unknown document type rejected")
+
+    def test_identical_resubmission_is_cached(self):
+        """Test that a retry with the same payload reuses the stored PDF"""
+        headers = auth_headers()
+        payload = {
+            "document_type": "affidavit",
+            "data": {"deponent_name": "Cache Test", "statements": ["One", "Two"]}
+        }
+
+        first = requests.post(f"{BASE_URL}/api/documents/generate", json=payload, headers=headers).json()
+        second = requests.post(f"{BASE_URL}/api/documents/generate", json=payload, headers=headers).json()
+
+        assert first["cached"] == False
+        assert second["cached"] == True
+        assert second["document_id"] == first["document_id"]
+        assert second["download_url"] != first["download_url"]  # Fresh signed URL
+        print(f"Resubmission served from cache: {second['document_id']}")
+
+    def test_resubmissions_not_rate_limited(self):
+        """Test that cached resubmissions don't use up the 10/minute document budget"""
+        headers = auth_headers()
+        payload = {"document_type": "legal_notice", "data": {"sender_name": "Retry Test"}}
+
+        responses = [requests.post(f"{BASE_URL}/api/documents/generate", json=payload, headers=headers) for _ in range(12)]
+        fresh = requests.post(
+            f"{BASE_URL}/api/documents/generate",
+            json={"document_type": "legal_notice", "data": {"sender_name": "New Document"}},
+            headers=headers
+        )
+
+        assert [response.status_code for response in responses] == [200] * 12
+        assert [response.json()["cached"] for response in responses] == [False] + [True] * 11
+        assert fresh.status_code == 200
+        print("12 resubmissions and a new document within the budget")
+
+    def test_new_documents_rate_limited(self):
+        """Test that the 11th new document within a minute is rejected with Retry-After"""
+        headers = auth_headers()
+
+        statuses = [
+            requests.post(
+                f"{BASE_URL}/api/documents/generate",
+                json={"document_type": "legal_notice", "data": {"sender_name": f"Sender {i}"}},
+                headers=headers
+            )
+            for i in range(11)
+        ]
+
+        assert [response.status_code for response in statuses[:10]] == [200] * 10
+        assert statuses[10].status_code == 429
+        assert statuses[10].headers["Retry-After"]
+        print("11th new document rejected")
+
+    def test_concurrent_identical_submissions_render_once(self):
+        """Test that a double-click while the first render is running shares its document"""
+        headers = auth_headers()
+        statements = [f"Concurrent statement {i}." for i in range(300)]  # Slow enough to overlap
+        payload = {"document_type": "affidavit", "data": {"statements": statements}}
+
+        def submit(_):
+            return requests.post(f"{BASE_URL}/api/documents/generate", json=payload, headers=headers).json()
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            results = list(pool.map(submit, range(3)))
+
+        assert len({result["document_id"] for result in results}) == 1
+        assert sorted(result["cached"] for result in results) == [False, True, True]
+        print(f"Concurrent submissions shared document {results[0]['document_id']}")
+
+
+class TestDocumentBatch:
+    """Bulk generation tests - POST /api/documents/generate-batch"""
+
+    def test_batch_returns_zip_with_manifest(self):
+        """Test that a batch streams back every PDF plus a manifest"""
+        documents = [
+            {"document_type": doc_type, "data": {"tenant_name": f"Tenant {i}"}}
+            for i, doc_type in enumerate(["rent_agreement", "legal_notice", "rent_agreement"])
+        ]
+        response = requests.post(
+            f"{BASE_URL}/api/documents/generate-batch",
+            json={"documents": documents},
+            headers=auth_headers()
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        manifest = json.loads(archive.read("manifest.json"))["documents"]
+        assert [entry["index"] for entry in manifest] == [0, 1, 2]
+        for entry in manifest:
+            assert archive.read(entry["file"]).startswith(b"%PDF")
+        print(f"Batch archive entries: {archive.namelist()}")
+
+    def test_batch_does_not_fill_download_cache(self):
+        """Test that batch members are read from disk without entering the hot tier"""
+        metrics_headers = {"X-Admin-Secret": ADMIN_SECRET}
+        before = requests.get(f"{BASE_URL}/api/admin/metrics", headers=metrics_headers).json()
+        response = requests.post(
+            f"{BASE_URL}/api/documents/generate-batch",
+            json={"documents": [{"document_type": "affidavit", "data": {"deponent_name": f"Cold {i}"}} for i in range(4)]},
+            headers=auth_headers()
+        )
+        after = requests.get(f"{BASE_URL}/api/admin/metrics", headers=metrics_headers).json()
+
+        assert response.status_code == 200
+        assert after["storage"]["memory_cache"]["entries"] == before["storage"]["memory_cache"]["entries"]
+        print("Batch left the hot tier untouched")
+
+    def test_batch_charged_per_document(self):
+        """Test that batches draw on their own per-document budget (100/hour)"""
+        headers = auth_headers()
+
+        def batch(n):
+            documents = [{"document_type": "legal_notice", "data": {"sender_name": f"Sender {n}.{i}"}} for i in range(25)]
+            return requests.post(f"{BASE_URL}/api/documents/generate-batch", json={"documents": documents}, headers=headers)
+
+        for n in range(4):
+            assert batch(n).status_code == 200
+        over = batch(4)
+
+
+        assert over.status_code == 429
+        assert over.headers["Retry-After"]
+        print("Batch over the batch document budget rejected")
+
+    def test_batch_of_stored_documents_not_charged(self):
+        """Test that resending an already generated batch doesn't use up the batch budget"""
+        headers = auth_headers()
+        documents = [{"document_type": "legal_notice", "data": {"sender_name": f"Resent {i}"}} for i in range(25)]
+
+        responses = [
+            requests.post(f"{BASE_URL}/api/documents/generate-batch", json={"documents": documents}, headers=headers)
+            for _ in range(5)
+        ]
+
+        assert [response.status_code for response in responses] == [200] * 5
+        manifest = json.loads(zipfile.ZipFile(io.BytesIO(responses[-1].content)).read("manifest.json"))["documents"]
+        assert all(entry["cached"] for entry in manifest)
+        print("Resent batches served from stored documents")
+
+    def test_batch_leaves_single_budget(self):
+        """Test that a full batch doesn't use up single-document generation"""
+        headers = auth_headers()
+        documents = [{"document_type": "legal_notice", "data": {"sender_name": f"Sender {i}"}} for i in range(25)]
+
+        batch = requests.post(f"{BASE_URL}/api/documents/generate-batch", json={"documents": documents}, headers=headers)
+        single = requests.post(
+            f"{BASE_URL}/api/documents/generate",
+            json={"document_type": "legal_notice", "data": {"sender_name": "After Batch"}},
+            headers=headers
+        )
+
+        assert batch.status_code == 200
+        assert single.status_code == 200
+        print("Single generation still allowed after a full batch")
+
+    def test_batch_rejects_unknown_type(self):
+        """Test that the whole batch is validated before streaming starts"""
+        response = requests.post(
+            f"{BASE_URL}/api/documents/generate-batch",
+            json={"documents": [
+                {"document_type": "affidavit", "data": {}},
+                {"document_type": "not_a_template", "data": {}}
+            ]},
+            headers=auth_headers()
+        )
+
+        assert response.status_code == 400
+        print("Batch with unknown document type rejected")
+
+
+class TestAsyncDocumentJobs:
+    """Async generation tests - POST /api/documents/generate?async_mode=true"""
+
+    def test_async_job_completes(self):
+        """Test that an async job is accepted with 202 and completes"""
+        headers = auth_headers()
+        response = requests.post(
+            f"{BASE_URL}/api/documents/generate",
+            params={"async_mode": "true"},
+            json={"document_type": "legal_notice", "data": {"sender_name": "Async Test"}},
+            headers=headers
+        )
+
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        job = None
+        for _ in range(30):
+            job = requests.get(f"{BASE_URL}/api/documents/jobs/{job_id}", headers=headers).json()
+            if job["status"] in ("completed", "failed"):
+                break
+            time.sleep(0.5)
+
+        assert job["status"] == "completed"
+        assert "download_url" in job
+        print(f"Async job {job_id} completed: {job['document_id']}")
+
+    def test_job_not_visible_to_other_users(self):
+        """Test that another user cannot read a job"""
+        response = requests.post(
+            f"{BASE_URL}/api/documents/generate",
+            params={"async_mode": "true"},
+            json={"document_type": "affidavit", "data": {}},
+            headers=auth_headers()
+        )
+        job_id = response.json()["job_id"]
+
+        other = requests.get(f"{BASE_URL}/api/documents/jobs/{job_id}", headers=auth_headers())
+
+        assert other.status_code == 403
+        print("Job ownership enforced")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,85 @@
+"""
+Backend API Tests for SunoLegal Lawyer Verification Document Uploads
+Tests: POST /api/lawyers/apply, POST /api/lawyers/applications/{app_id}/upload-docs
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def create_application():
+    """Create a lawyer application for a fresh mock user"""
+    headers = {"Authorization": f"Bearer mock_lawyer_{uuid.uuid4().hex[:8]}"}
+    payload = {
+        "name": "Adv. Upload Test",
+        "bar_council_id": "DL/99999/2020",
+        "specialization": ["Civil Law"],
+        "languages": ["English"],
+        "city": "Delhi",
+        "state": "Delhi",
+        "experience": 5,
+        "price": 500,
+        "bio": "Test application",
+        "phone": "9999999999",
+        "email": "upload_test@example.com"
+    }
+    response = requests.post(f"{BASE_URL}/api/lawyers/apply", json=payload, headers=headers)
+    assert response.status_code == 200
+    return response.json()["application_id"], headers
+
+
+class TestVerificationDocUpload:
+    """Streaming multipart upload tests"""
+
+    def test_upload_pdf_success(self):
+        """Test that a PDF part is stored with size and hash"""
+        app_id, headers = create_application()
+        pdf_bytes = b"%PDF-1.4\n" + b"0" * 2048
+
+        response = requests.post(
+            f"{BASE_URL}/api/lawyers/applications/{app_id}/upload-docs",
+            files={"file": ("bar_certificate.pdf", pdf_bytes, "application/pdf")},
+            headers=headers
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] == True
+        doc = data["documents"][0]
+        assert doc["content_type"] == "application/pdf"
+        assert doc["size"] == len(pdf_bytes)
+        assert len(doc["sha256"]) == 64
+        print(f"Uploaded verification doc: {doc['path']}")
+
+    def test_upload_rejects_unknown_type(self):
+        """Test that content is sniffed, not trusted from the declared type"""
+        app_id, headers = create_application()
+
+        response = requests.post(
+            f"{BASE_URL}/api/lawyers/applications/{app_id}/upload-docs",
+            files={"file": ("certificate.pdf", b"MZ" + b"0" * 64, "application/pdf")},
+            headers=headers
+        )
+
+        assert response.status_code == 415
+        print("Unknown file type rejected")
+
+    def test_upload_requires_multipart(self):
+        """Test that a non-multipart body is rejected"""
+        app_id, headers = create_application()
+
+        response = requests.post(
+            f"{BASE_URL}/api/lawyers/applications/{app_id}/upload-docs",
+            json={},
+            headers=headers
+        )
+
+        assert response.status_code == 415
+        print("Non-multipart upload rejected")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,95 @@
+"""
+In-process Tests for SunoLegal Lazy Document Storage
+Tests: DOCUMENT_STORAGE_MODE=lazy (render on download, template versions)
+Uses the mock database and thread-mode rendering; no server needed.
+"""
+import pytest
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+
+os.environ.setdefault("LLM_BACKEND", "mock")
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp())
+os.environ.setdefault("PDF_RENDER_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from reportlab.lib.styles import getSampleStyleSheet  # noqa: E402
+from reportlab.platypus import Paragraph  # noqa: E402
+
+
+def download(url):
+    """Call the signed-URL download endpoint in-process and return the body"""
+    async def fetch():
+        response = await server.storage_download(url.split("token=", 1)[1])
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(fetch())
+
+
+def create_lazy_document(doc_type, data):
+    user_id = f"mock_lazy_{uuid.uuid4().hex[:8]}"
+    record = asyncio.run(server.store_new_document(user_id, doc_type, data))
+    return record, server.document_download_url(record, user_id)
+
+
+class TestLazyDocuments:
+    """Lazy storage tests - render_lazy_document, GET /api/storage/download"""
+
+    @pytest.fixture(autouse=True)
+    def lazy_mode(self, monkeypatch):
+        monkeypatch.setattr(server, "DOCUMENT_STORAGE_MODE", "lazy")
+        monkeypatch.setattr(server, "lazy_document_cache", server.LRUCache(max_bytes=16 * 1024 * 1024))
+        # Thread mode: worker processes wouldn't see templates registered by a test
+        monkeypatch.setattr(server, "pdf_render_pool", server.PdfRenderPool(workers=0))
+
+    def test_lazy_download_renders_on_demand(self):
+        """Test that a lazy document stores no PDF and renders on its first download"""
+        record, url = create_lazy_document("affidavit", {"deponent_name": "Lazy Test"})
+
+        assert record["storage_mode"] == "lazy"
+        assert record["template_version"] == server.DOCUMENT_TEMPLATES["affidavit"].version
+        assert server.storage.get_file_info(record["storage_path"]) is None
+
+        pdf = download(url)
+
+        assert pdf.startswith(b"%PDF")
+        assert server.lazy_document_cache.stats()["entries"] == 1
+        print(f"Lazy download rendered {len(pdf)} bytes")
+
+    def test_lazy_download_uses_stored_template_version(self, monkeypatch):
+        """Test that a document created before a template bump renders with its original version"""
+        record, url = create_lazy_document("affidavit", {"deponent_name": "Old Wording"})
+        rendered_by = []
+
+        def retired_affidavit(data, template):
+            rendered_by.append(template.version)
+            return [Paragraph(f"Deponent: {data['deponent_name']}", template.styles["body"])]
+
+        retired = server.DocumentTemplate("affidavit", "0", {"body": {"parent": "Normal"}}, {}, {}, retired_affidavit)
+        retired.compile(getSampleStyleSheet())
+        monkeypatch.setitem(server.DOCUMENT_TEMPLATE_VERSIONS, ("affidavit", "0"), retired)
+        server.db.collection("documents").document(record["id"]).update({"template_version": "0"})
+
+        pdf = download(url)
+
+        assert pdf.startswith(b"%PDF")
+        assert rendered_by == ["0"]
+        print(f"Rendered {record['id']} with retired template v0")
+
+    def test_unregistered_template_version_is_gone(self):
+        """Test that a version no longer registered fails with 410 instead of new wording"""
+        record, url = create_lazy_document("legal_notice", {"sender_name": "Gone"})
+        server.db.collection("documents").document(record["id"]).update({"template_version": "0"})
+
+        with pytest.raises(HTTPException) as error:
+            download(url)
+
+        assert error.value.status_code == 410
+        print(f"Unregistered version: {error.value.detail}")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,168 @@
+"""
+In-process Tests for SunoLegal NyayAI LLM Backends
+Tests: LlmClientPool (one keep-alive connection pool across calls, close on
+shutdown), OpenAiLlmBackend and LLM_BACKEND configuration checks
+Runs against a local stand-in for an OpenAI-compatible API; no tokens needed.
+"""
+import pytest
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+os.environ.setdefault("LLM_BACKEND", "mock")
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp())
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import server  # noqa: E402
+
+COMPLETION = {
+    "id": "chatcmpl-pool", "object": "chat.completion", "created": 0, "model": "pool-model",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "Pooled answer."}, "finish_reason": "stop"}],
+}
+
+
+class CompletionServer:
+    """Minimal keep-alive HTTP/1.1 server answering every request with COMPLETION"""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = next((int(line.split(b":")[1]) for line in head.split(b"\r\n")
+                               if line.lower().startswith(b"content-length:")), 0)
+                await reader.readexactly(length)
+                self.requests += 1
+                body = json.dumps(COMPLETION).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}/v1"
+
+    async def stop(self):
+        self._server.close()
+
+
+def ask(backend):
+    return backend.complete("pool_session", [{"role": "user", "content": "What is RTI?"}])
+
+
+class TestLlmClientPool:
+    """Connection pool tests - LlmClientPool, OpenAiLlmBackend"""
+
+    @pytest.fixture(autouse=True)
+    def openai_settings(self, monkeypatch):
+        monkeypatch.setattr(server, "LLM_API_KEY", "sk-test-pool")
+        monkeypatch.setattr(server, "LLM_API_BASE", "http://127.0.0.1:9/v1")
+        monkeypatch.setattr(server, "LLM_POOL_WARM_CONNECTIONS", 0)
+
+    def test_calls_share_one_connection(self, monkeypatch):
+        """Test that consecutive calls reuse the pool's client and its keep-alive connection"""
+        upstream = CompletionServer()
+
+        async def scenario():
+            monkeypatch.setattr(server, "LLM_API_BASE", await upstream.start())
+            backend = server.OpenAiLlmBackend()
+            await backend.start()
+            try:
+                client = backend.pool.client
+                answers = [await ask(backend) for _ in range(3)]
+                return answers, backend.pool.client is client, backend.stats()
+            finally:
+                await backend.close()
+                await upstream.stop()
+
+        answers, same_client, stats = asyncio.run(scenario())
+
+        assert answers == ["Pooled answer."] * 3
+        assert same_client
+        assert (upstream.requests, upstream.connections) == (3, 1)
+        assert (stats["calls"], stats["in_flight"], stats["peak_in_flight"]) == (3, 0, 1)
+        print(f"3 calls over {upstream.connections} connection: {stats}")
+
+    def test_pool_started_on_first_use(self):
+        """Test that a pool used outside the app lifecycle creates its client on first acquire"""
+        async def scenario():
+            pool = server.LlmClientPool()
+            assert pool.client is None
+            async with pool.acquire() as first:
+                pass
+            async with pool.acquire() as second:
+                pass
+            await pool.close()
+            return first, second
+
+        first, second = asyncio.run(scenario())
+
+        assert first is second
+        print("Client created once, on first use")
+
+    def test_shutdown_closes_pool(self, monkeypatch):
+        """Test that the shutdown hook closes the client and its connection pool"""
+        backend = server.OpenAiLlmBackend()
+        monkeypatch.setattr(server, "llm_backend", backend)
+
+        async def scenario():
+            await server.start_llm_backend()
+            http = backend.pool._http
+            await server.stop_llm_backend()
+            return http
+
+        http = asyncio.run(scenario())
+
+        assert backend.pool.client is None
+        assert http.is_closed
+        print("Pool closed on shutdown")
+
+    @pytest.mark.parametrize("key,base", [(None, "http://127.0.0.1:9/v1"), ("sk-test", None)])
+    def test_openai_backend_requires_key_and_base(self, key, base, monkeypatch):
+        """Test that LLM_BACKEND=openai refuses to start without both LLM_API_KEY and LLM_API_BASE"""
+        monkeypatch.setattr(server, "LLM_API_KEY", key)
+        monkeypatch.setattr(server, "LLM_API_BASE", base)
+
+        with pytest.raises(RuntimeError, match="requires both LLM_API_KEY and LLM_API_BASE"):
+            server.OpenAiLlmBackend()
+        print(f"Rejected key={key!r} base={base!r}")
+
+    def test_emergent_key_not_sent_elsewhere(self, monkeypatch):
+        """Test that the Emergent key is refused for a non-Emergent LLM_API_BASE"""
+        monkeypatch.setattr(server, "EMERGENT_LLM_KEY", "sk-emergent-test")
+        monkeypatch.setattr(server, "LLM_API_KEY", "sk-emergent-test")
+        monkeypatch.setattr(server, "LLM_API_BASE", "https://api.openai.com/v1")
+
+        with pytest.raises(RuntimeError, match="Emergent key"):
+            server.OpenAiLlmBackend()
+        print("Emergent key kept away from api.openai.com")
+
+
+class TestLlmBackendConfig:
+    """Startup configuration tests - LLM_BACKEND"""
+
+    def test_unknown_backend_fails_at_import(self):
+        """Test that an unknown LLM_BACKEND stops the server from starting"""
+        env = dict(os.environ, LLM_BACKEND="bogus", STORAGE_DIR=tempfile.mkdtemp())
+        result = subprocess.run([sys.executable, "-c", "import server"], cwd=BACKEND_DIR,
+                                env=env, capture_output=True, text=True, timeout=120)
+
+        assert result.returncode != 0
+        assert "Invalid LLM_BACKEND: 'bogus'" in result.stderr
+        print("Unknown LLM_BACKEND rejected at startup")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,370 @@
+"""
+In-process Tests for SunoLegal NyayAI LLM Call Guards
+Tests: LlmAdmission (fair share, guest priority, 503 shedding),
+GuardedLlm (deadlines, circuit breaker, hedging)
+Runs against the offline mock LLM backend; no server or tokens needed.
+"""
+import pytest
+import asyncio
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("LLM_BACKEND", "mock")
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp())
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+
+def fake_request(token: str = "", ip: str = "203.0.113.7"):
+    """Minimal request carrying what the rate-limit key function reads"""
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "headers": headers, "client": (ip, 1234)})
+
+
+async def grant_order(admission, callers):
+    """
+    Hold the only slot, queue callers as (client, guest), then release one
+    at a time and return the clients in the order they were granted.
+    """
+    hold = await admission.acquire("holder", False)
+    order = []
+
+    async def call(client, guest):
+        release = await admission.acquire(client, guest)
+        order.append(client)
+        await asyncio.sleep(0)
+        release()
+
+    tasks = []
+    for client, guest in callers:
+        tasks.append(asyncio.create_task(call(client, guest)))
+        await asyncio.sleep(0)  # Queue in submission order
+    hold()
+    await asyncio.gather(*tasks)
+    return order
+
+
+class ScriptedLlm:
+    """
+    Stand-in llm_backend. Each call plays the next step of the script (the
+    last one repeats): "fail" raises before the first chunk, a number delays
+    the first chunk by that many seconds, "ok" answers at once.
+    """
+    name = "scripted"
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def stream(self, session_id, messages, model=server.LLM_MODEL):
+        self.calls += 1
+        call, step = self.calls, self.script[min(self.calls, len(self.script)) - 1]
+        if step == "fail":
+            raise RuntimeError(f"upstream error on call {call}")
+        try:
+            if step != "ok":
+                await asyncio.sleep(step)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        yield f"answer {call}"
+
+
+def ask(guard):
+    return guard.complete("guard_session", [{"role": "user", "content": "What is RTI?"}])
+
+
+class TestLlmAdmission:
+    """Admission control tests - LlmAdmission / admit_llm_call"""
+
+    @pytest.fixture(autouse=True)
+    def single_slot(self, monkeypatch):
+        monkeypatch.setattr(server, "LLM_MAX_CONCURRENCY", 1)
+        monkeypatch.setattr(server, "LLM_QUEUE_MAX", 16)
+        monkeypatch.setattr(server, "LLM_QUEUE_MAX_PER_CLIENT", 4)
+        monkeypatch.setattr(server, "LLM_QUEUE_TIMEOUT_SECONDS", 5)
+        monkeypatch.setattr(server, "LLM_GUEST_SHARE", 3)
+
+    def test_clients_served_round_robin(self):
+        """Test that a client with a backlog can't starve one that arrives later"""
+        admission = server.LlmAdmission()
+        order = asyncio.run(grant_order(admission, [("heavy", False)] * 3 + [("light", False)]))
+
+        assert order == ["heavy", "light", "heavy", "heavy"]
+        print(f"Grant order: {order}")
+
+    def test_guests_get_every_nth_grant(self):
+        """Test that users go first but every LLM_GUEST_SHARE-th grant goes to a guest"""
+        admission = server.LlmAdmission()
+        callers = [("guest_a", True), ("guest_b", True)] + [(f"user_{i}", False) for i in range(4)]
+        order = asyncio.run(grant_order(admission, callers))
+
+        assert order == ["user_0", "user_1", "guest_a", "user_2", "user_3", "guest_b"]
+        print(f"Grant order: {order}")
+
+    def test_guest_share_zero_serves_guests_last(self, monkeypatch):
+        """Test that LLM_GUEST_SHARE=0 never prefers guests but still serves them"""
+        monkeypatch.setattr(server, "LLM_GUEST_SHARE", 0)
+        admission = server.LlmAdmission()
+        order = asyncio.run(grant_order(admission, [("guest_a", True), ("user_0", False), ("user_1", False)]))
+
+        assert order == ["user_0", "user_1", "guest_a"]
+        print(f"Grant order: {order}")
+
+    def test_full_queue_sheds_with_503(self, monkeypatch):
+        """Test that a caller beyond LLM_QUEUE_MAX gets 503 with Retry-After"""
+        monkeypatch.setattr(server, "LLM_QUEUE_MAX", 1)
+        monkeypatch.setattr(server, "llm_admission", server.LlmAdmission())
+
+        async def scenario():
+            hold = await server.llm_admission.acquire("holder", False)
+            waiting = asyncio.create_task(server.llm_admission.acquire("uid:mock_waiting", False))
+            await asyncio.sleep(0)
+            try:
+                await server.admit_llm_call(fake_request("mock_shed"), {"uid": "mock_shed"})
+            finally:
+                hold()
+                (await waiting)()
+
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(scenario())
+
+        assert error.value.status_code == 503
+        assert error.value.headers["Retry-After"]
+        assert server.llm_admission.stats()["shed"] == 1
+        print(f"Shed: {error.value.detail}")
+
+    def test_per_client_limit_sheds(self):
+        """Test that one client can't hold more than LLM_QUEUE_MAX_PER_CLIENT requests"""
+        admission = server.LlmAdmission()
+
+        async def scenario():
+            hold = await admission.acquire("greedy", False)
+            queued = [asyncio.create_task(admission.acquire("greedy", False)) for _ in range(3)]
+            await asyncio.sleep(0)
+            with pytest.raises(server.LlmAdmissionRejected):
+                await admission.acquire("greedy", False)
+            hold()
+            for task in queued:
+                (await task)()
+
+        asyncio.run(scenario())
+        stats = admission.stats()
+        assert stats["shed"] == 1
+        assert stats["running"] == 0 and stats["waiting"] == 0
+        print(f"Admission stats: {stats}")
+
+    def test_queue_timeout_sheds(self, monkeypatch):
+        """Test that a caller still waiting after LLM_QUEUE_TIMEOUT_SECONDS is shed"""
+        monkeypatch.setattr(server, "LLM_QUEUE_TIMEOUT_SECONDS", 0.05)
+        admission = server.LlmAdmission()
+
+        async def scenario():
+            hold = await admission.acquire("holder", False)
+            try:
+                with pytest.raises(server.LlmAdmissionRejected):
+                    await admission.acquire("late", False)
+            finally:
+                hold()
+
+        asyncio.run(scenario())
+        assert admission.stats()["waiting"] == 0
+        print("Queue timeout shed")
+
+
+class TestGuardedLlm:
+    """Call guard tests - GuardedLlm, CircuitBreaker"""
+
+    @pytest.fixture(autouse=True)
+    def fast_guard(self, monkeypatch):
+        monkeypatch.setattr(server, "LLM_BREAKER_FAILURES", 2)
+        monkeypatch.setattr(server, "LLM_BREAKER_RESET_SECONDS", 0.05)
+        monkeypatch.setattr(server, "LLM_FIRST_CHUNK_TIMEOUT_SECONDS", 5)
+        monkeypatch.setattr(server, "LLM_HEDGE", False)
+
+    def test_breaker_opens_and_fails_fast(self, monkeypatch):
+        """Test that consecutive failures open the breaker and later calls skip the backend"""
+        monkeypatch.setattr(server, "LLM_BREAKER_RESET_SECONDS", 60)
+        backend = ScriptedLlm("fail")
+        monkeypatch.setattr(server, "llm_backend", backend)
+        guard = server.GuardedLlm()
+
+        async def scenario():
+            for _ in range(2):
+                with pytest.raises(RuntimeError):
+                    await ask(guard)
+            with pytest.raises(server.LlmUnavailableError):
+                await ask(guard)
+
+        asyncio.run(scenario())
+
+        assert backend.calls == 2
+        assert guard.stats()["breaker"] == {"state": "open", "consecutive_failures": 2, "opens": 1, "rejected": 1}
+        print(f"Breaker: {guard.stats()['breaker']}")
+
+    def test_half_open_admits_one_probe(self, monkeypatch):
+        """Test that after the reset time one probe goes through, others fail fast, and success closes"""
+        backend = ScriptedLlm("fail", "fail", 0.05)
+        monkeypatch.setattr(server, "llm_backend", backend)
+        guard = server.GuardedLlm()
+
+        async def scenario():
+            for _ in range(2):
+                with pytest.raises(RuntimeError):
+                    await ask(guard)
+            await asyncio.sleep(0.06)
+            probe = asyncio.create_task(ask(guard))
+            await asyncio.sleep(0.01)
+            assert guard.breaker.state == "half_open"
+            with pytest.raises(server.LlmUnavailableError):
+                await ask(guard)
+            return await probe
+
+        answer = asyncio.run(scenario())
+
+        assert answer == "answer 3"
+        assert backend.calls == 3
+        assert guard.breaker.state == "closed"
+        print(f"Probe answered: {answer}")
+
+    def test_failed_probe_reopens(self, monkeypatch):
+        """Test that a failed half-open probe opens the breaker again"""
+        monkeypatch.setattr(server, "llm_backend", ScriptedLlm("fail"))
+        guard = server.GuardedLlm()
+
+        async def scenario():
+            for _ in range(2):
+                with pytest.raises(RuntimeError):
+                    await ask(guard)
+            await asyncio.sleep(0.06)
+            with pytest.raises(RuntimeError):
+                await ask(guard)
+
+        asyncio.run(scenario())
+
+        assert guard.breaker.state == "open"
+        assert guard.breaker.opens == 2
+        print(f"Breaker: {guard.stats()['breaker']}")
+
+    def test_first_chunk_deadline(self, monkeypatch):
+        """Test that a call with no first chunk within the deadline fails and counts as a failure"""
+        monkeypatch.setattr(server, "LLM_FIRST_CHUNK_TIMEOUT_SECONDS", 0.05)
+        backend = ScriptedLlm(5)
+        monkeypatch.setattr(server, "llm_backend", backend)
+        guard = server.GuardedLlm()
+
+        with pytest.raises(server.LlmUnavailableError):
+            asyncio.run(ask(guard))
+
+        assert guard.stats()["timeouts"] == 1
+        assert guard.breaker.consecutive_failures == 1
+        assert backend.cancelled == 1
+        print("First-chunk deadline enforced")
+
+    def test_hedge_beats_slow_primary(self, monkeypatch):
+        """Test that a slow primary is hedged after the delay and the faster attempt wins"""
+        monkeypatch.setattr(server, "LLM_HEDGE", True)
+        monkeypatch.setattr(server, "LLM_HEDGE_DELAY_SECONDS", 0.05)
+        backend = ScriptedLlm(5, "ok")
+        monkeypatch.setattr(server, "llm_backend", backend)
+        guard = server.GuardedLlm()
+
+        async def scenario():
+            started = asyncio.get_running_loop().time()
+            answer = await ask(guard)
+            return answer, asyncio.get_running_loop().time() - started
+
+        answer, elapsed = asyncio.run(scenario())
+
+        assert answer == "answer 2"
+        assert elapsed < 1
+        assert backend.cancelled == 1  # The slow primary was abandoned
+        assert (guard.stats()["hedges"], guard.stats()["hedge_wins"]) == (1, 1)
+        print(f"Hedged answer in {elapsed:.2f}s")
+
+    def test_hedge_retries_fast_failure(self, monkeypatch):
+        """Test that with hedging on, a primary that fails at once is retried immediately"""
+        monkeypatch.setattr(server, "LLM_HEDGE", True)
+        monkeypatch.setattr(server, "LLM_HEDGE_DELAY_SECONDS", 5)
+        monkeypatch.setattr(server, "llm_backend", ScriptedLlm("fail", "ok"))
+        guard = server.GuardedLlm()
+
+        answer = asyncio.run(ask(guard))
+
+        assert answer == "answer 2"
+        assert guard.breaker.consecutive_failures == 0
+        assert guard.stats()["hedges"] == 1
+        print(f"Retried answer: {answer}")
+
+    def test_hedge_takes_admission_slot(self, monkeypatch):
+        """Test that a hedge holds its own llm_admission slot until it finishes"""
+        monkeypatch.setattr(server, "LLM_HEDGE", True)
+        monkeypatch.setattr(server, "LLM_HEDGE_DELAY_SECONDS", 0.05)
+        monkeypatch.setattr(server, "LLM_MAX_CONCURRENCY", 2)
+        monkeypatch.setattr(server, "llm_admission", server.LlmAdmission())
+        monkeypatch.setattr(server, "llm_backend", ScriptedLlm(5, 0.05))
+        guard = server.GuardedLlm()
+
+        async def scenario():
+            hold = await server.llm_admission.acquire("caller", False)  # The primary's slot
+            call = asyncio.create_task(ask(guard))
+            await asyncio.sleep(0.07)
+            running = server.llm_admission.stats()["running"]
+            answer = await call
+            hold()
+            return running, answer
+
+        running, answer = asyncio.run(scenario())
+
+        assert running == 2
+        assert answer == "answer 2"
+        assert server.llm_admission.stats()["admitted"] == 2
+        assert server.llm_admission.stats()["running"] == 0
+        print(f"Hedge ran in an admitted slot: {answer}")
+
+    def test_hedge_skipped_when_admission_full(self, monkeypatch):
+        """Test that no hedge is sent while every admission slot is taken"""
+        monkeypatch.setattr(server, "LLM_HEDGE", True)
+        monkeypatch.setattr(server, "LLM_HEDGE_DELAY_SECONDS", 0.01)
+        monkeypatch.setattr(server, "LLM_MAX_CONCURRENCY", 1)
+        monkeypatch.setattr(server, "llm_admission", server.LlmAdmission())
+        backend = ScriptedLlm(0.1, "ok")
+        monkeypatch.setattr(server, "llm_backend", backend)
+        guard = server.GuardedLlm()
+
+        async def scenario():
+            hold = await server.llm_admission.acquire("caller", False)
+            try:
+                return await ask(guard)
+            finally:
+                hold()
+
+        answer = asyncio.run(scenario())
+
+        assert answer == "answer 1"
+        assert backend.calls == 1
+        assert (guard.stats()["hedges"], guard.stats()["hedges_skipped"]) == (0, 1)
+        print("Hedge skipped at capacity")
+
+    def test_no_hedge_when_disabled(self, monkeypatch):
+        """Test that without LLM_HEDGE a slow call is waited for, not duplicated"""
+        backend = ScriptedLlm(0.1, "ok")
+        monkeypatch.setattr(server, "llm_backend", backend)
+        monkeypatch.setattr(server, "LLM_HEDGE_DELAY_SECONDS", 0.01)
+        guard = server.GuardedLlm()
+
+        answer = asyncio.run(ask(guard))
+
+        assert answer == "answer 1"
+        assert backend.calls == 1
+        assert guard.stats()["hedges"] == 0
+        print("Slow call not hedged")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,134 @@
+"""
+In-process Tests for SunoLegal PDF Templates
+Tests: FixedSection (recorded form operators replayed into later documents),
+PdfRenderPool (spawned worker processes)
+No server needed.
+"""
+import pytest
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("LLM_BACKEND", "mock")
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp())
+os.environ.setdefault("PDF_RENDER_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio  # noqa: E402
+import io  # noqa: E402
+
+import server  # noqa: E402
+from reportlab import rl_config  # noqa: E402
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.lib.styles import getSampleStyleSheet  # noqa: E402
+from reportlab.platypus import Paragraph, SimpleDocTemplate  # noqa: E402
+
+# Bold markup and Indic fields register fonts before the fixed sections draw
+DOCUMENTS = {
+    "affidavit": {"deponent_name": "<b>Ramesh</b> <i>Kumar</i>", "statements": ["I am a resident of Bengaluru."] * 3},
+    "rent_agreement": {"landlord_name": "रमेश कुमार", "tenant_name": "Suresh", "monthly_rent": "15000"},
+    "consumer_complaint": {"complainant_name": "ರಮೇಶ್ ಕುಮಾರ್", "facts": ["The product stopped working."]},
+}
+
+
+def build_pdf(flowables):
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4).build(flowables)
+    return buffer.getvalue()
+
+
+def fixed_sections(doc_type):
+    """Script variants share the template's sections"""
+    return list(server.DOCUMENT_TEMPLATES[doc_type]._fixed.values())
+
+
+class TestFixedSections:
+    """Form replay tests - FixedSection, FixedSectionFlowable"""
+
+    @pytest.fixture(autouse=True)
+    def invariant_pdfs(self, monkeypatch):
+        # Fixed IDs and timestamps, so two renders can be compared byte for byte
+        monkeypatch.setattr(rl_config, "invariant", 1)
+        monkeypatch.setattr(rl_config, "pageCompression", 0)
+
+    @pytest.mark.parametrize("doc_type", sorted(DOCUMENTS))
+    def test_replayed_sections_match_drawn(self, doc_type, monkeypatch):
+        """Test that a document built from recorded operators is identical to one drawn from scratch"""
+        data = DOCUMENTS[doc_type]
+        sections = fixed_sections(doc_type)
+        assert sections
+        for section in sections:
+            monkeypatch.setattr(section, "_recorded", None)
+
+        # Record from an empty document, so the replay lands in one whose fonts are numbered differently
+        server.render_document_pdf(doc_type, {})
+        assert all(section._recorded for section in sections)
+        replayed = server.render_document_pdf(doc_type, data)
+
+        for section in sections:
+            monkeypatch.setattr(section, "_recorded", None)
+        monkeypatch.setattr(server.FixedSection, "_record", lambda self, canv, lines: None)
+        drawn = server.render_document_pdf(doc_type, data)
+
+        assert replayed == drawn
+        print(f"{doc_type}: replayed and drawn PDFs identical ({len(drawn)} bytes)")
+
+    def test_replay_renumbers_fonts(self, monkeypatch):
+        """Test that recorded font references are rewritten to the new document's font numbers"""
+        body = getSampleStyleSheet()["Normal"]
+        section = server.FixedSection("test.witness", [Paragraph("<b>Witness</b> <i>signature</i>", body)])
+        # Courier takes the font numbers the section's fonts had when recorded
+        other_fonts_first = [Paragraph("<font name='Courier'>Ref</font> <font name='Courier-Bold'>No. 1</font>", body)]
+
+        build_pdf([section.flowable()])
+        recorded_fonts = section._recorded[1]
+        replayed = build_pdf(other_fonts_first + [section.flowable()])
+
+        monkeypatch.setattr(section, "_recorded", None)
+        monkeypatch.setattr(server.FixedSection, "_record", lambda self, canv, lines: None)
+        drawn = build_pdf(other_fonts_first + [section.flowable()])
+
+        assert replayed == drawn
+        print(f"Replayed section fonts {recorded_fonts} renumbered")
+
+
+class TestPdfRenderPool:
+    """Worker pool tests - PdfRenderPool"""
+
+    def test_workers_are_spawned(self):
+        """Test that workers start from a fresh interpreter, not a fork of the API process"""
+        pool = server.PdfRenderPool(workers=1)
+
+        async def scenario():
+            pool.start()
+            try:
+                return await pool.render("affidavit", {"deponent_name": "Spawned Worker"})
+            finally:
+                pool.shutdown()
+
+        pdf = asyncio.run(scenario())
+
+        assert pdf.startswith(b"%PDF")
+        assert pool.stats()["rendered"] == 1
+        print(f"Spawned worker rendered {len(pdf)} bytes")
+
+    def test_pool_uses_spawn_context(self, monkeypatch):
+        """Test that the executor is created with the spawn start method"""
+        created = {}
+
+        class RecordingExecutor:
+            def __init__(self, **kwargs):
+                created.update(kwargs)
+
+            def submit(self, fn):
+                pass
+
+        monkeypatch.setattr(server, "ProcessPoolExecutor", RecordingExecutor)
+        server.PdfRenderPool(workers=2).start()
+
+        assert created["mp_context"].get_start_method() == "spawn"
+        assert created["initializer"] is server._warm_pdf_worker
+        print("Render pool uses spawn")
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,134 @@
+"""
+Backend API Tests for SunoLegal Private Storage
+Tests: signed URL downloads, per-user quota, GET /api/storage/usage, GET /api/admin/metrics
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+ADMIN_SECRET = os.environ.get('ADMIN_SECRET', 'demo_admin_secret_change_in_production')
+
+
+def auth_headers():
+    """Fresh mock user per test so quotas and rate limits don't collide"""
+    return {
+        "Authorization": f"Bearer mock_storage_{uuid.uuid4().hex[:8]}",
+        "Content-Type": "application/json"
+    }
+
+
+def generate_document(headers):
+    response = requests.post(
+        f"{BASE_URL}/api/documents/generate",
+        json={"document_type": "affidavit", "data": {"deponent_name": "Test User"}},
+        headers=headers
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestSignedDownloads:
+    """Signed URL download tests - GET /api/storage/download"""
+
+    def test_download_returns_pdf(self):
+        """Test that a signed URL serves the generated PDF"""
+        data = generate_document(auth_headers())
+
+        response = requests.get(f"{BASE_URL}{data['download_url']}")
+
+        assert response.status_code == 200
+        assert response.content.startswith(b"%PDF")
+        print(f"Downloaded {len(response.content)} bytes")
+
+    def test_repeat_download_is_identical(self):
+        """Test that a second (cached) download returns the same bytes"""
+        data = generate_document(auth_headers())
+
+        first = requests.get(f"{BASE_URL}{data['download_url']}")
+        second = requests.get(f"{BASE_URL}{data['download_url']}")
+
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert first.content == second.content
+        print("Repeat download served identical bytes")
+
+    def test_invalid_token_rejected(self):
+        """Test that an unknown token is rejected"""
+        response = requests.get(f"{BASE_URL}/api/storage/download", params={"token": "not-a-token"})
+
+        assert response.status_code == 403
+        print("Invalid token rejected")
+
+
+class TestStorageQuota:
+    """Per-user quota tests - GET /api/storage/usage, 413 on upload"""
+
+    def test_usage_reports_quota(self):
+        """Test that a new user has the full quota available"""
+        response = requests.get(f"{BASE_URL}/api/storage/usage", headers=auth_headers())
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["used_bytes"] == 0
+        assert data["remaining_bytes"] == data["quota_bytes"]
+        print(f"Quota: {data['quota_bytes']} bytes")
+
+    def test_upload_over_quota_rejected(self):
+        """Test that uploads past the quota get 413 and nothing over quota is stored"""
+        headers = {"Authorization": f"Bearer mock_storage_{uuid.uuid4().hex[:8]}"}
+        application = requests.post(f"{BASE_URL}/api/lawyers/apply", json={
+            "name": "Adv. Quota Test", "bar_council_id": "DL/88888/2020",
+            "specialization": ["Civil Law"], "languages": ["English"], "city": "Delhi",
+            "state": "Delhi", "experience": 5, "price": 500, "bio": "Quota test",
+            "phone": "9999999999", "email": "quota_test@example.com"
+        }, headers=headers)
+        app_id = application.json()["application_id"]
+        quota = requests.get(f"{BASE_URL}/api/storage/usage", headers=headers).json()["quota_bytes"]
+
+        # 8 MB parts (under the per-file limit) until the quota runs out
+        part = b"%PDF-1.4\n" + b"0" * (8 * 1024 * 1024)
+        response = None
+        for _ in range(quota // len(part) + 2):
+            response = requests.post(
+                f"{BASE_URL}/api/lawyers/applications/{app_id}/upload-docs",
+                files={"file": ("bulk.pdf", part, "application/pdf")},
+                headers=headers
+            )
+            if response.status_code != 200:
+                break
+
+        assert response.status_code == 413
+        usage = requests.get(f"{BASE_URL}/api/storage/usage", headers=headers).json()
+        assert usage["used_bytes"] <= quota
+        print(f"Quota enforced at {usage['used_bytes']} of {quota} bytes")
+
+
+class TestStorageMetrics:
+    """Admin metrics tests - GET /api/admin/metrics"""
+
+    def test_metrics_requires_admin(self):
+        """Test that metrics are not exposed without the admin secret"""
+        response = requests.get(f"{BASE_URL}/api/admin/metrics")
+
+        assert response.status_code == 403
+        print("Metrics protected")
+
+    def test_metrics_report_cache_counters(self):
+        """Test that storage metrics include hot-tier cache counters"""
+        response = requests.get(
+            f"{BASE_URL}/api/admin/metrics",
+            headers={"X-Admin-Secret": ADMIN_SECRET}
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        cache = data["storage"]["memory_cache"]
+        for key in ("hits", "misses", "evictions", "hit_rate"):
+            assert key in cache
+        print(f"Storage cache hit rate: {cache['hit_rate']}")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
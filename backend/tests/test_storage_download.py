@@ -0,0 +1,120 @@
+"""
+In-process Tests for SunoLegal Signed Downloads
+Tests: GET /api/storage/download with each STORAGE_DOWNLOAD_OFFLOAD mode
+(x-accel-redirect, x-sendfile, sendfile, in-process) and files deleted after validation
+Uses the mock storage in a temporary directory; no server needed.
+"""
+import pytest
+import asyncio
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("LLM_BACKEND", "mock")
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp())
+os.environ.setdefault("PDF_RENDER_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+
+PDF = b"%PDF-1.4 offload test " + b"x" * 200_000
+PATH = "documents/mock_offload/offload.pdf"
+
+
+def download(url):
+    """Call the download endpoint in-process; returns (response, body)"""
+    async def fetch():
+        response = await server.storage_download(url.split("token=", 1)[1])
+        if hasattr(response, "body_iterator"):
+            body = b"".join([chunk async for chunk in response.body_iterator])
+        else:
+            body = response.body
+        if response.background:
+            await response.background()
+        return response, body
+    return asyncio.run(fetch())
+
+
+class TestDownloadOffload:
+    """Signed download tests - storage_download, STORAGE_DOWNLOAD_OFFLOAD"""
+
+    @pytest.fixture(autouse=True)
+    def stored_pdf(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(server, "storage", server.MockFirebaseStorage(root_dir=str(tmp_path)))
+        server.storage.upload_file(PATH, PDF, "mock_offload", {"content_type": "application/pdf"})
+        self.url = server.storage.sign_path(PATH)
+        self.disk_path = server.storage.get_file_info(PATH)["disk_path"]
+
+    def test_x_accel_redirect_hands_off_to_nginx(self, monkeypatch):
+        """Test that x-accel-redirect answers with the internal location and no body"""
+        monkeypatch.setattr(server, "STORAGE_DOWNLOAD_OFFLOAD", "x-accel-redirect")
+
+        response, body = download(self.url)
+
+        assert response.headers["X-Accel-Redirect"] == f"{server.STORAGE_ACCEL_REDIRECT_PREFIX}/{os.path.basename(self.disk_path)}"
+        assert response.headers["Content-Disposition"] == "attachment; filename=offload.pdf"
+        assert response.media_type == "application/pdf"
+        assert body == b""
+        print(f"X-Accel-Redirect: {response.headers['X-Accel-Redirect']}")
+
+    def test_x_sendfile_hands_off_absolute_path(self, monkeypatch):
+        """Test that x-sendfile answers with the absolute disk path and no body"""
+        monkeypatch.setattr(server, "STORAGE_DOWNLOAD_OFFLOAD", "x-sendfile")
+
+        response, body = download(self.url)
+
+        assert response.headers["X-Sendfile"] == os.path.abspath(self.disk_path)
+        assert response.headers["Content-Disposition"] == "attachment; filename=offload.pdf"
+        assert body == b""
+        print(f"X-Sendfile: {response.headers['X-Sendfile']}")
+
+    def test_sendfile_streams_from_disk(self, monkeypatch):
+        """Test that sendfile streams the file with its length and skips the hot tier"""
+        monkeypatch.setattr(server, "STORAGE_DOWNLOAD_OFFLOAD", "sendfile")
+
+        response, body = download(self.url)
+
+        assert body == PDF
+        assert response.headers["Content-Length"] == str(len(PDF))
+        assert server.storage.get_stats()["memory_cache"]["entries"] == 0
+        print(f"Streamed {len(body)} bytes from disk")
+
+    def test_large_file_streams_without_offload(self, monkeypatch):
+        """Test that files over STORAGE_STREAM_MIN_BYTES stream from disk even with no offload mode"""
+        monkeypatch.setattr(server, "STORAGE_DOWNLOAD_OFFLOAD", "")
+        monkeypatch.setattr(server, "STORAGE_STREAM_MIN_BYTES", 1024)
+
+        response, body = download(self.url)
+
+        assert body == PDF
+        assert response.headers["Content-Length"] == str(len(PDF))
+        print("Large file streamed")
+
+    @pytest.mark.parametrize("offload", ["sendfile", ""])
+    def test_file_deleted_after_lookup_is_404(self, offload, monkeypatch):
+        """Test that a file removed from disk after the token check is a 404, not a 500"""
+        monkeypatch.setattr(server, "STORAGE_DOWNLOAD_OFFLOAD", offload)
+        os.remove(self.disk_path)
+
+        with pytest.raises(HTTPException) as error:
+            download(self.url)
+
+        assert error.value.status_code == 404
+        print(f"Deleted file ({offload or 'in-process'}): {error.value.detail}")
+
+    def test_file_deleted_after_open_still_streams(self, monkeypatch):
+        """Test that a download already opened completes even if the file is then deleted"""
+        monkeypatch.setattr(server, "STORAGE_DOWNLOAD_OFFLOAD", "sendfile")
+
+        async def fetch():
+            response = await server.storage_download(self.url.split("token=", 1)[1])
+            os.remove(self.disk_path)
+            return b"".join([chunk async for chunk in response.body_iterator])
+
+        assert asyncio.run(fetch()) == PDF
+        print("Open download survived deletion")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])